@@ -1,19 +1,43 @@
-import openai
+import re
+import json
+import time
+import hashlib
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait
+from storage import state_db_path, transaction, query
 from utils import log_message
+import metrics
 
-# Placeholder function - **MUST** be replaced with actual OpenAI API calls
-def generate_metadata_with_ai(video_topic_or_caption, env):
-    """
-    Generates YouTube title, description, and tags using AI based on content.
-    For a real implementation, use the openai.Completion.create or 
-    openai.ChatCompletion.create method with the provided API key.
-    """
-    log_message("INFO", f"Generating metadata for topic: '{video_topic_or_caption[:50]}...'")
-    
-    openai.api_key = env['OPENAI_API_KEY']
-    
+# Bump whenever the prompt or the output format changes, so cached results are regenerated
+PROMPT_VERSION = 'v1'
+
+# --- Configuration Defaults (override in .env) ---
+DEFAULT_BACKEND = 'template'    # METADATA_BACKEND: template | openai | mock (offline, fixed latency)
+DEFAULT_MOCK_LATENCY = 0.5      # METADATA_MOCK_LATENCY: seconds per mock request
+DEFAULT_MODEL = 'gpt-4o-mini'   # OPENAI_MODEL
+DEFAULT_WORKERS = 8             # METADATA_WORKERS: concurrent AI requests per batch
+DEFAULT_TIMEOUT = 20            # METADATA_TIMEOUT: seconds per request before falling back to the template
+
+SYSTEM_PROMPT = (
+    "You write metadata for YouTube Shorts about surprising facts. "
+    "Reply with a JSON object with keys: title (under 90 characters), description "
+    "(2-3 short lines ending with a call to subscribe), tags (comma-separated), "
+    "hashtags (space-separated, must include #shorts)."
+)
+
+# Counters of each channel's last batch, keyed by CHANNEL_NAME (see generate_metadata_batch);
+# channels' metadata stages run at the same time
+LAST_BATCH_STATS = {}
+_STATS_LOCK = threading.Lock()
+
+# --- Template Logic (fallback) ---
+
+def _template_metadata(video_topic_or_caption):
+    """Builds title, description and tags from fixed templates (no API call)."""
     # Simple placeholder logic based on the prompt's requirements
     topic = video_topic_or_caption.replace('\n', ' ')
+    first_word = topic.split()[0] if topic.split() else 'facts'
     
     if "science" in topic.lower():
         title_base = "🤯 Scientific Fact That Will Blow Your Mind"
@@ -26,7 +50,7 @@ def generate_metadata_with_ai(video_topic_or_caption, env):
         
     
     # 1. Generate Title (under 100 characters)
-    title = f"{title_base} #{topic.split()[0]}".replace('..', '.')[:95]
+    title = f"{title_base} #{first_word}".replace('..', '.')[:95]
     
     # 2. Generate Description (with CTA)
     description = (
@@ -36,8 +60,8 @@ def generate_metadata_with_ai(video_topic_or_caption, env):
     )
     
     # 3. Generate Tags & Hashtags
-    hashtags = f"#shorts #facts #{topic.split()[0].lower()} #viral"
-    tags = tags_base.split(',') + [topic.split()[0].lower()]
+    hashtags = f"#shorts #facts #{first_word.lower()} #viral"
+    tags = tags_base.split(',') + [first_word.lower()]
 
     return {
         "title": title,
@@ -45,3 +69,196 @@ def generate_metadata_with_ai(video_topic_or_caption, env):
         "tags": ','.join(tags),
         "hashtags": hashtags
     }
+
+# --- AI Clients ---
+
+class OpenAIMetadataClient:
+    """Generates metadata with the OpenAI chat completions API."""
+
+    def __init__(self, env):
+        import openai
+
+        self.model = env.get('OPENAI_MODEL') or DEFAULT_MODEL
+        self.client = openai.OpenAI(
+            api_key=env['OPENAI_API_KEY'],
+            timeout=float(env.get('METADATA_TIMEOUT') or DEFAULT_TIMEOUT),
+            max_retries=1,
+        )
+
+    def complete(self, caption):
+        response = self.client.chat.completions.create(
+            model=self.model,
+            response_format={"type": "json_object"},
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": caption[:2000] or "A surprising fact"},
+            ],
+        )
+        data = json.loads(response.choices[0].message.content)
+        tags = data.get('tags', '')
+        return {
+            "title": str(data['title'])[:95],
+            "description": str(data['description']),
+            "tags": ','.join(tags) if isinstance(tags, list) else str(tags),
+            "hashtags": str(data.get('hashtags') or '#shorts'),
+        }
+
+class MockMetadataClient:
+    """Offline stand-in with a fixed latency, for benchmarks and tests."""
+
+    def __init__(self, latency=0.5, fail_every=0):
+        self.latency = latency
+        self.fail_every = fail_every
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def complete(self, caption):
+        with self.lock:
+            self.calls += 1
+            call_number = self.calls
+        time.sleep(self.latency)
+        if self.fail_every and call_number % self.fail_every == 0:
+            raise RuntimeError("mock metadata failure")
+        metadata = _template_metadata(caption)
+        metadata['title'] = f"[mock] {metadata['title']}"[:95]
+        return metadata
+
+def _default_client(env):
+    backend = (env.get('METADATA_BACKEND') or DEFAULT_BACKEND).strip().lower()
+    if backend == 'openai':
+        return OpenAIMetadataClient(env)
+    if backend == 'mock':
+        return MockMetadataClient(float(env.get('METADATA_MOCK_LATENCY') or DEFAULT_MOCK_LATENCY))
+    return None
+
+# --- Persistent Cache ---
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS metadata_cache (
+        cache_key TEXT PRIMARY KEY,
+        metadata TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    )""",
+)
+
+_READY = set()
+
+def _db(env=None):
+    path = state_db_path(env)
+    if path not in _READY:
+        with transaction(path) as conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+        _READY.add(path)
+    return path
+
+def _normalize(caption):
+    return re.sub(r'\s+', ' ', (caption or '').strip().lower())
+
+def cache_key(caption, backend):
+    """Hash of the normalized caption plus the prompt version and backend."""
+    payload = f"{PROMPT_VERSION}\0{backend}\0{_normalize(caption)}"
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _cache_get_many(keys, env):
+    found = {}
+    keys = list(keys)
+    # Stay well under SQLite's bound-parameter limit
+    for start in range(0, len(keys), 500):
+        chunk = keys[start:start + 500]
+        placeholders = ','.join('?' * len(chunk))
+        rows = query(_db(env), f"SELECT cache_key, metadata FROM metadata_cache WHERE cache_key IN ({placeholders})", chunk)
+        found.update({row['cache_key']: json.loads(row['metadata']) for row in rows})
+    return found
+
+def _cache_put_many(entries, env):
+    if not entries:
+        return
+    now = datetime.now().isoformat()
+    with transaction(_db(env)) as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO metadata_cache (cache_key, metadata, created_at) VALUES (?, ?, ?)",
+            [(key, json.dumps(metadata), now) for key, metadata in entries.items()],
+        )
+
+# --- Metadata Service ---
+
+def _timed_complete(client, backend, caption):
+    metrics.API_CALLS.inc(service='metadata', method=backend)
+    with metrics.STAGE_SECONDS.time(stage='metadata_request'):
+        return client.complete(caption)
+
+def generate_metadata_batch(captions, env, client=None):
+    """
+    Generates metadata for many captions at once.
+
+    Identical (normalized) captions are generated once, cached results are
+    reused, and the remaining captions are sent to the AI client concurrently
+    (METADATA_WORKERS). Requests that fail or exceed METADATA_TIMEOUT fall back
+    to the template logic and are not cached. Returns one dict per caption.
+    """
+    captions = list(captions)
+    client = client or _default_client(env)
+    if not client:
+        # Template backend: no API cost, nothing worth caching
+        return [_template_metadata(caption) for caption in captions]
+
+    backend = type(client).__name__
+    keys = [cache_key(caption, backend) for caption in captions]
+    unique = dict(zip(keys, captions))
+
+    started = time.monotonic()
+    results = _cache_get_many(unique.keys(), env)
+    misses = {key: caption for key, caption in unique.items() if key not in results}
+    fallbacks = 0
+    generated = {}
+
+    if misses:
+        workers = max(1, int(env.get('METADATA_WORKERS') or DEFAULT_WORKERS))
+        timeout = float(env.get('METADATA_TIMEOUT') or DEFAULT_TIMEOUT)
+        pool = ThreadPoolExecutor(max_workers=min(workers, len(misses)))
+        futures = {pool.submit(_timed_complete, client, backend, caption): key for key, caption in misses.items()}
+        # Requests run `workers` at a time, so the whole batch gets one timeout per round
+        rounds = -(-len(futures) // workers)
+        wait(futures, timeout=timeout * rounds)
+        for future, key in futures.items():
+            try:
+                if not future.done():
+                    raise TimeoutError(f"no response within {timeout:.0f}s")
+                generated[key] = future.result()
+                metrics.ITEMS.inc(stage='metadata_request', outcome='ok')
+            except Exception as e:
+                log_message("WARN", f"AI metadata failed ({e}). Using template fallback.")
+                metrics.ITEMS.inc(stage='metadata_request', outcome='failed')
+                results[key] = _template_metadata(misses[key])
+                fallbacks += 1
+        pool.shutdown(wait=False, cancel_futures=True)
+        _cache_put_many(generated, env)
+        results.update(generated)
+
+    metrics.METADATA_CACHE.inc(len(unique) - len(misses), result='hit')
+    metrics.METADATA_CACHE.inc(len(misses), result='miss')
+    cache_hits, seconds = len(unique) - len(misses), time.monotonic() - started
+    with _STATS_LOCK:
+        LAST_BATCH_STATS[env.get('CHANNEL_NAME') or 'default'] = {
+            "captions": len(captions),
+            "unique": len(unique),
+            "cache_hits": cache_hits,
+            "generated": len(generated),
+            "fallbacks": fallbacks,
+            "seconds": seconds,
+        }
+    log_message(
+        "INFO",
+        f"Metadata batch: {len(captions)} captions, {cache_hits} cache hits, "
+        f"{len(generated)} generated, {fallbacks} fallbacks in {seconds:.1f}s."
+    )
+    return [results[key] for key in keys]
+
+def generate_metadata_with_ai(video_topic_or_caption, env):
+    """
+    Generates YouTube title, description, and tags using AI based on content.
+    Uses the cached metadata service; see generate_metadata_batch.
+    """
+    log_message("INFO", f"Generating metadata for topic: '{video_topic_or_caption[:50]}...'")
+    return generate_metadata_batch([video_topic_or_caption], env)[0]
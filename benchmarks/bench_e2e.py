@@ -0,0 +1,235 @@
+"""
+End-to-end offline benchmark of download -> dedupe -> encode -> metadata ->
+upload, run against the fake backends in fake_backends.py (no accounts, API
+keys or network needed).
+
+--accounts x --reels synthetic reels are generated once (reused when
+--catalog-dir is given). The fake Instagram client serves them, the mock
+metadata client answers with a fixed latency, and uploads go to a local
+endpoint that speaks the resumable protocol. The run drives
+Channel.download_and_process() and then Channel.upload() until the ready
+queue is empty. It reports reels/hour, per-stage latency percentiles (p50,
+p95, p99 from metrics.STAGE_SECONDS) and the peak memory of this process and
+of the whole process tree, encode workers and ffmpeg included.
+
+--save writes the results as JSON. --baseline compares the run against saved
+results. The exit code is 1 when reels/hour drops, or when a stage's p95 or
+the peak memory grows, by more than --tolerance.
+
+Usage:
+    python benchmarks/bench_e2e.py --accounts 3 --reels 10 --workers 2
+    python benchmarks/bench_e2e.py --reels 20 --size 1080x1920 --upload-mbps 5 --save baseline.json
+    python benchmarks/bench_e2e.py --reels 20 --size 1080x1920 --upload-mbps 5 --baseline baseline.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from synthetic import bench_env
+
+STAGES = ('fetch', 'download', 'dedupe', 'encode', 'metadata', 'upload')
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class MemorySampler:
+    """Samples the RSS of this process and of its whole process tree from a background thread."""
+
+    def __init__(self, interval=0.2):
+        self.interval = interval
+        self.peak_self = self.peak_tree = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='memory-sampler', daemon=True)
+
+    def _run(self):
+        import editor
+
+        pid = os.getpid()
+        while not self.stopped.is_set():
+            own = editor._rss_bytes([pid])
+            self.peak_self = max(self.peak_self, own)
+            self.peak_tree = max(self.peak_tree, own + editor._rss_bytes(editor._descendants(pid)))
+            self.stopped.wait(self.interval)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+
+
+def run(args, work_dir, catalog_dir):
+    """One benchmark run; returns the results dict."""
+    import fake_backends
+    import jobs
+    import metrics
+    from channels import Channel, UPLOADED
+
+    width, height = map(int, args.size.lower().split('x'))
+    accounts = [f"fake_account_{i}" for i in range(args.accounts)]
+    started = time.perf_counter()
+    reels = fake_backends.build_catalog(catalog_dir, accounts, args.reels, (width, height), args.duration)
+    print(f"Catalog: {reels} reels of {args.size}, {args.duration:g}s ready in {time.perf_counter() - started:.1f}s")
+
+    server = fake_backends.start_upload_server(mbps=args.upload_mbps, fail_every=args.upload_fail_every)
+    env = bench_env(
+        work_dir,
+        CHANNEL_NAME='bench',
+        STATE_DB=os.path.join(work_dir, 'state.db'),
+        SEGMENT_CACHE_DIR=os.path.join(work_dir, 'segments'),
+        INSTAGRAM_BACKEND='fake',
+        INSTAGRAM_USERNAME='bench',
+        INSTAGRAM_SOURCE_ACCOUNTS=','.join(accounts),
+        INSTAGRAM_REQUESTS_PER_SECOND=str(args.rate),
+        INSTAGRAM_SESSION_PATH=os.path.join(work_dir, 'instagram_session.json'),
+        INSTAGRAM_USER_ID_CACHE=os.path.join(work_dir, 'instagram_user_ids.json'),
+        FAKE_CATALOG_DIR=catalog_dir,
+        FAKE_API_LATENCY=str(args.api_latency),
+        FAKE_DOWNLOAD_MBPS=str(args.download_mbps),
+        FETCH_WORKERS=str(args.fetch_workers),
+        PROCESS_WORKERS=str(args.workers),
+        VIDEO_ENGINE=args.engine,
+        ENCODE_PROFILE=args.profile,
+        METADATA_BACKEND='mock',
+        METADATA_MOCK_LATENCY=str(args.metadata_latency),
+        YOUTUBE_BACKEND='fake',
+        YOUTUBE_API_ENDPOINT=server.url,
+        YT_TOKEN_PATH=os.path.join(work_dir, 'token.json'),
+        UPLOAD_SESSIONS_PATH=os.path.join(work_dir, 'upload_sessions.json'),
+        UPLOAD_CHUNK_MB=str(args.chunk_mb),
+        # Every reel is uploaded in this one run
+        MAX_DAILY=str(reels),
+        YT_DAILY_QUOTA=str(reels * 1600 + 1600),
+        METRICS_PORT='0',
+    )
+    channel = Channel('bench', env)
+
+    with MemorySampler() as memory:
+        started = time.perf_counter()
+        channel.download_and_process()
+        pipeline_seconds = time.perf_counter() - started
+
+        # The slot only sets publishAt; uploads run back to back
+        slot = (datetime.now() + timedelta(hours=1)).strftime('%H:%M')
+        uploaded = 0
+        started = time.perf_counter()
+        while jobs.state_counts(env).get(jobs.METADATA_READY):
+            if channel.upload(slot) != UPLOADED:
+                break
+            uploaded += 1
+        upload_seconds = time.perf_counter() - started
+    server.shutdown()
+
+    counts = jobs.state_counts(env)
+    stages = {}
+    for stage in STAGES:
+        count, seconds = metrics.STAGE_SECONDS.summary(stage=stage)
+        if count:
+            p50, p95, p99 = metrics.STAGE_SECONDS.quantiles(QUANTILES, stage=stage)
+            stages[stage] = {"count": count, "mean": seconds / count, "p50": p50, "p95": p95, "p99": p99}
+    total_seconds = pipeline_seconds + upload_seconds
+    return {
+        "config": {
+            key: getattr(args, key) for key in (
+                'accounts', 'reels', 'workers', 'fetch_workers', 'size', 'duration', 'engine', 'profile',
+                'api_latency', 'metadata_latency', 'download_mbps', 'upload_mbps', 'chunk_mb',
+            )
+        },
+        "reels": reels,
+        "uploaded": uploaded,
+        "failed": counts.get(jobs.FAILED, 0),
+        "pipeline_seconds": pipeline_seconds,
+        "upload_seconds": upload_seconds,
+        "reels_per_hour": uploaded * 3600 / total_seconds if total_seconds else 0.0,
+        "pipeline_reels_per_hour": (reels - counts.get(jobs.FAILED, 0)) * 3600 / pipeline_seconds if pipeline_seconds else 0.0,
+        "upload_reels_per_hour": uploaded * 3600 / upload_seconds if upload_seconds else 0.0,
+        "stages": stages,
+        "peak_rss_mb": memory.peak_self / 1048576,
+        "peak_tree_rss_mb": memory.peak_tree / 1048576,
+    }
+
+
+def report(results):
+    print(
+        f"\n{results['uploaded']}/{results['reels']} reels uploaded, {results['failed']} failed\n"
+        f"Pipeline {results['pipeline_seconds']:.1f}s ({results['pipeline_reels_per_hour']:.0f} reels/hour), "
+        f"uploads {results['upload_seconds']:.1f}s ({results['upload_reels_per_hour']:.0f} reels/hour)\n"
+        f"End to end: {results['reels_per_hour']:.0f} reels/hour\n"
+        f"Peak RSS: {results['peak_rss_mb']:.0f} MB this process, {results['peak_tree_rss_mb']:.0f} MB with workers\n"
+    )
+    print(f"{'stage':<10}{'count':>7}{'mean s':>9}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}")
+    for stage, row in results['stages'].items():
+        print(f"{stage:<10}{row['count']:>7g}{row['mean']:>9.3f}{row['p50']:>9.3f}{row['p95']:>9.3f}{row['p99']:>9.3f}")
+
+
+def regressions(results, baseline, tolerance):
+    """Descriptions of every metric that is worse than the baseline by more than `tolerance`."""
+    found = []
+    if results['reels_per_hour'] < baseline['reels_per_hour'] * (1 - tolerance):
+        found.append(f"reels/hour {results['reels_per_hour']:.0f} < baseline {baseline['reels_per_hour']:.0f}")
+    for stage, row in results['stages'].items():
+        before = baseline['stages'].get(stage)
+        if before and row['p95'] > before['p95'] * (1 + tolerance):
+            found.append(f"{stage} p95 {row['p95']:.3f}s > baseline {before['p95']:.3f}s")
+    if results['peak_tree_rss_mb'] > baseline['peak_tree_rss_mb'] * (1 + tolerance):
+        found.append(f"peak RSS {results['peak_tree_rss_mb']:.0f} MB > baseline {baseline['peak_tree_rss_mb']:.0f} MB")
+    if baseline['config'] != results['config']:
+        print("Note: the baseline was recorded with different settings.")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--accounts', type=int, default=3, help='fake source accounts')
+    parser.add_argument('--reels', type=int, default=10, help='reels per account')
+    parser.add_argument('--workers', type=int, default=2, help='encode workers (PROCESS_WORKERS)')
+    parser.add_argument('--fetch-workers', type=int, default=4, help='accounts fetched at once (FETCH_WORKERS)')
+    parser.add_argument('--size', default='720x1280')
+    parser.add_argument('--duration', type=float, default=5, help='seconds per reel')
+    parser.add_argument('--engine', default='ffmpeg', choices=('moviepy', 'ffmpeg'))
+    parser.add_argument('--profile', default='fast')
+    parser.add_argument('--rate', type=float, default=100, help='Instagram calls per second (global limiter)')
+    parser.add_argument('--api-latency', type=float, default=0.05, help='seconds per fake Instagram call')
+    parser.add_argument('--download-mbps', type=float, default=0, help='fake download speed, MB/s (0: disk speed)')
+    parser.add_argument('--metadata-latency', type=float, default=0.5, help='seconds per mock metadata request')
+    parser.add_argument('--upload-mbps', type=float, default=0, help='upload endpoint speed, MB/s (0: unlimited)')
+    parser.add_argument('--upload-fail-every', type=int, default=0, help='answer every Nth upload chunk with a 503')
+    parser.add_argument('--chunk-mb', type=float, default=8, help='upload chunk size (UPLOAD_CHUNK_MB)')
+    parser.add_argument('--catalog-dir', help='keep the generated reels here and reuse them in later runs')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='results JSON of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression')
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='bench-e2e-') as work_dir:
+        catalog_dir = os.path.abspath(args.catalog_dir) if args.catalog_dir else os.path.join(work_dir, 'catalog')
+        # Anything still using a relative default path stays inside the scratch directory
+        os.chdir(work_dir)
+        try:
+            results = run(args, work_dir, catalog_dir)
+        finally:
+            os.chdir(cwd)
+
+    report(results)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.save}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        if found:
+            print("FAIL: " + ', '.join(found))
+            sys.exit(1)
+        print("OK: within tolerance of the baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Compares the moviepy and ffmpeg engines of editor.process_video.
+
+Synthetic clips (plus an intro and outro at a different resolution) are
+generated once, then every engine processes all clips in a fresh subprocess
+so wall time and peak RSS are measured independently.
+
+Usage:
+    python benchmarks/bench_engines.py --clips 3 --duration 10 --size 1080x1920
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from synthetic import make_clip, bench_env
+
+ENGINES = ('moviepy', 'ffmpeg')
+
+
+def run_one(engine, work_dir, clips):
+    """Child mode: processes `clips` with one engine and prints a JSON result line."""
+    import editor
+
+    env = bench_env(
+        work_dir,
+        VIDEO_ENGINE=engine,
+        PROCESS_DIR=os.path.join(work_dir, f'processed-{engine}'),
+        INTRO_VIDEO_PATH=os.path.join(work_dir, 'intro.mp4'),
+        OUTRO_VIDEO_PATH=os.path.join(work_dir, 'outro.mp4'),
+    )
+    started = time.perf_counter()
+    outputs = [editor.process_video(clip, env) for clip in clips]
+    elapsed = time.perf_counter() - started
+
+    print(json.dumps({
+        "engine": engine,
+        "wall_s": elapsed,
+        "failed": sum(1 for out in outputs if not out),
+        # ru_maxrss is in KiB on Linux; children covers the ffmpeg subprocesses
+        "python_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "ffmpeg_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clips', type=int, default=3)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--size', default='1080x1920')
+    parser.add_argument('--run-one', nargs='+', metavar=('ENGINE', 'WORK_DIR'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        engine, work_dir, *clips = args.run_one
+        run_one(engine, work_dir, clips)
+        return
+
+    width, height = map(int, args.size.lower().split('x'))
+    with tempfile.TemporaryDirectory(prefix='bench-engines-') as work_dir:
+        print(f"Generating {args.clips} synthetic {width}x{height} clips of {args.duration:.0f}s...")
+        make_clip(os.path.join(work_dir, 'intro.mp4'), 720, 1280, 2, fps=25, pattern='smptebars')
+        make_clip(os.path.join(work_dir, 'outro.mp4'), 720, 1280, 2, fps=25, audio=False, pattern='rgbtestsrc')
+        clips = [
+            make_clip(os.path.join(work_dir, f'clip_{i}.mp4'), width, height, args.duration)
+            for i in range(args.clips)
+        ]
+
+        results = []
+        for engine in ENGINES:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--run-one', engine, work_dir, *clips],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"\n{'engine':<10}{'wall (s)':>10}{'s/clip':>10}{'python RSS':>14}{'ffmpeg RSS':>14}{'failed':>8}")
+    for r in results:
+        print(
+            f"{r['engine']:<10}{r['wall_s']:>10.2f}{r['wall_s'] / args.clips:>10.2f}"
+            f"{r['python_rss_mb']:>11.0f} MB{r['ffmpeg_rss_mb']:>11.0f} MB{r['failed']:>8}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Measures throughput and cache hit rate of ai_metadata.generate_metadata_batch
+against the offline MockMetadataClient (no API key or network needed).
+
+A cold pass runs against an empty cache, then a warm pass repeats the same
+captions plus a share of new ones.
+
+Usage:
+    python benchmarks/bench_metadata.py --captions 200 --duplicates 0.3 --latency 0.5 --workers 8
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from synthetic import bench_env
+
+WORDS = "science space ocean brain history animal planet money sleep light sound memory".split()
+
+
+def make_captions(count, duplicate_share, seed=7):
+    """Returns `count` captions where roughly `duplicate_share` repeat an earlier caption (reposts)."""
+    rng = random.Random(seed)
+    captions = []
+    for i in range(count):
+        if captions and rng.random() < duplicate_share:
+            # Same caption with different spacing/case: should hit the normalized cache key
+            captions.append(rng.choice(captions).upper().replace(' ', '  '))
+        else:
+            captions.append(f"{rng.choice(WORDS)} fact number {i}: " + ' '.join(rng.choices(WORDS, k=12)))
+    return captions
+
+
+def run_pass(label, captions, env, client):
+    import ai_metadata
+
+    calls_before = client.calls
+    started = time.perf_counter()
+    ai_metadata.generate_metadata_batch(captions, env, client=client)
+    elapsed = time.perf_counter() - started
+    stats = dict(ai_metadata.LAST_BATCH_STATS[env.get('CHANNEL_NAME') or 'default'])
+    print(
+        f"{label:<6}{len(captions):>10}{stats['unique']:>9}{stats['cache_hits']:>8}"
+        f"{stats['cache_hits'] / max(1, stats['unique']):>10.0%}{client.calls - calls_before:>8}"
+        f"{stats['fallbacks']:>11}{elapsed:>10.2f}{len(captions) / elapsed:>12.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--captions', type=int, default=200)
+    parser.add_argument('--duplicates', type=float, default=0.3, help="share of repeated captions")
+    parser.add_argument('--new-share', type=float, default=0.2, help="share of new captions in the warm pass")
+    parser.add_argument('--latency', type=float, default=0.5, help="mock seconds per request")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--timeout', type=float, default=20)
+    parser.add_argument('--fail-every', type=int, default=0, help="make every Nth mock call fail")
+    args = parser.parse_args()
+
+    import ai_metadata
+
+    with tempfile.TemporaryDirectory(prefix='bench-metadata-') as work_dir:
+        env = bench_env(
+            work_dir,
+            STATE_DB=os.path.join(work_dir, 'state.db'),
+            METADATA_WORKERS=str(args.workers),
+            METADATA_TIMEOUT=str(args.timeout),
+        )
+        client = ai_metadata.MockMetadataClient(latency=args.latency, fail_every=args.fail_every)
+        captions = make_captions(args.captions, args.duplicates)
+        fresh = make_captions(int(args.captions * args.new_share), 0, seed=99)
+
+        print(f"{'pass':<6}{'captions':>10}{'unique':>9}{'hits':>8}{'hit rate':>10}{'calls':>8}"
+              f"{'fallbacks':>11}{'wall (s)':>10}{'captions/s':>12}")
+        run_pass('cold', captions, env, client)
+        run_pass('warm', captions + fresh, env, client)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Compares the encode profiles (encode_profiles.PROFILES) on this machine.
+
+Synthetic clips are generated once and processed with every profile by the
+ffmpeg engine (without intro/outro). For each profile it reports encode
+speed (frames/s), output size, bitrate and quality (SSIM and PSNR against a
+lossless encode of the same crop), to pick the throughput/quality trade-off
+for ENCODE_PROFILE.
+
+Usage:
+    python benchmarks/bench_profiles.py --clips 2 --duration 10 --size 1080x1920
+    python benchmarks/bench_profiles.py --profiles fast,shorts --threads 4
+"""
+import argparse
+import os
+import re
+import tempfile
+import time
+
+from synthetic import make_clip, bench_env
+
+
+def measure_quality(output_path, reference_path):
+    """Returns (ssim, psnr) of output_path against reference_path."""
+    import ffmpeg
+
+    results = []
+    for metric, pattern in (('ssim', r'All:([\d.]+)'), ('psnr', r'average:([\d.]+|inf)')):
+        _, stderr = (
+            ffmpeg
+            .filter([ffmpeg.input(output_path).video, ffmpeg.input(reference_path).video], metric)
+            .output('-', f='null')
+            .run(capture_stderr=True)
+        )
+        match = re.findall(pattern, stderr.decode('utf-8', 'replace'))
+        results.append(float(match[-1]) if match else float('nan'))
+    return tuple(results)
+
+
+def run_profile(name, clips, work_dir, threads, frames_per_clip, label=None, **overrides):
+    """Processes every clip with one profile and returns its measurements."""
+    import editor
+
+    env = bench_env(
+        work_dir,
+        VIDEO_ENGINE='ffmpeg',
+        ENCODE_PROFILE=name,
+        PROCESS_DIR=os.path.join(work_dir, f'processed-{label or name}'),
+        **overrides,
+    )
+    started = time.perf_counter()
+    outputs = [editor.process_video(clip, env, threads=threads) for clip in clips]
+    elapsed = time.perf_counter() - started
+    return {
+        "profile": name,
+        "wall_s": elapsed,
+        "fps": frames_per_clip * len(clips) / elapsed if elapsed else 0.0,
+        "outputs": outputs,
+        "bytes": sum(os.path.getsize(out) for out in outputs if out),
+        "failed": sum(1 for out in outputs if not out),
+    }
+
+
+def main():
+    from encode_profiles import PROFILES
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clips', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--size', default='1080x1920')
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--profiles', default=','.join(PROFILES), help='comma-separated profile names')
+    parser.add_argument('--threads', type=int, default=None, help='encoder threads (default: all cores)')
+    args = parser.parse_args()
+
+    width, height = map(int, args.size.lower().split('x'))
+    names = [name.strip() for name in args.profiles.split(',') if name.strip()]
+    frames_per_clip = int(args.duration * args.fps)
+    with tempfile.TemporaryDirectory(prefix='bench-profiles-') as work_dir:
+        print(f"Generating {args.clips} synthetic {width}x{height} clips of {args.duration:.0f}s...")
+        clips = [
+            make_clip(os.path.join(work_dir, f'clip_{i}.mp4'), width, height, args.duration, fps=args.fps)
+            for i in range(args.clips)
+        ]
+
+        # Lossless encode of the same edit: the quality reference for every profile
+        reference = run_profile(
+            'default', clips, work_dir, args.threads, frames_per_clip,
+            label='reference', ENCODE_PRESET='ultrafast', ENCODE_CRF='0',
+        )
+        results = []
+        for name in names:
+            print(f"Encoding with profile {name}...")
+            result = run_profile(name, clips, work_dir, args.threads, frames_per_clip)
+            scores = [
+                measure_quality(out, ref)
+                for out, ref in zip(result['outputs'], reference['outputs']) if out and ref
+            ]
+            result["ssim"] = sum(s for s, _ in scores) / len(scores) if scores else float('nan')
+            result["psnr"] = sum(p for _, p in scores) / len(scores) if scores else float('nan')
+            results.append(result)
+
+    total_seconds = args.duration * args.clips
+    print(f"\n{'profile':<14}{'fps':>8}{'s/clip':>9}{'size':>11}{'kbit/s':>9}{'SSIM':>8}{'PSNR':>8}{'failed':>8}")
+    for r in results:
+        print(
+            f"{r['profile']:<14}{r['fps']:>8.1f}{r['wall_s'] / args.clips:>9.2f}"
+            f"{r['bytes'] / 1048576:>8.1f} MB{r['bytes'] * 8 / 1000 / total_seconds:>9.0f}"
+            f"{r['ssim']:>8.4f}{r['psnr']:>8.2f}{r['failed']:>8}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Measures the cold-start cost of each cli.py subcommand.
+
+Every subcommand runs in a fresh interpreter (python -X importtime) inside a
+scratch directory with its own .env and empty state, so the numbers are the
+start-up overhead rather than real work: wall time of the whole command, the
+time spent importing modules, peak memory (max RSS) and the slowest imports.
+`import main` (the long-running entry point) is measured for comparison.
+
+Usage:
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --commands status,process-one --top 5
+"""
+import argparse
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from synthetic import ROOT_DIR
+
+CLI = os.path.join(ROOT_DIR, 'cli.py')
+
+# Name -> interpreter arguments (run in the scratch directory)
+COMMANDS = {
+    'help': [CLI, '--help'],
+    'status': [CLI, 'status'],
+    'ledger-inspect': [CLI, 'ledger', 'inspect'],
+    'enqueue': [CLI, 'enqueue', 'clip.mp4', '--id', 'bench'],
+    'process-one': [CLI, 'process-one'],
+    'upload-one': [CLI, 'upload-one'],
+    'import-main': ['-c', f'import sys; sys.path.insert(0, {ROOT_DIR!r}); import main'],
+}
+
+BENCH_ENV = "LOG_DIR=logs\nMAX_DAILY=3\nMETADATA_BACKEND=template\nMETRICS_PORT=0\n"
+
+_IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)')
+
+
+def run_once(args, work_dir):
+    """Runs one command; returns (wall_s, import_s, max_rss_mb, {module: cumulative_s}, exit_code)."""
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, '-X', 'importtime', *args], cwd=work_dir,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    stderr = proc.stderr.read().decode('utf-8', 'replace')
+    # wait4 instead of wait(): it also returns this child's resource usage
+    _, status, usage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - started
+    proc.returncode = os.waitstatus_to_exitcode(status)
+
+    top_level = {}
+    for line in stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        # Top-level imports have a single space of indentation; their cumulative times add up
+        if match and len(match.group(3)) == 1:
+            top_level[match.group(4)] = int(match.group(2)) / 1e6
+    return wall, sum(top_level.values()), usage.ru_maxrss / 1024, top_level, proc.returncode
+
+
+def reset_scratch(work_dir):
+    """Fresh .env, state and a placeholder clip, so every run starts cold."""
+    for name in os.listdir(work_dir):
+        path = os.path.join(work_dir, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+    with open(os.path.join(work_dir, '.env'), 'w') as f:
+        f.write(BENCH_ENV)
+    with open(os.path.join(work_dir, 'clip.mp4'), 'wb') as f:
+        f.write(b'\0' * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3, help='runs per command (the median is reported)')
+    parser.add_argument('--commands', default=','.join(COMMANDS), help='comma-separated command names')
+    parser.add_argument('--top', type=int, default=3, help='slowest top-level imports to list per command')
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.commands.split(',') if name.strip()]
+    results = []
+    with tempfile.TemporaryDirectory(prefix='bench-startup-') as work_dir:
+        for name in names:
+            runs = []
+            for _ in range(args.runs):
+                reset_scratch(work_dir)
+                runs.append(run_once(COMMANDS[name], work_dir))
+            walls = [run[0] for run in runs]
+            median_run = runs[walls.index(statistics.median_low(walls))]
+            results.append((name, median_run))
+
+    print(f"\n{'command':<16}{'wall s':>8}{'import s':>10}{'RSS MB':>9}{'exit':>6}  slowest imports")
+    for name, (wall, imports, rss, modules, code) in results:
+        slowest = sorted(modules.items(), key=lambda item: item[1], reverse=True)[:args.top]
+        print(
+            f"{name:<16}{wall:>8.2f}{imports:>10.2f}{rss:>9.0f}{code:>6}  "
+            + ', '.join(f"{module} {seconds:.2f}s" for module, seconds in slowest)
+        )
+
+
+if __name__ == '__main__':
+    main()
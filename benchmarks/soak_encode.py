@@ -0,0 +1,125 @@
+"""
+Soak test for memory drift: hundreds of synthetic encodes in one process.
+
+Each encode runs editor.process_video directly in this process (the case
+where unclosed readers used to pile up), with intro/outro so all three
+readers are opened. After every encode it samples this process's RSS and
+the number of child processes still alive. After the warm-up it fits a line
+through the RSS samples and fails (exit code 1) when memory grows faster
+than --max-growth MB per 100 encodes or when ffmpeg processes are left over.
+
+Usage:
+    python benchmarks/soak_encode.py --encodes 300
+    python benchmarks/soak_encode.py --engine ffmpeg --encodes 500 --size 720x1280
+"""
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+
+from synthetic import make_clip, bench_env
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+def rss_mb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * PAGE_SIZE / 1048576
+
+
+def live_children():
+    """Child processes of this process that are still running (zombies excluded)."""
+    import editor
+
+    alive = []
+    for pid in editor._descendants(os.getpid()):
+        try:
+            with open(f'/proc/{pid}/stat') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        if stat[stat.rindex(')') + 2] != 'Z':
+            alive.append(pid)
+    return alive
+
+
+def slope_per_100(samples):
+    """Least-squares RSS growth in MB per 100 encodes."""
+    n = len(samples)
+    if n < 2:
+        return 0.0
+    mean_x, mean_y = (n - 1) / 2, sum(samples) / n
+    covariance = sum((x - mean_x) * (y - mean_y) for x, y in enumerate(samples))
+    variance = sum((x - mean_x) ** 2 for x in range(n))
+    return covariance / variance * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--encodes', type=int, default=300)
+    parser.add_argument('--warmup', type=int, default=20, help='encodes excluded from the fit (caches, allocator)')
+    parser.add_argument('--engine', default='moviepy', choices=('moviepy', 'ffmpeg'))
+    parser.add_argument('--profile', default='fast')
+    parser.add_argument('--duration', type=float, default=2)
+    parser.add_argument('--size', default='360x640')
+    parser.add_argument('--no-bumpers', action='store_true', help='encode the main clip only')
+    parser.add_argument('--max-growth', type=float, default=10.0, help='allowed RSS growth, MB per 100 encodes')
+    args = parser.parse_args()
+
+    import editor
+
+    width, height = map(int, args.size.lower().split('x'))
+    with tempfile.TemporaryDirectory(prefix='soak-encode-') as work_dir:
+        clips = [
+            make_clip(os.path.join(work_dir, f'clip_{i}.mp4'), width, height, args.duration, pattern=pattern)
+            for i, pattern in enumerate(('testsrc2', 'smptebars', 'mandelbrot'))
+        ]
+        overrides = {}
+        if not args.no_bumpers:
+            overrides['INTRO_VIDEO_PATH'] = make_clip(os.path.join(work_dir, 'intro.mp4'), width, height, 1)
+            overrides['OUTRO_VIDEO_PATH'] = make_clip(os.path.join(work_dir, 'outro.mp4'), width, height, 1, pattern='rgbtestsrc')
+        env = bench_env(
+            work_dir, VIDEO_ENGINE=args.engine, ENCODE_PROFILE=args.profile, TRANSFORM_POLICY='full',
+            SEGMENT_CACHE_DIR=os.path.join(work_dir, 'segments'), **overrides,
+        )
+
+        samples, failures, leaked = [], 0, 0
+        started = time.perf_counter()
+        for i in range(args.encodes):
+            output = editor.process_video(clips[i % len(clips)], env, threads=1)
+            if output:
+                os.remove(output)
+            else:
+                failures += 1
+            gc.collect()
+            samples.append(rss_mb())
+            leaked = max(leaked, len(live_children()))
+            if (i + 1) % 50 == 0:
+                print(f"{i + 1:>5} encodes  RSS {samples[-1]:7.1f} MB  live children {len(live_children())}")
+        elapsed = time.perf_counter() - started
+
+    measured = samples[args.warmup:]
+    growth = slope_per_100(measured)
+    print(
+        f"\n{args.encodes} encodes ({args.engine}, {args.profile}) in {elapsed:.0f}s, {failures} failed\n"
+        f"RSS after warm-up {measured[0] if measured else 0:.1f} MB, end {samples[-1] if samples else 0:.1f} MB, "
+        f"peak {max(samples, default=0):.1f} MB\n"
+        f"Growth {growth:+.2f} MB per 100 encodes (limit {args.max_growth:g}), most live children {leaked}"
+    )
+    problems = []
+    if growth > args.max_growth:
+        problems.append("memory drifts upward")
+    if live_children():
+        problems.append("reader/writer processes left running")
+    if failures:
+        problems.append(f"{failures} encodes failed")
+    if problems:
+        print("FAIL: " + ', '.join(problems))
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
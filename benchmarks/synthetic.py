@@ -0,0 +1,39 @@
+"""Helpers for generating synthetic test clips with ffmpeg's lavfi sources."""
+import os
+import sys
+
+# Make the project modules importable when running benchmarks/*.py directly
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+
+def make_clip(path, width=1080, height=1920, duration=10, fps=30, audio=True, pattern='testsrc2'):
+    """Writes an H.264/AAC test clip to `path` and returns the path."""
+    import ffmpeg
+
+    video = ffmpeg.input(f"{pattern}=size={width}x{height}:rate={fps}", f='lavfi', t=duration)
+    streams = [video]
+    if audio:
+        streams.append(ffmpeg.input("sine=frequency=440:sample_rate=44100", f='lavfi', t=duration))
+    (
+        ffmpeg
+        .output(*streams, path, vcodec='libx264', preset='ultrafast', pix_fmt='yuv420p', acodec='aac')
+        .overwrite_output()
+        .run(quiet=True)
+    )
+    return path
+
+
+def bench_env(work_dir, **overrides):
+    """Returns a minimal env dict that keeps every output inside `work_dir`."""
+    env = {
+        "DOWNLOAD_DIR": os.path.join(work_dir, 'downloads'),
+        "PROCESS_DIR": os.path.join(work_dir, 'processed'),
+        "LOG_DIR": os.path.join(work_dir, 'logs'),
+        "MAX_DAILY": '3',
+    }
+    env.update(overrides)
+    for key in ('DOWNLOAD_DIR', 'PROCESS_DIR', 'LOG_DIR'):
+        os.makedirs(env[key], exist_ok=True)
+    return env
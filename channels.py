@@ -0,0 +1,259 @@
+import os
+import re
+import json
+import random
+import threading
+import functools
+from datetime import date, datetime, timedelta
+from storage import state_db_path
+from utils import log_message
+from ledger import record_upload
+import jobs
+import lifecycle
+import quota
+import planner
+import metrics
+from scheduler import UPLOAD
+
+# --- Configuration Defaults (override in .env or per channel) ---
+DEFAULT_CHANNELS_CONFIG = 'channels.json'       # CHANNELS_CONFIG: without this file the .env is the only channel
+DEFAULT_UPLOAD_SLOTS = '06:00,12:00,17:00'      # UPLOAD_SLOTS: comma-separated HH:MM
+DEFAULT_DOWNLOAD_TIME = '01:00'                 # DOWNLOAD_TIME: daily download/processing run
+DEFAULT_UPLOAD_RETRY_MINUTES = 20              # UPLOAD_RETRY_MINUTES: first wait before a failed slot is retried (doubled each time)
+DEFAULT_UPLOAD_SLOT_RETRIES = 3                 # UPLOAD_SLOT_RETRIES: retries of one slot on the same day
+CHANNELS_ROOT = 'channels'                      # Per-channel state lives in channels/<name>/ by default
+DEFAULT_CHANNEL = 'default'
+
+# Outcomes of one upload cycle
+UPLOADED, SKIPPED, RETRY, NO_QUOTA = 'uploaded', 'skipped', 'retry', 'no_quota'
+
+# Settings that hold a channel's own state. A channel from channels.json that
+# doesn't set them gets its own copy under channels/<name>/, so channels never
+# share a ledger, job queue, token or working directory by accident.
+PER_CHANNEL_PATHS = {
+    'STATE_DB': 'state.db',
+    'DOWNLOAD_DIR': 'downloads',
+    'PROCESS_DIR': 'processed',
+    'YT_TOKEN_PATH': 'token.json',
+    'UPLOAD_SESSIONS_PATH': 'upload_sessions.json',
+}
+_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+
+# --- Config Loading ---
+
+def _channel_env(env, name, overrides):
+    """Base .env settings + the channel's overrides + its own state paths."""
+    channel_env = dict(env)
+    channel_env.update({key: str(value) for key, value in overrides.items()})
+    channel_env['CHANNEL_NAME'] = name
+    # API quota is per Google Cloud project, so it is counted in the main state.db for all channels
+    channel_env.setdefault('QUOTA_DB', state_db_path(env))
+    for key, filename in PER_CHANNEL_PATHS.items():
+        if key not in overrides:
+            channel_env[key] = os.path.join(CHANNELS_ROOT, name, filename)
+    # A different Instagram login needs its own saved session
+    if 'INSTAGRAM_USERNAME' in overrides and 'INSTAGRAM_SESSION_PATH' not in overrides:
+        channel_env['INSTAGRAM_SESSION_PATH'] = os.path.join(CHANNELS_ROOT, name, 'instagram_session.json')
+    return channel_env
+
+def load_channels(env):
+    """
+    Returns one Channel per entry in CHANNELS_CONFIG, e.g.
+
+        {"channels": [
+            {"name": "facts", "env": {"INSTAGRAM_SOURCE_ACCOUNTS": "a,b", "MAX_DAILY": 3}},
+            {"name": "money", "env": {"INSTAGRAM_SOURCE_ACCOUNTS": "c", "UPLOAD_SLOTS": "08:00,20:00"}}
+        ]}
+
+    Each "env" overrides any .env setting for that channel only. Without the
+    file, the .env itself is the single 'default' channel (state paths unchanged).
+    """
+    path = env.get('CHANNELS_CONFIG') or DEFAULT_CHANNELS_CONFIG
+    if not os.path.exists(path):
+        return [Channel(DEFAULT_CHANNEL, env)]
+
+    with open(path, 'r') as f:
+        config = json.load(f)
+    entries = config.get('channels', []) if isinstance(config, dict) else config
+    channels, names = [], set()
+    for entry in entries:
+        name = str(entry.get('name', ''))
+        if not _NAME_PATTERN.match(name):
+            raise ValueError(f"Invalid channel name {name!r} in {path} (letters, digits, '-' and '_' only).")
+        if name in names:
+            raise ValueError(f"Duplicate channel name {name!r} in {path}.")
+        names.add(name)
+        channels.append(Channel(name, _channel_env(env, name, entry.get('env', {}))))
+    if not channels:
+        raise ValueError(f"No channels configured in {path}.")
+    log_message("INFO", f"Loaded {len(channels)} channels from {path}: {', '.join(channel.name for channel in channels)}.")
+    return channels
+
+def calculate_scheduled_time(time_str):
+    """Calculates the next available time slot (now or in the future) in RFC 3339 format."""
+    now = datetime.now()
+    hour, minute = map(int, time_str.split(':'))
+
+    # Target time for today
+    target_time = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+
+    # If the target time is in the past, schedule for a few minutes from now
+    if target_time <= now + timedelta(minutes=5):
+        # Schedule it for 2 minutes from now to ensure a clean immediate upload
+        scheduled = now + timedelta(minutes=2)
+        log_message("WARN", f"Scheduled time {time_str} is in the past. Uploading immediately at {scheduled.strftime('%H:%M')}")
+    else:
+        scheduled = target_time
+
+    # Convert to RFC 3339 format (required by YouTube API)
+    return scheduled.isoformat("T") + "Z", scheduled.strftime("%I:%M %p")
+
+
+class Channel:
+    """One YouTube channel: its settings, daily upload count, pause flag and upload cycle."""
+
+    def __init__(self, name, env):
+        self.name = name
+        self.env = env
+        self.paused = False
+        # Set by main.setup_scheduler; used to move failed slots later in the day
+        self.scheduler = None
+        # Two upload jobs of one channel (slot + manual) never run at the same time
+        self.lock = threading.Lock()
+        for key in ('DOWNLOAD_DIR', 'PROCESS_DIR'):
+            os.makedirs(env[key], exist_ok=True)
+
+    @property
+    def max_daily(self):
+        return int(self.env['MAX_DAILY'])
+
+    @property
+    def upload_count_today(self):
+        """
+        Videos publishing today (see planner.scheduled_per_day): counted by publish
+        date, so a night batch of later days' videos doesn't use up today, and
+        read from the state database, so it survives restarts and resets at midnight.
+        """
+        today = date.today()
+        return planner.scheduled_per_day(self.env, today).get(today.isoformat(), 0)
+
+    @property
+    def upload_slots(self):
+        slots = self.env.get('UPLOAD_SLOTS') or DEFAULT_UPLOAD_SLOTS
+        return [slot.strip() for slot in slots.split(',') if slot.strip()]
+
+    @property
+    def download_time(self):
+        return (self.env.get('DOWNLOAD_TIME') or DEFAULT_DOWNLOAD_TIME).strip()
+
+    def log(self, level, message):
+        log_message(level, f"[{self.name}] {message}")
+
+    # --- Cycles ---
+
+    def download_and_process(self):
+        """Download new videos and process them (streaming pipeline, see pipeline.py)."""
+        from pipeline import run_pipeline
+
+        self.log("INFO", "--- Starting DAILY DOWNLOAD/PROCESSING ---")
+        run_pipeline(self.env)
+
+    def get_next_available_video(self):
+        """Dequeues the oldest processed video whose metadata is ready for upload."""
+        job = jobs.next_ready(self.env)
+        if not job:
+            return None, None, None
+
+        self.log("INFO", f"Found new processed video for upload: {job['processed_path']}")
+        return job['processed_path'], job['metadata'], job['insta_id']
+
+    def upload(self, scheduled_time_str, attempt=0):
+        """Upload one video at the specified time slot; a slot that didn't upload is retried later today."""
+        with self.lock:
+            outcome = self._upload(scheduled_time_str)
+        if outcome == RETRY:
+            minutes = float(self.env.get('UPLOAD_RETRY_MINUTES') or DEFAULT_UPLOAD_RETRY_MINUTES)
+            self._retry_later(scheduled_time_str, attempt, minutes * 60 * (2 ** attempt) * random.uniform(0.8, 1.2))
+        elif outcome == NO_QUOTA:
+            # Nothing to gain before the quota resets (midnight Pacific Time)
+            self._retry_later(scheduled_time_str, attempt, quota.seconds_until_reset() + random.uniform(60, 300))
+        return outcome
+
+    def _retry_later(self, scheduled_time_str, attempt, delay_seconds):
+        retries = int(self.env.get('UPLOAD_SLOT_RETRIES') or DEFAULT_UPLOAD_SLOT_RETRIES)
+        retry_at = datetime.now() + timedelta(seconds=delay_seconds)
+        if self.scheduler is None or attempt >= retries:
+            self.log("WARN", f"Slot {scheduled_time_str} gave up after {attempt + 1} attempts.")
+            return
+        if retry_at.date() != datetime.now().date():
+            self.log("WARN", f"Slot {scheduled_time_str} can't be retried today (next chance {retry_at.strftime('%a %H:%M')}).")
+            return
+        self.log("INFO", f"Slot {scheduled_time_str} moved to {retry_at.strftime('%H:%M')} (retry {attempt + 1}/{retries}).")
+        metrics.RETRIES.inc(stage='upload_slot', reason='slot_moved', channel=self.name)
+        self.scheduler.call_later(
+            delay_seconds, functools.partial(self.upload, scheduled_time_str, attempt + 1),
+            f"{self.name}:retry-upload-{scheduled_time_str}", executor=UPLOAD, tenant=self.name,
+        )
+
+    def _upload(self, scheduled_time_str):
+        from uploader import upload_video
+
+        if self.paused:
+            self.log("WARN", "Automation is paused. Skipping upload.")
+            return SKIPPED
+
+        self.log("INFO", f"--- Starting UPLOAD CYCLE for {scheduled_time_str} ---")
+
+        # Check if we've already hit the limit
+        if self.upload_count_today >= self.max_daily:
+            self.log("WARN", "Max daily uploads reached. Skipping.")
+            return SKIPPED
+
+        if not quota.can_afford('videos.insert', self.env):
+            report = quota.usage_report(self.env)
+            self.log("WARN", f"YouTube API quota too low for an upload ({report['used']}/{report['limit']} units). Skipping.")
+            return NO_QUOTA
+
+        video_path, metadata, insta_id = self.get_next_available_video()
+        if not (video_path and metadata):
+            # The pipeline may still be encoding; try again later
+            self.log("WARN", "No new unique video found in /processed/ folder to upload.")
+            return RETRY
+
+        # Calculate the actual scheduled time
+        scheduled_utc, readable_time = calculate_scheduled_time(scheduled_time_str)
+
+        # --- YouTube Upload ---
+        yt_url = upload_video(video_path, metadata, scheduled_utc, self.env)
+
+        if yt_url:
+            record_upload(insta_id, {
+                "filename": os.path.basename(video_path),
+                "timestamp": datetime.now().isoformat(),
+                "youtube_url": yt_url,
+                "scheduled_for": readable_time,
+                # Local slot time (calculate_scheduled_time only appends the Z)
+                "publish_at": scheduled_utc.rstrip('Z'),
+            }, self.env)
+            jobs.mark_uploaded(insta_id, self.env)
+            lifecycle.on_uploaded(insta_id, video_path, self.env)
+            self.log("SUCCESS", f"Upload {self.upload_count_today}/{self.max_daily} succeeded. URL: {yt_url}")
+            return UPLOADED
+
+        if not quota.can_afford('videos.insert', self.env):
+            # Ran out of quota (or the API said so): not the video's fault
+            self.log("ERROR", "Upload failed: YouTube API quota exhausted.")
+            return NO_QUOTA
+        self.log("ERROR", "Upload failed. Logging attempt.")
+        jobs.mark_failed(insta_id, "upload failed", self.env)
+        return RETRY
+
+    def status_line(self):
+        counts = jobs.state_counts(self.env)
+        return (
+            f"{self.name}: {self.upload_count_today}/{self.max_daily} today, "
+            f"{counts.get(jobs.METADATA_READY, 0)} ready, {counts.get(jobs.DOWNLOADED, 0)} waiting to encode, "
+            f"{f'{counts[jobs.PLANNED]} planned, ' if counts.get(jobs.PLANNED) else ''}"
+            f"quota {quota.used_today(self.env)}/{quota.daily_limit(self.env)}"
+            f"{' (paused)' if self.paused else ''}"
+        )
@@ -0,0 +1,216 @@
+"""
+Command line entry point for running the automation and one-off tasks.
+
+Every subcommand imports only what it needs: `status` and `ledger` read
+SQLite, `process-one` loads the encoders, `upload-one` the YouTube client,
+and only `run` starts the scheduler and the Telegram bot.
+
+Usage:
+    python cli.py run
+    python cli.py status [--channel NAME]
+    python cli.py enqueue VIDEO [--caption TEXT] [--channel NAME]
+    python cli.py process-one [--channel NAME]
+    python cli.py upload-one [--channel NAME]
+    python cli.py ledger inspect [--limit N] [--channel NAME]
+    python cli.py repair [--channel NAME]
+    python cli.py plan [--days N] [--dry-run | --no-upload] [--channel NAME]
+"""
+import os
+import sys
+import shutil
+import argparse
+from datetime import datetime
+from utils import load_env, log_message
+from channels import load_channels, UPLOADED, SKIPPED, NO_QUOTA
+import jobs
+
+
+def _channels(env, name=None):
+    """The channels a command applies to: the named one, or all of them."""
+    channels = [channel for channel in load_channels(env) if name in (None, channel.name)]
+    if not channels:
+        sys.exit(f"Unknown channel: {name}")
+    return channels
+
+def _channel(env, name=None):
+    """The single channel a command works on (--channel is needed with several)."""
+    channels = _channels(env, name)
+    if len(channels) > 1:
+        sys.exit(f"Several channels configured; pick one with --channel ({', '.join(c.name for c in channels)}).")
+    return channels[0]
+
+# --- Subcommands ---
+
+def cmd_run(env, args):
+    import asyncio
+    import main
+
+    log_message("INFO", "Starting YouTube Shorts Automation System...")
+    asyncio.run(main.run_automation())
+
+def cmd_status(env, args):
+    import quota
+    import lifecycle
+
+    for channel in _channels(env, args.channel):
+        print(channel.status_line())
+        counts = jobs.state_counts(channel.env)
+        if counts:
+            print("  jobs: " + ', '.join(f"{state} {count}" for state, count in sorted(counts.items())))
+        calls = quota.usage_report(channel.env)['calls']
+        if calls:
+            print("  API calls today: " + ', '.join(f"{method} {count}" for method, count in sorted(calls.items())))
+        disk = lifecycle.disk_report(channel.env)
+        if disk:
+            print("  disk: " + ', '.join(
+                f"{kind} {usage['files']} files / {usage['bytes'] / 1048576:.0f} MB" for kind, usage in sorted(disk.items())
+            ))
+
+def cmd_enqueue(env, args):
+    """Adds a local video as a downloaded job, so the next run (or process-one) encodes it."""
+    import lifecycle
+
+    channel = _channel(env, args.channel)
+    if not os.path.isfile(args.video):
+        sys.exit(f"No such file: {args.video}")
+    name = os.path.basename(args.video)
+    insta_id = args.id or f"local-{os.path.splitext(name)[0]}"
+    if jobs.job_exists(insta_id, channel.env):
+        sys.exit(f"Job {insta_id} already exists.")
+    # Copied, because the raw download is deleted once it has been processed
+    download_path = os.path.join(channel.env['DOWNLOAD_DIR'], name)
+    if os.path.abspath(download_path) != os.path.abspath(args.video):
+        shutil.copy2(args.video, download_path)
+    jobs.add_downloaded({
+        "insta_id": insta_id,
+        "source_account": 'local',
+        "caption": args.caption or '',
+        "file_path": download_path,
+    }, channel.env)
+    lifecycle.on_downloaded(insta_id, download_path, channel.env)
+    channel.log("INFO", f"Enqueued {download_path} as job {insta_id}.")
+
+def cmd_process_one(env, args):
+    """Encodes the oldest downloaded job and generates its metadata (or finishes one that only lacks metadata)."""
+    import lifecycle
+    from editor import run_process_job, get_pool_settings
+    from ai_metadata import generate_metadata_batch
+
+    channel = _channel(env, args.channel)
+    job = next(iter(jobs.jobs_in_state(jobs.DOWNLOADED, channel.env)), None)
+    if job:
+        _, threads, timeout = get_pool_settings(channel.env)
+        processed_path = run_process_job(job['download_path'], channel.env, threads, timeout)
+        if not processed_path:
+            jobs.mark_failed(job['insta_id'], "processing failed", channel.env)
+            sys.exit(f"Processing failed for {job['download_path']}.")
+        jobs.mark_processed(job['insta_id'], processed_path, channel.env)
+        lifecycle.on_processed(job['insta_id'], job['download_path'], processed_path, channel.env)
+    else:
+        job = next(iter(jobs.jobs_in_state(jobs.PROCESSED, channel.env)), None)
+        if not job:
+            print("Nothing to process.")
+            return
+
+    try:
+        metadata = generate_metadata_batch([job['caption'] or ''], channel.env)[0]
+    except Exception as e:
+        jobs.mark_failed(job['insta_id'], e, channel.env)
+        sys.exit(f"AI metadata generation failed: {e}")
+    jobs.set_metadata(job['insta_id'], metadata, channel.env)
+    print(f"{job['insta_id']} ready for upload: {metadata['title']}")
+
+def cmd_upload_one(env, args):
+    """Uploads the next ready video now (scheduled a few minutes ahead), within MAX_DAILY and the quota."""
+    channel = _channel(env, args.channel)
+    # Not Channel.upload: a one-off upload has no slot to retry later
+    with channel.lock:
+        outcome = channel._upload(datetime.now().strftime("%H:%M"))
+    print({
+        UPLOADED: "Uploaded.",
+        SKIPPED: "Skipped: the channel is paused or MAX_DAILY is reached.",
+        NO_QUOTA: "Not enough YouTube API quota left today.",
+    }.get(outcome, "Nothing uploaded: no video is ready, or the upload failed (see the log)."))
+
+def cmd_ledger_inspect(env, args):
+    import ledger
+
+    for channel in _channels(env, args.channel):
+        uploads = list(ledger.all_uploads(channel.env).items())
+        print(f"{channel.name}: {len(uploads)} uploads recorded")
+        for insta_id, entry in uploads[-args.limit:] if args.limit else uploads:
+            print(f"  {entry.get('timestamp', '?')[:16]}  {insta_id}  {entry.get('youtube_url', '')}  {entry.get('filename', '')}")
+
+def cmd_plan(env, args):
+    """Assigns the ready backlog to the next days' slots and uploads it with publishAt (UPLOAD_MODE=plan's daily job)."""
+    import planner
+
+    channel = _channel(env, args.channel)
+    if args.dry_run:
+        for insta_id, at in planner.build_plan(channel, args.days, dry_run=True):
+            print(f"{at.strftime('%a %Y-%m-%d %H:%M')}  {insta_id}")
+        return
+    with channel.lock:
+        planner.build_plan(channel, args.days)
+    for entry in planner.planned(channel.env):
+        print(f"{entry['publish_at'][:16].replace('T', ' ')}  {entry['insta_id']}")
+    if not args.no_upload:
+        print(f"Uploaded {planner.upload_batch(channel)} planned videos.")
+
+def cmd_repair(env, args):
+    """Checks and repairs on-disk state (what `run` does at startup)."""
+    from repair import repair_state
+
+    for channel in _channels(env, args.channel):
+        report = repair_state(channel.env)
+        print(f"{channel.name}: " + ', '.join(f"{key} {value}" for key, value in sorted(report.items())))
+
+# --- Argument Parsing ---
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('run', help='run the scheduler and the Telegram bot').set_defaults(func=cmd_run)
+
+    status = commands.add_parser('status', help='uploads, queues and quota per channel')
+    status.set_defaults(func=cmd_status)
+
+    enqueue = commands.add_parser('enqueue', help='add a local video to the processing queue')
+    enqueue.add_argument('video')
+    enqueue.add_argument('--caption', help='caption the metadata is generated from')
+    enqueue.add_argument('--id', help='job id (default: local-<file name>)')
+    enqueue.set_defaults(func=cmd_enqueue)
+
+    process_one = commands.add_parser('process-one', help='encode one queued video and generate its metadata')
+    process_one.set_defaults(func=cmd_process_one)
+
+    upload_one = commands.add_parser('upload-one', help='upload the next ready video now')
+    upload_one.set_defaults(func=cmd_upload_one)
+
+    ledger = commands.add_parser('ledger', help='upload ledger tools')
+    ledger_commands = ledger.add_subparsers(dest='ledger_command', required=True)
+    inspect = ledger_commands.add_parser('inspect', help='list recorded uploads')
+    inspect.add_argument('--limit', type=int, default=20, help='latest entries to show (0: all)')
+    inspect.set_defaults(func=cmd_ledger_inspect)
+
+    plan = commands.add_parser('plan', help='plan the next days of uploads and upload them with publishAt')
+    plan.add_argument('--days', type=int, help='days ahead to fill (default PLAN_DAYS)')
+    plan.add_argument('--dry-run', action='store_true', help='only show the assignments')
+    plan.add_argument('--no-upload', action='store_true', help='save the plan without uploading')
+    plan.set_defaults(func=cmd_plan)
+
+    repair = commands.add_parser('repair', help='check and repair on-disk state (run does this at startup)')
+    repair.set_defaults(func=cmd_repair)
+
+    for command in (status, enqueue, process_one, upload_one, inspect, plan, repair):
+        command.add_argument('--channel', help='channel name from channels.json (default: all / the only one)')
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(load_env(), args)
+
+
+if __name__ == '__main__':
+    main()
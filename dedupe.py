@@ -0,0 +1,177 @@
+import math
+from datetime import datetime
+import ffmpeg
+import numpy as np
+from editor import probe_video
+from storage import state_db_path, transaction, query
+from utils import log_message
+
+# --- Configuration Defaults (override in .env) ---
+DEFAULT_SAMPLE_FRAMES = 5       # DEDUPE_SAMPLE_FRAMES: frames hashed per clip, at evenly spaced positions
+DEFAULT_MAX_DISTANCE = 8        # DEDUPE_MAX_DISTANCE: max Hamming distance (of 64 bits) for a matching frame
+DEFAULT_MIN_MATCH_SHARE = 0.6   # DEDUPE_MIN_MATCH_SHARE: share of frames that must match to call it a duplicate
+
+HASH_SIZE = 32                  # Frames are reduced to 32x32 grayscale before the DCT
+LOW_FREQ = 8                    # The 8x8 lowest frequencies make the 64-bit hash
+CHUNKS = 4                      # Multi-index hashing: the hash is indexed as 4 x 16-bit chunks
+CHUNK_BITS = 64 // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+
+def _dct_matrix(n):
+    """Orthonormal DCT-II matrix, so a 2D DCT is D @ frame @ D.T."""
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    matrix = np.sqrt(2.0 / n) * np.cos(np.pi * (2 * x + 1) * k / (2 * n))
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+_DCT = _dct_matrix(HASH_SIZE)
+_BIT_WEIGHTS = np.left_shift(np.uint64(1), np.arange(63, -1, -1, dtype=np.uint64))
+
+# --- Perceptual Hashing ---
+
+def sample_frames(path, count):
+    """Returns `count` grayscale HASH_SIZE x HASH_SIZE frames (uint8 array) at evenly spaced positions."""
+    duration = probe_video(path)['duration']
+    frames = []
+    for i in range(count):
+        # Positions at 1/(n+1), 2/(n+1), ... avoid black first/last frames
+        timestamp = duration * (i + 1) / (count + 1)
+        raw, _ = (
+            ffmpeg
+            .input(path, ss=timestamp)
+            .filter('scale', HASH_SIZE, HASH_SIZE)
+            .output('pipe:', vframes=1, format='rawvideo', pix_fmt='gray')
+            .run(capture_stdout=True, quiet=True)
+        )
+        if len(raw) >= HASH_SIZE * HASH_SIZE:
+            frames.append(np.frombuffer(raw[:HASH_SIZE * HASH_SIZE], dtype=np.uint8).reshape(HASH_SIZE, HASH_SIZE))
+    return np.stack(frames) if frames else np.empty((0, HASH_SIZE, HASH_SIZE), dtype=np.uint8)
+
+def phash_frames(frames):
+    """Vectorized pHash: (n, 32, 32) frames -> (n,) uint64 hashes."""
+    if not len(frames):
+        return np.empty(0, dtype=np.uint64)
+    coefficients = _DCT @ frames.astype(np.float64) @ _DCT.T
+    low = coefficients[:, :LOW_FREQ, :LOW_FREQ].reshape(len(frames), -1)
+    # Median without the DC term, which only reflects overall brightness
+    medians = np.median(low[:, 1:], axis=1, keepdims=True)
+    bits = (low > medians).astype(np.uint64)
+    return (bits * _BIT_WEIGHTS).sum(axis=1, dtype=np.uint64)
+
+def hamming(a, b):
+    """Bitwise Hamming distance between uint64 arrays (broadcasting)."""
+    xor = np.bitwise_xor(np.asarray(a, dtype=np.uint64), np.asarray(b, dtype=np.uint64))
+    return np.unpackbits(xor[..., None].view(np.uint8), axis=-1).sum(axis=-1)
+
+# --- Persistent Multi-Index ---
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS phashes (
+        insta_id TEXT NOT NULL,
+        frame INTEGER NOT NULL,
+        hash INTEGER NOT NULL,
+        c0 INTEGER NOT NULL,
+        c1 INTEGER NOT NULL,
+        c2 INTEGER NOT NULL,
+        c3 INTEGER NOT NULL,
+        created_at TEXT NOT NULL,
+        PRIMARY KEY (insta_id, frame)
+    )""",
+    # One index per chunk (with the frame position first), so each probe is an index range scan
+    *(f"CREATE INDEX IF NOT EXISTS phashes_c{i}_idx ON phashes (frame, c{i})" for i in range(CHUNKS)),
+)
+
+_READY = set()
+
+def _db(env=None):
+    path = state_db_path(env)
+    if path not in _READY:
+        with transaction(path) as conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+        _READY.add(path)
+    return path
+
+def _chunks(value):
+    value = int(value)
+    return [(value >> (CHUNK_BITS * (CHUNKS - 1 - i))) & CHUNK_MASK for i in range(CHUNKS)]
+
+def _to_signed(value):
+    """SQLite integers are signed 64-bit."""
+    value = int(value)
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+def _chunk_neighbours(chunk, radius):
+    """All 16-bit values within `radius` bit flips of `chunk`."""
+    values = {chunk}
+    frontier = {chunk}
+    for _ in range(radius):
+        frontier = {value ^ (1 << bit) for value in frontier for bit in range(CHUNK_BITS)} - values
+        values |= frontier
+    return sorted(values)
+
+def _candidates(frame, value, max_distance, env):
+    """
+    Multi-index lookup: if two hashes differ in at most `max_distance` bits, at
+    least one of the 4 chunks differs in at most max_distance // 4 bits, so only
+    those chunk neighbourhoods need to be read from the index.
+    """
+    radius = max_distance // CHUNKS
+    clauses, params = [], [frame]
+    for i, chunk in enumerate(_chunks(value)):
+        neighbours = _chunk_neighbours(chunk, radius)
+        clauses.append(f"c{i} IN ({','.join('?' * len(neighbours))})")
+        params.extend(neighbours)
+    rows = query(_db(env), f"SELECT insta_id, hash FROM phashes WHERE frame = ? AND ({' OR '.join(clauses)})", params)
+    return [(row['insta_id'], row['hash'] & ((1 << 64) - 1)) for row in rows]
+
+def _settings(env):
+    return (
+        int(env.get('DEDUPE_SAMPLE_FRAMES') or DEFAULT_SAMPLE_FRAMES),
+        int(env.get('DEDUPE_MAX_DISTANCE') or DEFAULT_MAX_DISTANCE),
+        float(env.get('DEDUPE_MIN_MATCH_SHARE') or DEFAULT_MIN_MATCH_SHARE),
+    )
+
+def find_duplicate(insta_id, hashes, env):
+    """Returns the insta_id of an indexed clip that matches `hashes`, or None."""
+    _, max_distance, min_share = _settings(env)
+    if not len(hashes):
+        return None
+    required = max(1, math.ceil(len(hashes) * min_share))
+
+    matches = {}
+    for frame, value in enumerate(hashes):
+        candidates = [(other, h) for other, h in _candidates(frame, value, max_distance, env) if other != str(insta_id)]
+        if not candidates:
+            continue
+        distances = hamming(np.array([h for _, h in candidates], dtype=np.uint64), value)
+        for (other, _), distance in zip(candidates, distances):
+            if distance <= max_distance:
+                matches.setdefault(other, set()).add(frame)
+
+    best = max(matches.items(), key=lambda item: len(item[1]), default=(None, ()))
+    return best[0] if len(best[1]) >= required else None
+
+def add_to_index(insta_id, hashes, env):
+    now = datetime.now().isoformat()
+    with transaction(_db(env)) as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO phashes (insta_id, frame, hash, c0, c1, c2, c3, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(str(insta_id), frame, _to_signed(value), *_chunks(value), now) for frame, value in enumerate(hashes)],
+        )
+
+def check_and_index(insta_id, video_path, env):
+    """
+    Hashes a downloaded clip and checks it against the index. Returns the
+    insta_id it duplicates, or None (in which case the clip is added to the index).
+    """
+    sample_count, _, _ = _settings(env)
+    hashes = phash_frames(sample_frames(video_path, sample_count))
+    duplicate_of = find_duplicate(insta_id, hashes, env)
+    if duplicate_of:
+        log_message("INFO", f"Reel {insta_id} is a near-duplicate of {duplicate_of}. Skipping encode.")
+    elif len(hashes):
+        add_to_index(insta_id, hashes, env)
+    return duplicate_of
@@ -1,65 +1,370 @@
 import os
-import json
-from instagrapi import Client
-from utils import load_uploaded, save_uploaded, log_message
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from utils import log_message
+from storage import read_json, write_json, flush_pending
+from ledger import is_uploaded
+import jobs
+import lifecycle
+import watermarks
+import metrics
+
+# --- Configuration Defaults (override in .env) ---
+REEL_MEDIA_TYPE = 2
+MAX_MEDIAS_PER_ACCOUNT = 50         # Medias looked at per account on its first (un-watermarked) fetch
+DEFAULT_PAGE_SIZE = 12              # FETCH_PAGE_SIZE: page size once an account has a watermark
+DEFAULT_FETCH_WORKERS = 4           # FETCH_WORKERS: accounts fetched concurrently
+DEFAULT_REQUESTS_PER_SECOND = 1.0   # INSTAGRAM_REQUESTS_PER_SECOND: global API rate limit
+DEFAULT_FETCH_RETRIES = 3           # FETCH_RETRIES: retries per API call before giving up on an account
+DEFAULT_BACKOFF_SECONDS = 5.0       # FETCH_BACKOFF_SECONDS: first backoff delay, doubled per retry
+DEFAULT_SESSION_PATH = os.path.join('cache', 'instagram_session.json')      # INSTAGRAM_SESSION_PATH
+DEFAULT_USER_ID_CACHE_PATH = os.path.join('cache', 'instagram_user_ids.json')  # INSTAGRAM_USER_ID_CACHE
+DEFAULT_USER_ID_TTL_HOURS = 168     # USER_ID_CACHE_TTL_HOURS
+DEFAULT_BACKEND = 'instagrapi'      # INSTAGRAM_BACKEND: instagrapi | fake (offline catalog, see fake_backends.py)
+
+# Round-trip counters of each channel's current or last cycle, keyed by CHANNEL_NAME
+# (channels fetch at the same time, so one shared dict would mix and reset their numbers)
+LAST_CYCLE_STATS = {}
+_STATS_LOCK = threading.Lock()
+
+# Channels that share an Instagram login share its rate limit and saved session
+_LIMITERS = {}
+_LOGIN_LOCKS = {}
+_SHARED_LOCK = threading.Lock()
+
+
+class RateLimiter:
+    """Token bucket shared by every fetch thread, so all API calls together respect one global rate."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.capacity = float(max(1, burst))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def _fetch_settings(env):
+    return {
+        "workers": max(1, int(env.get('FETCH_WORKERS') or DEFAULT_FETCH_WORKERS)),
+        "rate": float(env.get('INSTAGRAM_REQUESTS_PER_SECOND') or DEFAULT_REQUESTS_PER_SECOND),
+        "retries": int(env.get('FETCH_RETRIES') or DEFAULT_FETCH_RETRIES),
+        "backoff": float(env.get('FETCH_BACKOFF_SECONDS') or DEFAULT_BACKOFF_SECONDS),
+        "page_size": max(1, int(env.get('FETCH_PAGE_SIZE') or DEFAULT_PAGE_SIZE)),
+    }
+
+def _shared_limiter(env, rate):
+    """The rate limiter of this Instagram login, shared by every channel (and cycle) that uses it."""
+    with _SHARED_LOCK:
+        username = env.get('INSTAGRAM_USERNAME')
+        if username not in _LIMITERS:
+            _LIMITERS[username] = RateLimiter(rate)
+        return _LIMITERS[username]
+
+def _login_lock(session_path):
+    with _SHARED_LOCK:
+        return _LOGIN_LOCKS.setdefault(os.path.abspath(session_path), threading.Lock())
+
+def _call_with_backoff(limiter, settings, account, fn, *args, **kwargs):
+    """Runs one rate-limited API call, retrying with jittered exponential backoff for this account only."""
+    for attempt in range(settings['retries'] + 1):
+        limiter.acquire()
+        metrics.API_CALLS.inc(service='instagram', method=fn.__name__)
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt >= settings['retries']:
+                raise
+            metrics.RETRIES.inc(stage='fetch', reason='instagram_error')
+            delay = settings['backoff'] * (2 ** attempt) * random.uniform(0.5, 1.5)
+            log_message("WARN", f"Instagram call {fn.__name__} for {account} failed ({e}). Retrying in {delay:.1f}s.")
+            time.sleep(delay)
+
+def _stats_key(env):
+    return env.get('CHANNEL_NAME') or 'default'
+
+def _count(env, stat, amount=1):
+    with _STATS_LOCK:
+        stats = LAST_CYCLE_STATS.setdefault(_stats_key(env), {})
+        stats[stat] = stats.get(stat, 0) + amount
+
+# --- Session and User-ID Caching ---
+
+def _load_user_id_cache(env):
+    """Loads the username -> user_id cache, dropping entries older than the TTL."""
+    path = env.get('INSTAGRAM_USER_ID_CACHE', DEFAULT_USER_ID_CACHE_PATH)
+    ttl_seconds = float(env.get('USER_ID_CACHE_TTL_HOURS') or DEFAULT_USER_ID_TTL_HOURS) * 3600
+    cache = read_json(path, {})
+    now = time.time()
+    return {name: entry for name, entry in cache.items() if now - entry.get('fetched_at', 0) < ttl_seconds}
+
+def _save_user_id_cache(cache, env):
+    path = env.get('INSTAGRAM_USER_ID_CACHE', DEFAULT_USER_ID_CACHE_PATH)
+    try:
+        # A lost cache only costs lookups, so its fsync is batched
+        write_json(path, cache, durable=False)
+    except OSError as e:
+        log_message("WARN", f"Could not save Instagram user-id cache: {e}")
+
+def _resolve_user_id(cl, account, user_ids, limiter, settings, env):
+    """Returns the user id for `account`, using the cache before asking the API."""
+    entry = user_ids.get(account.lower())
+    if entry:
+        _count(env, 'user_id_cache_hits')
+        return entry['user_id']
+    user_id = _call_with_backoff(limiter, settings, account, cl.user_id_from_username, account)
+    _count(env, 'api_calls')
+    user_ids[account.lower()] = {"user_id": str(user_id), "fetched_at": time.time()}
+    return user_id
+
+# --- Incremental Fetch Watermarks ---
+
+def _media_position(media):
+    """(pk, taken_at timestamp) used to compare a media against an account's watermark."""
+    taken_at = getattr(media, 'taken_at', None)
+    return int(media.pk), taken_at.timestamp() if taken_at else 0.0
+
+def _is_known(media, watermark):
+    """True if the media is at or below the account's high-water mark (seen by an earlier run)."""
+    pk, taken_at = _media_position(media)
+    if taken_at and watermark['last_taken_at']:
+        return taken_at <= watermark['last_taken_at']
+    return pk <= watermark['last_pk']
+
+def _advance_watermark(account, newest, pending, env):
+    """
+    Moves the account's watermark up to the newest media seen, but never past a
+    new reel that was not downloaded yet (daily cap or failed download).
+    """
+    last_pk, last_taken_at = newest
+    if pending:
+        oldest_pk, oldest_taken_at = min(_media_position(media) for media in pending)
+        last_pk, last_taken_at = oldest_pk - 1, max(0.0, oldest_taken_at - 0.001)
+    watermarks.set_watermark(account, last_pk, last_taken_at, env)
+
+def _fetch_account_medias(cl, account, limiter, settings, user_ids, env):
+    """
+    Returns (new_medias, newest_position) for one source account.
+
+    Only medias above the account's watermark are returned, and paging stops as
+    soon as a page reaches already-known items. Returns ([], None) if the account
+    keeps failing.
+    """
+    try:
+        # Get user info (cached) and then their media
+        user_id = _resolve_user_id(cl, account, user_ids, limiter, settings, env)
+        watermark = watermarks.get_watermark(account, env)
+        # First fetch looks at the recent 50 media items, later ones page in small steps
+        page_size = settings['page_size'] if watermark else MAX_MEDIAS_PER_ACCOUNT
+
+        medias, newest, cursor = [], None, ""
+        while True:
+            page, cursor = _call_with_backoff(
+                limiter, settings, account, cl.user_medias_paginated, user_id, amount=page_size, end_cursor=cursor
+            )
+            _count(env, 'api_calls')
+            if not page:
+                break
+            newest = max([_media_position(media) for media in page] + ([newest] if newest else []))
+            medias.extend(media for media in page if not watermark or not _is_known(media, watermark))
+            # Pinned posts can be old, so only stop once the oldest item on the page is already known
+            if (watermark and _is_known(page[-1], watermark)) or not cursor or len(medias) >= MAX_MEDIAS_PER_ACCOUNT:
+                break
+
+        _count(env, 'medias_new', len(medias))
+        return medias[:MAX_MEDIAS_PER_ACCOUNT], newest
+    except Exception as e:
+        log_message("ERROR", f"Error processing account {account}: {e}")
+        return [], None
+
+def _download_reel(cl, account, media, limiter, settings, env):
+    """Downloads one reel, writes its .json sidecar and records the job. Returns (path, metadata) or None."""
+    try:
+        log_message("INFO", f"Found new Reel from {account}: {media.code}")
+        # instagrapi automatically handles watermark removal
+        with metrics.STAGE_SECONDS.time(stage='download'):
+            download_path = str(_call_with_backoff(
+                limiter, settings, account, cl.video_download, media.pk, folder=env['DOWNLOAD_DIR']
+            ))
+        _count(env, 'api_calls')
+        metrics.ITEMS.inc(stage='download', outcome='ok')
+        metrics.BYTES.inc(os.path.getsize(download_path), direction='downloaded')
+    except Exception as e:
+        log_message("ERROR", f"Download failed for {media.code} from {account}: {e}")
+        metrics.ITEMS.inc(stage='download', outcome='failed')
+        return None
+
+    # Store metadata
+    metadata = {
+        "insta_id": str(media.id),
+        "source_account": account,
+        "caption": media.caption_text if media.caption_text else "",
+        "file_path": download_path,
+        "processed": False
+    }
+    
+    # Save the initial metadata to a temporary .json file for processing
+    # (atomic; fsyncs are batched, the job table below is the durable record)
+    meta_filename = os.path.splitext(os.path.basename(download_path))[0] + ".json"
+    meta_path = os.path.join(env['DOWNLOAD_DIR'], meta_filename)
+    write_json(meta_path, metadata, durable=False, backup=False)
+
+    # NOTE: The job table tracks it as downloaded; it is only marked as
+    # uploaded *after* the successful YouTube upload.
+    jobs.add_downloaded(metadata, env)
+    lifecycle.on_downloaded(metadata['insta_id'], download_path, env)
+    return download_path, metadata
+
+def _login(env):
+    """Logs in, reusing the persisted session settings when they are still valid."""
+    if (env.get('INSTAGRAM_BACKEND') or DEFAULT_BACKEND).strip().lower() == 'fake':
+        from fake_backends import FakeInstagramClient
+        return FakeInstagramClient(env)
+    session_path = env.get('INSTAGRAM_SESSION_PATH', DEFAULT_SESSION_PATH)
+    # One login at a time per session file; channels after the first reuse its saved session
+    with _login_lock(session_path):
+        return _login_with_session(env, session_path)
+
+def _login_with_session(env, session_path):
+    from instagrapi import Client
 
-def download_new_reels(env):
-    """Logs into Instagram and downloads new, unwatched reels."""
-    log_message("INFO", "Starting Instagram download cycle...")
     cl = Client()
+    if os.path.exists(session_path):
+        try:
+            # With a loaded session, login() only restores it instead of doing a full login
+            cl.set_settings(read_json(session_path))
+            cl.login(env['INSTAGRAM_USERNAME'], env['INSTAGRAM_PASSWORD'])
+            cl.get_timeline_feed()  # one cheap call to confirm the session is still accepted
+            _count(env, 'api_calls')
+            _count(env, 'logins_saved')
+            log_message("INFO", "Reused saved Instagram session.")
+            return cl
+        except Exception as e:
+            log_message("WARN", f"Saved Instagram session rejected ({e}). Logging in again.")
+            cl = Client()
+
     try:
         # Load session/login
         cl.login(env['INSTAGRAM_USERNAME'], env['INSTAGRAM_PASSWORD'])
+        _count(env, 'api_calls')
     except Exception as e:
         log_message("ERROR", f"Instagram login failed: {e}")
-        return []
+        return None
 
-    uploaded_data = load_uploaded()
-    source_accounts = env['INSTAGRAM_SOURCE_ACCOUNTS'].split(',')
-    downloaded_files = []
+    try:
+        write_json(session_path, cl.get_settings())
+    except Exception as e:
+        log_message("WARN", f"Could not save Instagram session: {e}")
+    return cl
 
-    for account in source_accounts:
-        try:
-            # Get user info and then their media
-            user_id = cl.user_id_from_username(account.strip())
-            # Fetch recent 50 media items (adjust as needed)
-            medias = cl.user_medias(user_id, amount=50)
-
-            for media in medias:
-                # Check if it's a Reel and if we've already uploaded it
-                if media.media_type == 2 and str(media.id) not in uploaded_data:
-                    log_message("INFO", f"Found new Reel from {account}: {media.code}")
-                    # instagrapi automatically handles watermark removal
-                    download_path = cl.video_download(media.pk, folder=env['DOWNLOAD_DIR'])
-                    
-                    # Store metadata
-                    metadata = {
-                        "insta_id": str(media.id),
-                        "source_account": account,
-                        "caption": media.caption_text if media.caption_text else "",
-                        "file_path": download_path,
-                        "processed": False
-                    }
-                    
-                    # Save the initial metadata to a temporary .json file for processing
-                    meta_filename = os.path.splitext(os.path.basename(download_path))[0] + ".json"
-                    meta_path = os.path.join(env['DOWNLOAD_DIR'], meta_filename)
-                    with open(meta_path, 'w') as f:
-                        json.dump(metadata, f)
-
-                    downloaded_files.append((download_path, metadata))
-                    
-                    # NOTE: We temporarily mark it as downloaded to avoid a race condition
-                    # but only mark as uploaded *after* the successful YouTube upload.
-                    
-                    if len(downloaded_files) >= int(env['MAX_DAILY']):
-                        log_message("INFO", f"Reached max daily download limit ({env['MAX_DAILY']}). Stopping.")
-                        return downloaded_files
+def iter_new_reels(env, client=None):
+    """
+    Logs into Instagram and yields (download_path, metadata) for new, unwatched
+    reels as soon as each download finishes.
 
-        except Exception as e:
-            log_message("ERROR", f"Error processing account {account}: {e}")
-            
-    return downloaded_files
+    Source accounts are fetched concurrently (FETCH_WORKERS) behind one global
+    rate limiter per Instagram login (shared with other channels using it);
+    `client` can be any object with the instagrapi Client methods used here
+    (user_id_from_username, user_medias_paginated, video_download). Each
+    account is only paged down to its watermark from the previous run. At
+    most FETCH_WORKERS downloads run ahead of the consumer, so a slow consumer
+    also slows down downloading.
+    """
+    log_message("INFO", "Starting Instagram download cycle...")
+    with _STATS_LOCK:
+        LAST_CYCLE_STATS[_stats_key(env)] = {}
+    cl = client or _login(env)
+    if not cl:
+        return
+
+    settings = _fetch_settings(env)
+    limiter = _shared_limiter(env, settings['rate'])
+    source_accounts = [account.strip() for account in env['INSTAGRAM_SOURCE_ACCOUNTS'].split(',') if account.strip()]
+    max_downloads = int(env['MAX_DAILY'])
+    user_ids = _load_user_id_cache(env)
+    fetched, candidates, downloaded_ids = [], [], set()
+
+    try:
+        with ThreadPoolExecutor(max_workers=settings['workers']) as pool:
+            fetched = list(pool.map(
+                lambda account: _fetch_account_medias(cl, account, limiter, settings, user_ids, env), source_accounts
+            ))
+            _save_user_id_cache(user_ids, env)
+
+            # Dedupe media that shows up under several accounts, keeping account order
+            seen = set()
+            for account, (medias, _) in zip(source_accounts, fetched):
+                for media in medias:
+                    media_id = str(media.id)
+                    if media_id in seen:
+                        continue
+                    seen.add(media_id)
+                    # Check if it's a Reel and if we've already uploaded (or queued) it
+                    if media.media_type == REEL_MEDIA_TYPE and not is_uploaded(media_id, env) and not jobs.job_exists(media_id, env):
+                        candidates.append((account, media))
+
+            to_download = candidates
+            if len(candidates) > max_downloads:
+                log_message("INFO", f"Reached max daily download limit ({env['MAX_DAILY']}). Stopping.")
+                to_download = candidates[:max_downloads]
+
+            in_flight = deque()
+            for account, media in to_download:
+                in_flight.append(pool.submit(_download_reel, cl, account, media, limiter, settings, env))
+                if len(in_flight) < settings['workers']:
+                    continue
+                result = in_flight.popleft().result()
+                if result:
+                    downloaded_ids.add(result[1]['insta_id'])
+                    yield result
+            while in_flight:
+                result = in_flight.popleft().result()
+                if result:
+                    downloaded_ids.add(result[1]['insta_id'])
+                    yield result
+    finally:
+        # Advance each account's watermark past everything handled this cycle
+        # (also when the consumer stopped early: undelivered reels stay above it)
+        for account, (_, newest) in zip(source_accounts, fetched):
+            if newest:
+                pending = [media for owner, media in candidates if owner == account and str(media.id) not in downloaded_ids]
+                _advance_watermark(account, newest, pending, env)
+        # Make this cycle's sidecars and cache durable in one batch
+        flush_pending()
+
+        log_message("INFO", f"Downloaded {len(downloaded_ids)} new reels from {len(source_accounts)} accounts.")
+        # A reused session skips the login round trip; the validation call is already counted in api_calls
+        with _STATS_LOCK:
+            stats = LAST_CYCLE_STATS.setdefault(_stats_key(env), {})
+            saved = stats.get('user_id_cache_hits', 0) + stats.get('logins_saved', 0)
+            stats['round_trips_saved'] = saved
+            stats = dict(stats)
+        log_message(
+            "INFO",
+            f"Instagram API round trips this cycle: {stats.get('api_calls', 0)} made, {saved} saved "
+            f"(user-id cache hits: {stats.get('user_id_cache_hits', 0)}, "
+            f"session reused: {'yes' if stats.get('logins_saved') else 'no'})."
+        )
+
+def download_new_reels(env, client=None):
+    """Downloads every new reel (see iter_new_reels) and returns a list of (download_path, metadata)."""
+    return list(iter_new_reels(env, client))
 
 if __name__ == '__main__':
     from dotenv import dotenv_values
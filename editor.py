@@ -1,64 +1,558 @@
 import os
-import moviepy.editor as mp
-from moviepy.video.fx.all import crop
-from utils import log_message
+import time
+import signal
+import threading
+import multiprocessing
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
+import ffmpeg
+import segment_cache
+from encode_profiles import get_profile, ffmpeg_video_args, moviepy_write_args, run_encode, output_size
+import transform_policy
+import metrics
+from utils import log_message, flush_logs
+
+# Audio sample rate used for encoded output (moviepy's default as well)
+AUDIO_SAMPLE_RATE = 44100
+
+# --- Memory Budget Defaults (override in .env) ---
+DEFAULT_MAX_RSS_MB = 4096                 # ENCODE_MAX_RSS_MB: per job, worker plus its ffmpeg processes (0 disables)
+DEFAULT_MEMORY_FALLBACK = 'low-memory'    # ENCODE_MEMORY_FALLBACK: profile for the retry of a job over the cap ('none' disables)
+MEMORY_POLL_SECONDS = 1.0
 
 # NOTE: Intro/Outro files must be available in the path specified in .env
 # Example paths: env['INTRO_VIDEO_PATH'], env['OUTRO_VIDEO_PATH']
 
-def process_video(download_path, env):
+def _bumper_paths(env):
+    """Returns the (intro_path, outro_path) that exist on disk, or None for missing ones."""
+    intro = env.get('INTRO_VIDEO_PATH')
+    outro = env.get('OUTRO_VIDEO_PATH')
+    return (
+        intro if intro and os.path.exists(intro) else None,
+        outro if outro and os.path.exists(outro) else None,
+    )
+
+def _crop_box(w, h):
+    """Returns (x, y, width, height) of the centered 95% crop, matching moviepy's integer slicing."""
+    new_w, new_h = w * 0.95, h * 0.95
+    x1, x2 = int(w / 2 - new_w / 2), int(w / 2 + new_w / 2)
+    y1, y2 = int(h / 2 - new_h / 2), int(h / 2 + new_h / 2)
+    return x1, y1, x2 - x1, y2 - y1
+
+
+def process_video(download_path, env, threads=None, temp_audiofile=None):
     """Applies edits: intro/outro, slight crop/zoom, and saves to /processed/."""
     try:
+        base_name = os.path.basename(download_path)
+        output_filename = f"processed_{base_name}"
+        output_path = os.path.join(env['PROCESS_DIR'], output_filename)
+        # x264 settings (ENCODE_PROFILE); a profile's own thread count wins over the pool's
+        profile = get_profile(env)
+        threads = profile['threads'] or threads
+
+        # VIDEO_ENGINE=ffmpeg runs the whole edit as one ffmpeg filtergraph
+        engine = env.get('VIDEO_ENGINE', 'moviepy').strip().lower()
+        transform, info = _choose_transform(download_path, env, engine, profile)
+        try:
+            if transform == transform_policy.REMUX:
+                _remux_with_crop(download_path, output_path, info)
+            elif transform == transform_policy.COPY_AUDIO:
+                _crop_video_copy_audio(download_path, output_path, info, threads, profile)
+        except ffmpeg.Error as e:
+            log_message("WARN", f"{transform} failed for {base_name} ({e}). Re-encoding it fully.")
+            transform = transform_policy.FULL
+
+        if transform == transform_policy.FULL and engine == 'ffmpeg':
+            _process_with_ffmpeg(download_path, output_path, env, threads, profile)
+        elif transform == transform_policy.FULL:
+            # Each job gets its own temp audio file so parallel encodes don't clobber each other
+            if not temp_audiofile:
+                temp_audiofile = os.path.join(
+                    env['PROCESS_DIR'], f"temp-audio-{os.path.splitext(base_name)[0]}-{os.getpid()}.m4a"
+                )
+            _process_with_moviepy(download_path, output_path, env, threads, temp_audiofile, profile)
+
+        log_message("INFO", f"Successfully processed video: {output_path}")
+        return output_path
+
+    except Exception as e:
+        log_message("ERROR", f"Video processing failed for {download_path}: {e}")
+        return None
+
+
+def _choose_transform(download_path, env, engine, profile):
+    """Probes the source and returns (transform, info); see transform_policy.py."""
+    base_name = os.path.basename(download_path)
+    try:
+        info = probe_video(download_path)
+        crop_box = _crop_box(info['width'], info['height'])
+        transform, reason = transform_policy.choose_transform(info, crop_box, env, any(_bumper_paths(env)), engine)
+        if transform == transform_policy.REMUX and output_size(crop_box[2:], profile) != tuple(crop_box[2:]):
+            # Scaling down (max_height) needs the frames re-encoded
+            transform = transform_policy.COPY_AUDIO if engine == 'ffmpeg' and info['has_audio'] else transform_policy.FULL
+            reason = f"scaled to {profile['max_height']} lines"
+    except Exception as e:
+        log_message("WARN", f"Could not probe {base_name} ({e}). Re-encoding it fully.")
+        return transform_policy.FULL, None
+    log_message("INFO", f"Transform for {base_name}: {transform} ({reason}).")
+    return transform, info
+
+
+# --- Stream-Copy Transforms ---
+
+def _remux_with_crop(download_path, output_path, info):
+    """Copies both streams; the crop is set in the H.264 headers instead of re-encoding the frames."""
+    crop = transform_policy.sps_crop(info, _crop_box(info['width'], info['height']))
+    bsf = 'h264_metadata=' + ':'.join(f"{key}={value}" for key, value in crop.items())
+    (
+        ffmpeg
+        .input(download_path)
+        .output(output_path, c='copy', map_metadata=-1, movflags='+faststart', **{"bsf:v": bsf})
+        .overwrite_output()
+        .run(quiet=True)
+    )
+
+def _crop_video_copy_audio(download_path, output_path, info, threads, profile):
+    """Re-encodes only the cropped video; the audio stream is copied as is."""
+    x, y, crop_width, crop_height = _crop_box(info['width'], info['height'])
+    size = output_size((crop_width, crop_height), profile)
+    source = ffmpeg.input(download_path)
+    video = source.video.filter('crop', crop_width, crop_height, x, y)
+    if size != (crop_width, crop_height):
+        video = video.filter('scale', size[0], size[1])
+    video = video.filter('setsar', 1)
+
+    output_args = {"vcodec": 'libx264', "acodec": 'copy', "movflags": '+faststart', **ffmpeg_video_args(profile)}
+    if _is_even(size):
+        output_args["pix_fmt"] = 'yuv420p'
+    if threads:
+        output_args["threads"] = threads
+    run_encode(
+        lambda path, **extra: ffmpeg.output(video, source.audio, path, **output_args, **extra),
+        output_path, profile, _passlog_prefix(output_path),
+    )
+
+
+# --- moviepy Engine ---
+
+def _process_with_moviepy(download_path, output_path, env, threads, temp_audiofile, profile):
+    """Decodes the clips through moviepy, edits them frame by frame and writes output_path."""
+    # moviepy (and its numpy/imageio stack) is only loaded by this engine
+    import moviepy.editor as mp
+    from moviepy.video.fx.all import crop
+
+    # Every reader (an ffmpeg subprocess plus its frame/audio buffers) is closed
+    # when the job ends, even on errors; the writer streams frame by frame
+    with ExitStack() as readers:
+        def open_clip(path):
+            clip = mp.VideoFileClip(path)
+            readers.callback(clip.close)
+            return clip
+
         # Load clips
-        main_clip = mp.VideoFileClip(download_path)
-        
+        main_clip = open_clip(download_path)
+
         # 1. Apply slight transformation (Zoom/Crop for uniqueness)
         w, h = main_clip.size
         # Simple slight zoom: 95% of original size, centered
         new_w, new_h = w * 0.95, h * 0.95
         cropped_clip = crop(main_clip, width=new_w, height=new_h, x_center=w/2, y_center=h/2)
-        
+        # Lower-resolution profiles (max_height) scale the crop down
+        size = output_size(tuple(cropped_clip.size), profile)
+        if size != tuple(cropped_clip.size):
+            cropped_clip = cropped_clip.resize(size)
+
         # 2. Add Intro/Outro (if paths are provided)
         final_clip = cropped_clip
         clips_to_concat = [final_clip]
-        
-        if 'INTRO_VIDEO_PATH' in env and os.path.exists(env['INTRO_VIDEO_PATH']):
-            intro_clip = mp.VideoFileClip(env['INTRO_VIDEO_PATH']).resize(cropped_clip.size)
+        intro_path, outro_path = _bumper_paths(env)
+
+        use_cache = _segment_cache_enabled(env) and _is_even(size)
+        if use_cache and (intro_path or outro_path):
+            bumper_infos = {path: probe_video(path) for path in (intro_path, outro_path) if path}
+            fps = max([main_clip.fps] + [info['fps'] for info in bumper_infos.values()])
+
+        if intro_path:
+            if use_cache:
+                # Already scaled to the cropped size, no per-frame resize needed
+                intro_clip = open_clip(_cached_bumper(intro_path, bumper_infos[intro_path], size, fps, env, profile))
+            else:
+                intro_clip = open_clip(intro_path).resize(size)
             clips_to_concat.insert(0, intro_clip)
             log_message("INFO", "Added intro.")
 
-        if 'OUTRO_VIDEO_PATH' in env and os.path.exists(env['OUTRO_VIDEO_PATH']):
-            outro_clip = mp.VideoFileClip(env['OUTRO_VIDEO_PATH']).resize(cropped_clip.size)
+        if outro_path:
+            if use_cache:
+                outro_clip = open_clip(_cached_bumper(outro_path, bumper_infos[outro_path], size, fps, env, profile))
+            else:
+                outro_clip = open_clip(outro_path).resize(size)
             clips_to_concat.append(outro_clip)
             log_message("INFO", "Added outro.")
-        
+
         # Concatenate all clips
         if len(clips_to_concat) > 1:
             final_clip = mp.concatenate_videoclips(clips_to_concat)
-            
+
         # 3. Optional Background Music (Example: lowers volume of main audio and adds separate track)
         # if music_file_path:
         #     music_clip = mp.AudioFileClip(music_file_path).volumex(0.3)
         #     final_clip = final_clip.set_audio(music_clip.set_duration(final_clip.duration))
 
-        # 4. Save processed file
-        base_name = os.path.basename(download_path)
-        output_filename = f"processed_{base_name}"
-        output_path = os.path.join(env['PROCESS_DIR'], output_filename)
-        
-        # Write the video file with appropriate codec for Shorts (H.264)
-        final_clip.write_videofile(
-            output_path, 
-            codec='libx264', 
-            audio_codec='aac', 
-            temp_audiofile='temp-audio.m4a', 
-            remove_temp=True,
-            logger=None # Suppress moviepy logs
+        # 4. Write the video file with appropriate codec for Shorts (H.264)
+        if profile['two_pass']:
+            log_message("WARN", f"Encode profile {profile['name']}: two-pass needs VIDEO_ENGINE=ffmpeg. Encoding in one pass.")
+        try:
+            final_clip.write_videofile(
+                output_path,
+                codec='libx264',
+                audio_codec='aac',
+                temp_audiofile=temp_audiofile,
+                remove_temp=True,
+                threads=threads,
+                logger=None, # Suppress moviepy logs
+                **moviepy_write_args(profile)
+            )
+        finally:
+            # remove_temp only cleans up after a successful write
+            if temp_audiofile and os.path.exists(temp_audiofile):
+                os.remove(temp_audiofile)
+
+
+# --- ffmpeg Filtergraph Engine ---
+
+def _rotation(stream):
+    """Display rotation in degrees from the rotate tag or the display matrix side data."""
+    rotation = stream.get('tags', {}).get('rotate')
+    for side_data in stream.get('side_data_list', []):
+        rotation = side_data.get('rotation', rotation)
+    return int(float(rotation or 0)) % 360
+
+def probe_video(path):
+    """
+    Returns a dict with width, height, fps, duration and has_audio for a media
+    file, plus the codec details the transform policy looks at (video_codec,
+    pix_fmt, coded size, field_order, rotation, audio_codec/sample_rate/channels).
+    """
+    info = ffmpeg.probe(path)
+    video = next(s for s in info['streams'] if s['codec_type'] == 'video')
+    audio = next((s for s in info['streams'] if s['codec_type'] == 'audio'), None)
+    num, den = video.get('avg_frame_rate', '0/0').split('/')
+    if not float(num) or not float(den):
+        num, den = video['r_frame_rate'].split('/')
+    return {
+        "width": int(video['width']),
+        "height": int(video['height']),
+        "fps": float(num) / float(den),
+        "duration": float(info['format']['duration']),
+        "has_audio": audio is not None,
+        "video_codec": video.get('codec_name'),
+        "pix_fmt": video.get('pix_fmt'),
+        "field_order": video.get('field_order'),
+        "rotation": _rotation(video),
+        "audio_codec": audio.get('codec_name') if audio else None,
+        "audio_sample_rate": int(audio.get('sample_rate') or 0) if audio else 0,
+        "audio_channels": int(audio.get('channels') or 0) if audio else 0,
+    }
+
+def _segment_streams(path, info, size, fps, crop_box=None):
+    """Returns normalized (video, audio) filter streams for one concat segment."""
+    source = ffmpeg.input(path)
+    video = source.video
+    if crop_box:
+        x, y, cw, ch = crop_box
+        video = video.filter('crop', cw, ch, x, y)
+        if (cw, ch) != tuple(size):
+            video = video.filter('scale', size[0], size[1])
+    else:
+        video = video.filter('scale', size[0], size[1])
+    video = video.filter('setsar', 1).filter('fps', fps=fps)
+
+    if info['has_audio']:
+        audio = source.audio
+    else:
+        # Silent track so every segment has audio for concat (moviepy leaves silence too)
+        audio = ffmpeg.input(
+            f"anullsrc=channel_layout=stereo:sample_rate={AUDIO_SAMPLE_RATE}", f='lavfi', t=info['duration']
+        ).audio
+    return video, audio.filter('aresample', AUDIO_SAMPLE_RATE)
+
+def _process_with_ffmpeg(download_path, output_path, env, threads, profile):
+    """Crops, scales and concatenates intro/main/outro in a single ffmpeg filtergraph."""
+    main_info = probe_video(download_path)
+    crop_box = _crop_box(main_info['width'], main_info['height'])
+    size = output_size(crop_box[2:], profile)
+
+    segments = [(download_path, main_info, crop_box)]
+    intro_path, outro_path = _bumper_paths(env)
+    if intro_path:
+        segments.insert(0, (intro_path, probe_video(intro_path), None))
+        log_message("INFO", "Added intro.")
+    if outro_path:
+        segments.append((outro_path, probe_video(outro_path), None))
+        log_message("INFO", "Added outro.")
+
+    # moviepy writes the concatenation at the highest fps of its clips
+    fps = max(info['fps'] for _, info, _ in segments)
+
+    if len(segments) > 1 and _segment_cache_enabled(env) and _is_even(size):
+        _concat_with_cached_bumpers(segments, size, fps, output_path, env, threads, profile)
+        return
+
+    streams = []
+    for path, info, box in segments:
+        streams.extend(_segment_streams(path, info, size, fps, box))
+    joined = ffmpeg.concat(*streams, v=1, a=1).node
+
+    output_args = {"vcodec": 'libx264', "acodec": 'aac', "r": fps, **ffmpeg_video_args(profile)}
+    # Same rule as moviepy's writer: yuv420p only when both dimensions are even
+    if _is_even(size):
+        output_args["pix_fmt"] = 'yuv420p'
+    if threads:
+        output_args["threads"] = threads
+
+    run_encode(
+        lambda path, **extra: ffmpeg.output(joined[0], joined[1], path, **output_args, **extra),
+        output_path, profile, _passlog_prefix(output_path),
+    )
+
+
+# --- Intro/Outro Segment Cache ---
+
+def _segment_cache_enabled(env):
+    return env.get('SEGMENT_CACHE', 'true').strip().lower() in ('1', 'true', 'yes', 'on')
+
+def _is_even(size):
+    return size[0] % 2 == 0 and size[1] % 2 == 0
+
+def _passlog_prefix(output_path):
+    """Per-job two-pass stats file prefix, next to the output."""
+    return f"{os.path.splitext(output_path)[0]}.2pass-{os.getpid()}"
+
+def _segment_params(fps, profile):
+    """
+    Encode parameters shared by cached bumpers and the main clip, so they can be
+    joined with stream copy. They include the encode profile, so changing it
+    re-renders the cached bumpers instead of mixing x264 settings in one file.
+    """
+    return {
+        **ffmpeg_video_args(profile),
+        "vcodec": 'libx264',
+        "acodec": 'aac',
+        "pix_fmt": 'yuv420p',
+        "r": fps,
+        "ar": AUDIO_SAMPLE_RATE,
+        "ac": 2,
+        "video_track_timescale": 90000,
+    }
+
+def _render_segment(path, info, size, fps, dest_path, profile, crop_box=None, threads=None):
+    """Encodes one normalized segment (scaled or cropped) with the shared segment parameters."""
+    video, audio = _segment_streams(path, info, size, fps, crop_box)
+    output_args = _segment_params(fps, profile)
+    if threads:
+        output_args["threads"] = threads
+    run_encode(
+        lambda dest, **extra: ffmpeg.output(video, audio, dest, **output_args, **extra),
+        dest_path, profile, _passlog_prefix(dest_path),
+    )
+
+def _cached_bumper(path, info, size, fps, env, profile):
+    """Returns a cached intro/outro segment already scaled and encoded for `size` and `fps`."""
+    return segment_cache.get_segment(
+        path, size, _segment_params(fps, profile),
+        lambda dest_path: _render_segment(path, info, size, fps, dest_path, profile),
+        env,
+    )
+
+def _concat_with_cached_bumpers(segments, size, fps, output_path, env, threads, profile):
+    """Encodes only the main clip and stream-copies it between the cached intro/outro segments."""
+    stem = os.path.splitext(output_path)[0]
+    main_tmp = f"{stem}.main-{os.getpid()}.mp4"
+    list_path = f"{stem}.concat-{os.getpid()}.txt"
+    try:
+        parts = []
+        for path, info, crop_box in segments:
+            if crop_box:
+                _render_segment(path, info, size, fps, main_tmp, profile, crop_box, threads)
+                parts.append(main_tmp)
+            else:
+                parts.append(_cached_bumper(path, info, size, fps, env, profile))
+
+        with open(list_path, 'w') as f:
+            for part in parts:
+                escaped = os.path.abspath(part).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+
+        (
+            ffmpeg
+            .input(list_path, f='concat', safe=0)
+            .output(output_path, c='copy', movflags='+faststart')
+            .overwrite_output()
+            .run(quiet=True)
         )
+    finally:
+        for tmp in (main_tmp, list_path):
+            if os.path.exists(tmp):
+                os.remove(tmp)
 
-        log_message("INFO", f"Successfully processed video: {output_path}")
-        return output_path
 
-    except Exception as e:
-        log_message("ERROR", f"Video processing failed for {download_path}: {e}")
+# --- Parallel Processing Pool ---
+
+# Worker processes are capped process-wide (PROCESS_WORKERS), so pipelines of
+# several channels running at once share one pool instead of each starting its own.
+_ENCODE_SLOTS = None
+_ENCODE_SLOTS_LOCK = threading.Lock()
+# Returned by _run_process_job for a job killed over the memory cap
+_OVER_MEMORY = object()
+
+def _encode_slots(env):
+    global _ENCODE_SLOTS
+    with _ENCODE_SLOTS_LOCK:
+        if _ENCODE_SLOTS is None:
+            _ENCODE_SLOTS = threading.BoundedSemaphore(get_pool_settings(env)[0])
+        return _ENCODE_SLOTS
+
+def _process_worker(conn, download_path, env, threads):
+    """Runs process_video inside a worker process and sends the result back."""
+    try:
+        conn.send(process_video(download_path, env, threads=threads))
+    finally:
+        conn.close()
+        flush_logs()
+
+def run_process_job(download_path, env, threads, timeout):
+    """
+    Runs a single process_video job in its own process, killing it after
+    `timeout` seconds. A job whose processes grow past ENCODE_MAX_RSS_MB is
+    killed and redone once with the ENCODE_MEMORY_FALLBACK profile.
+    """
+    with _encode_slots(env):
+        processed_path = _run_process_job(download_path, env, threads, timeout)
+        fallback = (env.get('ENCODE_MEMORY_FALLBACK') or DEFAULT_MEMORY_FALLBACK).strip().lower()
+        if processed_path is _OVER_MEMORY and fallback not in ('none', get_profile(env)['name']):
+            log_message("WARN", f"Retrying {os.path.basename(download_path)} with the {fallback} encode profile.")
+            processed_path = _run_process_job(download_path, dict(env, ENCODE_PROFILE=fallback), threads, timeout)
+        return None if processed_path is _OVER_MEMORY else processed_path
+
+def _run_process_job(download_path, env, threads, timeout):
+    max_rss = float(env.get('ENCODE_MAX_RSS_MB') or DEFAULT_MAX_RSS_MB) * 1024 * 1024
+    parent_conn, child_conn = multiprocessing.Pipe(duplex=False)
+    worker = multiprocessing.Process(
+        target=_process_worker, args=(child_conn, download_path, env, threads), daemon=True
+    )
+    started = time.monotonic()
+    peak_rss = 0
+    worker.start()
+    child_conn.close()
+    try:
+        while True:
+            remaining = timeout - (time.monotonic() - started)
+            if remaining <= 0:
+                log_message("ERROR", f"Processing timed out after {timeout:.0f}s for {download_path}. Killing worker.")
+                metrics.ITEMS.inc(stage='encode_job', outcome='timeout')
+                return None
+            if parent_conn.poll(min(MEMORY_POLL_SECONDS, remaining)):
+                break
+            # The worker plus the ffmpeg processes it started (moviepy readers/writer, ffmpeg-python)
+            rss = _rss_bytes([worker.pid, *_descendants(worker.pid)])
+            peak_rss = max(peak_rss, rss)
+            if max_rss and rss > max_rss:
+                log_message("WARN", f"Processing {download_path} uses {rss / 1048576:.0f} MB (cap {max_rss / 1048576:.0f} MB). Killing worker.")
+                metrics.ITEMS.inc(stage='encode_job', outcome='over_memory')
+                return _OVER_MEMORY
+        processed_path = parent_conn.recv()
+        if processed_path:
+            _observe_encode_fps(processed_path, time.monotonic() - started)
+        return processed_path
+    except EOFError:
+        log_message("ERROR", f"Processing worker crashed for {download_path} (exit code {worker.exitcode}).")
+        metrics.ITEMS.inc(stage='encode_job', outcome='crashed')
         return None
+    finally:
+        if worker.is_alive():
+            _kill_tree(worker)
+        worker.join()
+        parent_conn.close()
+        log_message("INFO", f"Processing job for {os.path.basename(download_path)} finished in {time.monotonic() - started:.1f}s (peak {peak_rss / 1048576:.0f} MB).")
+
+# --- Process Tree Memory (Linux /proc; elsewhere the cap is not enforced) ---
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+def _descendants(pid):
+    """PIDs of every process below `pid`."""
+    children = {}
+    try:
+        entries = [entry for entry in os.listdir('/proc') if entry.isdigit()]
+    except OSError:
+        return []
+    for entry in entries:
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name may contain spaces; state and ppid follow its closing paren
+        ppid = int(stat[stat.rindex(')') + 2:].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+    found, stack = [], [pid]
+    while stack:
+        below = children.get(stack.pop(), [])
+        found += below
+        stack += below
+    return found
+
+def _rss_bytes(pids):
+    total = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/statm') as f:
+                total += int(f.read().split()[1]) * _PAGE_SIZE
+        except (OSError, ValueError, IndexError):
+            continue
+    return total
+
+def _kill_tree(worker):
+    """Stops the worker and the ffmpeg processes it started (they would outlive it otherwise)."""
+    descendants = _descendants(worker.pid)
+    worker.terminate()
+    for pid in descendants:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+def _observe_encode_fps(processed_path, seconds):
+    """Records output frames per wall-clock second of one finished job (metrics run in this process only)."""
+    try:
+        info = probe_video(processed_path)
+        metrics.ENCODE_FPS.observe(info['duration'] * info['fps'] / max(seconds, 1e-6))
+    except Exception as e:
+        log_message("WARN", f"Could not measure encode speed for {processed_path}: {e}")
+
+def get_pool_settings(env):
+    """Returns (workers, threads_per_worker, timeout) for the processing pool."""
+    cpu_count = os.cpu_count() or 1
+    workers = max(1, int(env.get('PROCESS_WORKERS') or cpu_count))
+    # Split the cores between workers so ffmpeg encoder threads don't oversubscribe the box
+    threads = max(1, int(env.get('PROCESS_THREADS') or cpu_count // workers))
+    timeout = float(env.get('PROCESS_TIMEOUT') or 1800)
+    return workers, threads, timeout
+
+def process_videos(download_paths, env):
+    """
+    Processes several videos in parallel, one worker process per job.
+
+    Returns a list of processed paths (or None for failed/timed-out jobs)
+    in the same order as `download_paths`.
+    """
+    download_paths = list(download_paths)
+    if not download_paths:
+        return []
+
+    workers, threads, timeout = get_pool_settings(env)
+    workers = min(workers, len(download_paths))
+    log_message("INFO", f"Processing {len(download_paths)} videos with {workers} workers x {threads} threads (timeout {timeout:.0f}s).")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda path: run_process_job(path, env, threads, timeout), download_paths))
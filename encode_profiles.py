@@ -0,0 +1,121 @@
+import os
+import glob
+
+# --- Encode Profiles ---
+# x264 settings for the processed output. ENCODE_PROFILE picks one; ENCODE_PRESET,
+# ENCODE_CRF, ENCODE_BITRATE, ENCODE_TWO_PASS, ENCODE_THREADS, ENCODE_LOOKAHEAD and
+# ENCODE_MAX_HEIGHT override single fields. Compare them on your hardware with
+# benchmarks/bench_profiles.py.
+#
+#   preset     x264 speed/compression trade-off (ultrafast ... veryslow)
+#   crf        constant quality (lower is better/bigger), used when no bitrate is set
+#   bitrate    target video bitrate, e.g. '8M' (YouTube's 1080p SDR recommendation)
+#   maxrate    VBV cap; with crf this is "capped CRF"
+#   two_pass   two-pass bitrate encode (ffmpeg engine only; needs a bitrate)
+#   threads    encoder threads (None: PROCESS_THREADS, see editor.get_pool_settings)
+#   lookahead  x264 rc-lookahead, i.e. frames buffered ahead of the encoder (None: preset's)
+#   max_height scale the output down to at most this many lines (None: keep the crop's size)
+
+DEFAULT_PROFILE = 'default'
+
+PROFILES = {
+    # libx264's own defaults, i.e. what moviepy always produced
+    'default': {"preset": 'medium', "crf": 23, "bitrate": None, "maxrate": None, "two_pass": False, "threads": None, "lookahead": None, "max_height": None},
+    # Throughput first: about 3x medium's speed for slightly bigger files
+    'fast': {"preset": 'veryfast', "crf": 23, "bitrate": None, "maxrate": None, "two_pass": False, "threads": None, "lookahead": None, "max_height": None},
+    # Smaller/better files for servers with CPU to spare
+    'quality': {"preset": 'slow', "crf": 20, "bitrate": None, "maxrate": None, "two_pass": False, "threads": None, "lookahead": None, "max_height": None},
+    # Constant quality, but never above the Shorts upload recommendation
+    'shorts': {"preset": 'medium', "crf": 21, "bitrate": None, "maxrate": '10M', "two_pass": False, "threads": None, "lookahead": None, "max_height": None},
+    # Predictable file size: two-pass at the recommended 1080p bitrate
+    'shorts-2pass': {"preset": 'medium', "crf": None, "bitrate": '8M', "maxrate": '12M', "two_pass": True, "threads": None, "lookahead": None, "max_height": None},
+    # Fallback for jobs over ENCODE_MAX_RSS_MB (editor.run_process_job): 720p-class
+    # output, two threads and a short lookahead keep the encoder's frame buffers small
+    'low-memory': {"preset": 'veryfast', "crf": 23, "bitrate": None, "maxrate": '6M', "two_pass": False, "threads": 2, "lookahead": 10, "max_height": 1280},
+}
+
+def _flag(value):
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
+def get_profile(env):
+    """Returns the active encode profile (ENCODE_PROFILE plus any ENCODE_* overrides) as a dict."""
+    name = (env.get('ENCODE_PROFILE') or DEFAULT_PROFILE).strip().lower()
+    if name not in PROFILES:
+        raise ValueError(f"Unknown ENCODE_PROFILE {name!r} (choose from {', '.join(PROFILES)}).")
+    profile = dict(PROFILES[name], name=name)
+    if env.get('ENCODE_PRESET'):
+        profile['preset'] = env['ENCODE_PRESET'].strip()
+    if env.get('ENCODE_CRF'):
+        profile['crf'] = float(env['ENCODE_CRF'])
+    if env.get('ENCODE_BITRATE'):
+        profile['bitrate'] = env['ENCODE_BITRATE'].strip()
+    if env.get('ENCODE_MAXRATE'):
+        profile['maxrate'] = env['ENCODE_MAXRATE'].strip()
+    if env.get('ENCODE_TWO_PASS'):
+        profile['two_pass'] = _flag(env['ENCODE_TWO_PASS'])
+    if env.get('ENCODE_THREADS'):
+        profile['threads'] = int(env['ENCODE_THREADS'])
+    if env.get('ENCODE_LOOKAHEAD'):
+        profile['lookahead'] = int(env['ENCODE_LOOKAHEAD'])
+    if env.get('ENCODE_MAX_HEIGHT'):
+        profile['max_height'] = int(env['ENCODE_MAX_HEIGHT'])
+    # Two-pass only makes sense with a bitrate target
+    profile['two_pass'] = bool(profile['two_pass'] and profile['bitrate'])
+    return profile
+
+def _bufsize(rate):
+    """VBV buffer of twice the rate ('8M' -> '16M')."""
+    rate = str(rate)
+    number, unit = (rate[:-1], rate[-1]) if rate[-1].isalpha() else (rate, '')
+    return f"{float(number) * 2:g}{unit}"
+
+def ffmpeg_video_args(profile):
+    """x264 rate-control arguments for an ffmpeg-python output()."""
+    args = {"preset": profile['preset']}
+    if profile['bitrate']:
+        args["video_bitrate"] = profile['bitrate']
+    elif profile['crf'] is not None:
+        args["crf"] = profile['crf']
+    if profile['maxrate']:
+        args["maxrate"] = profile['maxrate']
+        args["bufsize"] = _bufsize(profile['maxrate'])
+    if profile['lookahead'] is not None:
+        args["rc-lookahead"] = profile['lookahead']
+    return args
+
+def moviepy_write_args(profile):
+    """Keyword arguments for moviepy's write_videofile (single pass only)."""
+    params = []
+    if profile['crf'] is not None and not profile['bitrate']:
+        params += ['-crf', f"{profile['crf']:g}"]
+    if profile['maxrate']:
+        params += ['-maxrate', profile['maxrate'], '-bufsize', _bufsize(profile['maxrate'])]
+    if profile['lookahead'] is not None:
+        params += ['-rc-lookahead', str(profile['lookahead'])]
+    return {"preset": profile['preset'], "bitrate": profile['bitrate'], "ffmpeg_params": params or None}
+
+def output_size(size, profile):
+    """The encoded (width, height) for a `size` frame: scaled down to max_height, kept even."""
+    width, height = size
+    max_height = profile['max_height']
+    if not max_height or height <= max_height:
+        return tuple(size)
+    new_height = max_height - max_height % 2
+    return int(round(width * new_height / height / 2)) * 2, new_height
+
+def run_encode(output, dest_path, profile, passlog_prefix):
+    """
+    Encodes to dest_path with the profile's rate control: in one pass, or as
+    pass 1 (analysis only, discarded) then pass 2 for two-pass profiles.
+    `output(path, **extra_args)` builds the ffmpeg-python output node.
+    """
+    if not profile['two_pass']:
+        output(dest_path).overwrite_output().run(quiet=True)
+        return
+    try:
+        # Pass 1 only writes the stats file, so its output goes to the null muxer
+        output(os.devnull, f='null', passlogfile=passlog_prefix, **{"pass": 1}).overwrite_output().run(quiet=True)
+        output(dest_path, passlogfile=passlog_prefix, **{"pass": 2}).overwrite_output().run(quiet=True)
+    finally:
+        for stats_file in glob.glob(glob.escape(passlog_prefix) + '*.log*'):
+            os.remove(stats_file)
@@ -0,0 +1,340 @@
+import os
+import json
+import time
+import uuid
+import threading
+from pathlib import Path
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+from utils import log_message
+from storage import read_json, write_json
+
+# --- Configuration Defaults (override in .env) ---
+DEFAULT_CATALOG_DIR = os.path.join('cache', 'fake_catalog')  # FAKE_CATALOG_DIR: generated clips + catalog.json
+DEFAULT_API_LATENCY = 0.05          # FAKE_API_LATENCY: seconds per fake Instagram API call
+DEFAULT_DOWNLOAD_MBPS = 0           # FAKE_DOWNLOAD_MBPS: fake Instagram download speed in MB/s (0: disk speed)
+DEFAULT_UPLOAD_MBPS = 0             # FAKE_UPLOAD_MBPS: upload endpoint speed in MB/s (0: unlimited)
+CATALOG_FILE = 'catalog.json'
+COPY_BLOCK = 1024 * 1024
+
+# --- Offline Backends ---
+# Stand-ins for Instagram (INSTAGRAM_BACKEND=fake) and YouTube
+# (YOUTUBE_BACKEND=fake) that run the real pipeline without accounts or
+# network: a catalog of generated clips served like instagrapi serves reels,
+# and a local endpoint speaking YouTube's resumable upload protocol. The
+# metadata counterpart is ai_metadata.MockMetadataClient (METADATA_BACKEND=mock).
+# Used by benchmarks/bench_e2e.py.
+
+
+class FakeMedia:
+    """The instagrapi Media fields the downloader reads."""
+
+    def __init__(self, entry):
+        self.pk = int(entry['pk'])
+        self.id = f"{entry['pk']}_{entry['user_id']}"
+        self.code = entry['code']
+        self.media_type = entry['media_type']
+        self.caption_text = entry['caption']
+        self.taken_at = datetime.fromisoformat(entry['taken_at'])
+        self.path = entry['path']
+
+
+def _make_clip(path, width, height, duration, seed):
+    """A clip with its own content (Game of Life from `seed`), so perceptual dedupe treats every reel as new."""
+    import ffmpeg
+
+    video = ffmpeg.input(
+        f"life=size={width}x{height}:rate=30:seed={seed}:ratio=0.3:mold=10:life_color=white:death_color=black",
+        f='lavfi', t=duration,
+    )
+    audio = ffmpeg.input(f"sine=frequency={220 + seed % 600}:sample_rate=44100", f='lavfi', t=duration)
+    (
+        ffmpeg
+        .output(video, audio, path, vcodec='libx264', preset='ultrafast', pix_fmt='yuv420p', acodec='aac')
+        .overwrite_output()
+        .run(quiet=True)
+    )
+
+def build_catalog(catalog_dir, accounts, reels_per_account, size=(720, 1280), duration=5):
+    """
+    Generates `reels_per_account` clips for every account (clips that already
+    exist are kept) and writes catalog.json. Returns the number of entries.
+    """
+    os.makedirs(catalog_dir, exist_ok=True)
+    width, height = size
+    now = datetime.now()
+    catalog = {}
+    for a, account in enumerate(accounts):
+        user_id = str(1000 + a)
+        entries = []
+        for r in range(reels_per_account):
+            pk = (a + 1) * 100000 + r
+            path = os.path.join(catalog_dir, f"{account}_{r}_{width}x{height}.mp4")
+            if not os.path.exists(path):
+                _make_clip(path, width, height, duration, seed=pk)
+            entries.append({
+                "pk": pk,
+                "user_id": user_id,
+                "code": f"FAKE{pk}",
+                "media_type": 2,
+                "caption": f"Fact {r} from {account}: fake reel number {pk} for offline runs #facts",
+                "taken_at": (now - timedelta(hours=reels_per_account - r)).isoformat(),
+                "path": path,
+            })
+        # Newest first, like the API
+        catalog[account] = {"user_id": user_id, "medias": entries[::-1]}
+    write_json(os.path.join(catalog_dir, CATALOG_FILE), catalog, backup=False)
+    return sum(len(entry['medias']) for entry in catalog.values())
+
+
+class FakeInstagramClient:
+    """Serves the catalog through the instagrapi Client methods used by downloader.iter_new_reels."""
+
+    def __init__(self, env):
+        catalog_dir = env.get('FAKE_CATALOG_DIR') or DEFAULT_CATALOG_DIR
+        catalog = read_json(os.path.join(catalog_dir, CATALOG_FILE), None)
+        if catalog is None:
+            raise FileNotFoundError(f"No fake catalog in {catalog_dir} (see fake_backends.build_catalog).")
+        self.latency = float(env.get('FAKE_API_LATENCY') or DEFAULT_API_LATENCY)
+        self.mbps = float(env.get('FAKE_DOWNLOAD_MBPS') or DEFAULT_DOWNLOAD_MBPS)
+        self.user_ids = {account.lower(): entry['user_id'] for account, entry in catalog.items()}
+        self.medias = {entry['user_id']: [FakeMedia(media) for media in entry['medias']] for entry in catalog.values()}
+        self.by_pk = {media.pk: media for medias in self.medias.values() for media in medias}
+
+    def user_id_from_username(self, username):
+        time.sleep(self.latency)
+        if username.lower() not in self.user_ids:
+            raise KeyError(f"Unknown fake account: {username}")
+        return self.user_ids[username.lower()]
+
+    def user_medias_paginated(self, user_id, amount=0, end_cursor=""):
+        """(page, next_cursor); the cursor is the offset of the next page ('' after the last one)."""
+        time.sleep(self.latency)
+        medias = self.medias.get(str(user_id), [])
+        start = int(end_cursor or 0)
+        end = start + amount if amount else len(medias)
+        return medias[start:end], str(end) if end < len(medias) else ""
+
+    def video_download(self, media_pk, folder=""):
+        time.sleep(self.latency)
+        source = self.by_pk[int(media_pk)].path
+        target = Path(folder) / f"{media_pk}.mp4"
+        started = time.monotonic()
+        copied = 0
+        with open(source, 'rb') as src, open(target, 'wb') as dst:
+            while True:
+                block = src.read(COPY_BLOCK)
+                if not block:
+                    break
+                dst.write(block)
+                copied += len(block)
+                if self.mbps:
+                    # Sleep off whatever the copy was ahead of the simulated link
+                    ahead = copied / (self.mbps * 1048576) - (time.monotonic() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        return target
+
+# --- Local Upload Endpoint ---
+# POST /upload starts a session (Location header), PUT /upload/<id> with
+# Content-Range sends a chunk: 308 + Range while incomplete, 200 + the video
+# resource at the end. `Content-Range: bytes */<total>` asks for the committed
+# range, as after an interrupted chunk. The bytes are counted, not kept.
+
+class _UploadHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _reply(self, status, body=None, headers=()):
+        data = json.dumps(body).encode('utf-8') if body is not None else b''
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        mbps = self.server.mbps
+        started = time.monotonic()
+        received = 0
+        while received < length:
+            received += len(self.rfile.read(min(COPY_BLOCK, length - received)))
+            if mbps:
+                ahead = received / (mbps * 1048576) - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+        return received
+
+    def do_POST(self):
+        if self.path.split('?')[0] != '/upload':
+            self.send_error(404)
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}')
+        session_id = uuid.uuid4().hex
+        with self.server.lock:
+            self.server.sessions[session_id] = {
+                "total": int(self.headers.get('X-Upload-Content-Length') or 0), "received": 0, "body": body,
+            }
+        self._reply(200, headers=[('Location', f"http://{self.headers['Host']}/upload/{session_id}")])
+
+    def do_PUT(self):
+        session_id = self.path.split('?')[0].rsplit('/', 1)[-1]
+        with self.server.lock:
+            session = self.server.sessions.get(session_id)
+            self.server.puts += 1
+            fail = self.server.fail_every and self.server.puts % self.server.fail_every == 0
+        if session is None:
+            self.send_error(404)
+            return
+        content_range = self.headers.get('Content-Range', '')
+        if content_range.startswith('bytes */'):
+            self._status(session)
+            return
+        if fail:
+            # Drop the chunk like a flaky server; the client asks for the committed range next
+            self._read_body()
+            self._reply(503, {"error": {"code": 503, "errors": [{"reason": "backendError"}]}})
+            return
+        first = int(content_range.split(' ')[1].split('-')[0])
+        if first != session['received']:
+            self._status(session)
+            return
+        session['received'] += self._read_body()
+        self._status(session)
+
+    def _status(self, session):
+        if session['total'] and session['received'] >= session['total']:
+            with self.server.lock:
+                self.server.completed += 1
+                video_id = f"fake{self.server.completed:06d}"
+            self._reply(200, {"id": video_id, "snippet": session['body'].get('snippet', {})})
+        elif session['received']:
+            self._reply(308, headers=[('Range', f"bytes=0-{session['received'] - 1}")])
+        else:
+            self._reply(308)
+
+    def log_message(self, format, *args):
+        pass  # One line per chunk would flood the log
+
+
+def start_upload_server(host='127.0.0.1', port=0, mbps=DEFAULT_UPLOAD_MBPS, fail_every=0):
+    """
+    Serves the fake upload endpoint from a background thread; port 0 picks a
+    free one. Returns the server, its URL is server.url (use it as
+    YOUTUBE_API_ENDPOINT). Every `fail_every`-th chunk is answered with a 503.
+    """
+    server = ThreadingHTTPServer((host, port), _UploadHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.sessions = {}
+    server.mbps, server.fail_every = float(mbps or 0), int(fail_every or 0)
+    server.puts = server.completed = 0
+    server.url = f"http://{host}:{server.server_address[1]}/"
+    threading.Thread(target=server.serve_forever, name='fake-upload-http', daemon=True).start()
+    log_message("INFO", f"Fake YouTube upload endpoint at {server.url}")
+    return server
+
+# --- Fake YouTube Service ---
+
+class _UploadProgress:
+    """Like googleapiclient's MediaUploadProgress."""
+
+    def __init__(self, resumable_progress, total_size):
+        self.resumable_progress = resumable_progress
+        self.total_size = total_size
+
+    def progress(self):
+        return self.resumable_progress / self.total_size if self.total_size else 0.0
+
+
+class FakeUploadRequest:
+    """
+    The resumable-upload half of googleapiclient's HttpRequest, against the
+    fake endpoint: next_chunk(), resumable_uri and the error state that
+    makes the next call ask for the committed range.
+    """
+
+    def __init__(self, endpoint, body, media_body):
+        self.endpoint = endpoint
+        self.body = body
+        self.media_body = media_body
+        self.resumable_uri = None
+        self.resumable_progress = 0
+        self._in_error_state = False
+
+    def _send(self, method, url, body=b'', headers=None):
+        import http.client
+
+        parts = urlsplit(url)
+        conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=60)
+        try:
+            conn.request(method, parts.path or '/', body=body, headers=headers or {})
+            response = conn.getresponse()
+            return response, response.read()
+        finally:
+            conn.close()
+
+    def _raise(self, response, content, url):
+        import httplib2
+        from googleapiclient.errors import HttpError
+
+        self._in_error_state = True
+        raise HttpError(httplib2.Response(response), content, uri=url)
+
+    def _committed(self, response):
+        """Bytes the server has, from the Range header of a 308 answer."""
+        byte_range = response.getheader('Range')
+        return int(byte_range.rsplit('-', 1)[1]) + 1 if byte_range else 0
+
+    def next_chunk(self, num_retries=0):
+        total = self.media_body.size()
+        if self.resumable_uri is None:
+            url = self.endpoint.rstrip('/') + '/upload'
+            response, content = self._send('POST', url, json.dumps(self.body).encode('utf-8'), {
+                'Content-Type': 'application/json', 'X-Upload-Content-Length': str(total),
+            })
+            if response.status != 200:
+                self._raise(response, content, url)
+            self.resumable_uri = response.getheader('Location')
+            self.resumable_progress = 0
+
+        if self._in_error_state:
+            response, content = self._send('PUT', self.resumable_uri, headers={'Content-Range': f"bytes */{total}"})
+            if response.status not in (200, 308):
+                self._raise(response, content, self.resumable_uri)
+            self._in_error_state = False
+            if response.status == 200:
+                return None, json.loads(content)
+            self.resumable_progress = self._committed(response)
+
+        chunk = self.media_body.getbytes(self.resumable_progress, self.media_body.chunksize())
+        last = self.resumable_progress + len(chunk) - 1
+        response, content = self._send('PUT', self.resumable_uri, chunk, {
+            'Content-Range': f"bytes {self.resumable_progress}-{last}/{total}",
+            'Content-Length': str(len(chunk)),
+        })
+        if response.status == 200:
+            return None, json.loads(content)
+        if response.status != 308:
+            self._raise(response, content, self.resumable_uri)
+        self.resumable_progress = self._committed(response)
+        return _UploadProgress(self.resumable_progress, total), None
+
+
+class FakeYouTubeService:
+    """The part of the YouTube API service used by uploader: videos().insert(...)."""
+
+    def __init__(self, endpoint):
+        if not endpoint:
+            raise ValueError("YOUTUBE_BACKEND=fake needs YOUTUBE_API_ENDPOINT (see fake_backends.start_upload_server).")
+        self.endpoint = endpoint
+
+    def videos(self):
+        return self
+
+    def insert(self, part, body, media_body):
+        return FakeUploadRequest(self.endpoint, body, media_body)
@@ -0,0 +1,145 @@
+import os
+import json
+from datetime import datetime
+from storage import state_db_path, transaction, query
+
+# --- Pipeline States ---
+DOWNLOADED = 'downloaded'
+PROCESSED = 'processed'
+METADATA_READY = 'metadata_ready'
+PLANNED = 'planned'          # Assigned to a future slot by the week planner (planner.py)
+UPLOADED = 'uploaded'
+FAILED = 'failed'
+DUPLICATE = 'duplicate'
+
+DEFAULT_MAX_RETRIES = 3
+
+# --- Schema ---
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS jobs (
+        insta_id TEXT PRIMARY KEY,
+        state TEXT NOT NULL,
+        source_account TEXT,
+        caption TEXT,
+        download_path TEXT,
+        processed_path TEXT,
+        metadata TEXT,
+        retries INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS jobs_state_idx ON jobs (state, updated_at)",
+)
+
+_READY = set()
+
+def _db(env=None):
+    path = state_db_path(env)
+    if path not in _READY:
+        with transaction(path) as conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+        _READY.add(path)
+    return path
+
+def _row_to_job(row):
+    job = dict(row)
+    job['metadata'] = json.loads(job['metadata']) if job['metadata'] else None
+    return job
+
+def _update(insta_id, env, **fields):
+    fields['updated_at'] = datetime.now().isoformat()
+    assignments = ', '.join(f"{column} = ?" for column in fields)
+    with transaction(_db(env)) as conn:
+        conn.execute(f"UPDATE jobs SET {assignments} WHERE insta_id = ?", (*fields.values(), str(insta_id)))
+
+# --- Job Table API ---
+
+def add_downloaded(reel, env=None):
+    """Records a freshly downloaded reel (the downloader's metadata dict). Existing jobs are left untouched."""
+    now = datetime.now().isoformat()
+    with transaction(_db(env)) as conn:
+        conn.execute(
+            """INSERT OR IGNORE INTO jobs
+               (insta_id, state, source_account, caption, download_path, created_at, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            (str(reel['insta_id']), DOWNLOADED, reel.get('source_account'), reel.get('caption', ''),
+             reel['file_path'], now, now),
+        )
+
+def get_job(insta_id, env=None):
+    rows = query(_db(env), "SELECT * FROM jobs WHERE insta_id = ?", (str(insta_id),))
+    return _row_to_job(rows[0]) if rows else None
+
+def find_by_download_path(download_path, env=None):
+    """The job whose raw download is `download_path` (as recorded, or the same absolute path), or None."""
+    rows = query(
+        _db(env), "SELECT * FROM jobs WHERE download_path IN (?, ?) LIMIT 1",
+        (download_path, os.path.abspath(download_path)),
+    )
+    return _row_to_job(rows[0]) if rows else None
+
+def job_exists(insta_id, env=None):
+    return bool(query(_db(env), "SELECT 1 FROM jobs WHERE insta_id = ?", (str(insta_id),)))
+
+def jobs_in_state(state, env=None):
+    """Returns all jobs in `state`, oldest first."""
+    rows = query(_db(env), "SELECT * FROM jobs WHERE state = ? ORDER BY updated_at", (state,))
+    return [_row_to_job(row) for row in rows]
+
+def mark_processed(insta_id, processed_path, env=None):
+    _update(insta_id, env, state=PROCESSED, processed_path=processed_path, last_error=None)
+
+def set_metadata(insta_id, metadata, env=None):
+    _update(insta_id, env, state=METADATA_READY, metadata=json.dumps(metadata), last_error=None)
+
+def mark_duplicate(insta_id, duplicate_of, env=None):
+    _update(insta_id, env, state=DUPLICATE, last_error=f"near-duplicate of {duplicate_of}")
+
+def mark_evicted(insta_id, env=None):
+    """The job's files were deleted by the disk quota; it can't be resumed."""
+    _update(insta_id, env, state=FAILED, last_error="files evicted by disk quota")
+
+def mark_planned(insta_id, env=None):
+    _update(insta_id, env, state=PLANNED)
+
+def mark_ready(insta_id, env=None):
+    """Puts a planned job back in the upload queue (its slot was missed or given up)."""
+    _update(insta_id, env, state=METADATA_READY)
+
+def mark_uploaded(insta_id, env=None):
+    _update(insta_id, env, state=UPLOADED, last_error=None)
+
+def mark_failed(insta_id, error, env=None):
+    """
+    Counts a failed attempt. The job keeps its state (so the same step is retried
+    next time) until it has failed MAX_RETRIES times, then moves to FAILED.
+    """
+    max_retries = int((env or {}).get('MAX_RETRIES') or DEFAULT_MAX_RETRIES)
+    now = datetime.now().isoformat()
+    with transaction(_db(env)) as conn:
+        conn.execute(
+            """UPDATE jobs
+               SET retries = retries + 1,
+                   last_error = ?,
+                   state = CASE WHEN retries + 1 >= ? THEN ? ELSE state END,
+                   updated_at = ?
+               WHERE insta_id = ?""",
+            (str(error), max_retries, FAILED, now, str(insta_id)),
+        )
+
+def next_ready(env=None):
+    """O(1) dequeue: the oldest job whose processed file and metadata are ready for upload."""
+    rows = query(
+        _db(env),
+        "SELECT * FROM jobs WHERE state = ? ORDER BY updated_at LIMIT 1",
+        (METADATA_READY,),
+    )
+    return _row_to_job(rows[0]) if rows else None
+
+def state_counts(env=None):
+    """Returns {state: number_of_jobs}."""
+    rows = query(_db(env), "SELECT state, COUNT(*) AS n FROM jobs GROUP BY state")
+    return {row['state']: row['n'] for row in rows}
@@ -0,0 +1,113 @@
+import os
+import json
+from datetime import datetime
+from storage import state_db_path, transaction, query
+from utils import log_message, UPLOAD_TRACKER
+
+# --- Schema ---
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS uploads (
+        insta_id TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        recorded_at TEXT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    )""",
+)
+
+_READY = set()
+
+def _db(env=None):
+    """Returns the ledger database path, creating the schema and migrating uploaded.json once."""
+    path = state_db_path(env)
+    if path not in _READY:
+        with transaction(path) as conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+        _migrate_json(path)
+        _READY.add(path)
+    return path
+
+def _migrate_json(path):
+    """One-time import of the legacy uploaded.json tracker into the ledger."""
+    migrated = query(path, "SELECT value FROM meta WHERE key = 'json_migrated'")
+    if migrated or not os.path.exists(UPLOAD_TRACKER):
+        return
+
+    try:
+        with open(UPLOAD_TRACKER, 'r') as f:
+            legacy = json.load(f)
+    except (json.JSONDecodeError, IOError) as e:
+        log_message("ERROR", f"Could not read {UPLOAD_TRACKER} for migration. Leaving it in place. Error: {e}")
+        return
+
+    with transaction(path) as conn:
+        _upsert(conn, legacy)
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', ?)",
+            (datetime.now().isoformat(),),
+        )
+    os.replace(UPLOAD_TRACKER, UPLOAD_TRACKER + '.migrated')
+    log_message("INFO", f"Migrated {len(legacy)} entries from {UPLOAD_TRACKER} into the upload ledger.")
+
+def _upsert(conn, entries):
+    now = datetime.now().isoformat()
+    conn.executemany(
+        "INSERT OR REPLACE INTO uploads (insta_id, data, recorded_at) VALUES (?, ?, ?)",
+        [(str(insta_id), json.dumps(entry), now) for insta_id, entry in entries.items()],
+    )
+
+# --- Ledger API ---
+
+def is_uploaded(insta_id, env=None):
+    """Indexed lookup: True if the reel has already been uploaded."""
+    return bool(query(_db(env), "SELECT 1 FROM uploads WHERE insta_id = ?", (str(insta_id),)))
+
+def get_upload(insta_id, env=None):
+    """Returns the ledger entry for a reel, or None."""
+    rows = query(_db(env), "SELECT data FROM uploads WHERE insta_id = ?", (str(insta_id),))
+    return json.loads(rows[0]['data']) if rows else None
+
+def record_upload(insta_id, entry, env=None):
+    """Appends (or replaces) a single ledger entry in one durable transaction."""
+    with transaction(_db(env)) as conn:
+        _upsert(conn, {insta_id: entry})
+
+def record_uploads(entries, env=None):
+    """Writes many ledger entries in one durable transaction."""
+    with transaction(_db(env)) as conn:
+        _upsert(conn, entries)
+
+def all_uploads(env=None):
+    """Returns the whole ledger as a dict (insta_id -> entry). O(history); prefer is_uploaded()."""
+    rows = query(_db(env), "SELECT insta_id, data FROM uploads ORDER BY recorded_at")
+    return {row['insta_id']: json.loads(row['data']) for row in rows}
+
+def count_uploads(env=None):
+    return query(_db(env), "SELECT COUNT(*) AS n FROM uploads")[0]['n']
+
+def publishing_counts(since_day, env=None):
+    """
+    Uploads per publish day ('YYYY-MM-DD' -> count) from the `since_day` date on.
+    Entries without a publish_at (older ones) count on the day they were recorded.
+    """
+    rows = query(
+        _db(env),
+        """SELECT substr(COALESCE(json_extract(data, '$.publish_at'), recorded_at), 1, 10) AS day, COUNT(*) AS n
+           FROM uploads GROUP BY day HAVING day >= ?""",
+        (since_day.isoformat(),),
+    )
+    return {row['day']: row['n'] for row in rows}
+
+def publish_times_since(since, env=None):
+    """The publish_at times ('YYYY-MM-DDTHH:MM') of uploads publishing at or after the `since` datetime."""
+    rows = query(
+        _db(env),
+        """SELECT substr(json_extract(data, '$.publish_at'), 1, 16) AS at FROM uploads
+           WHERE json_extract(data, '$.publish_at') >= ?""",
+        (since.isoformat(),),
+    )
+    return {row['at'] for row in rows}
@@ -0,0 +1,176 @@
+import os
+import time
+from storage import state_db_path, transaction, query
+from utils import log_message
+import jobs
+
+# --- Configuration Defaults (override in .env) ---
+DEFAULT_QUOTA_MB = 20480            # DISK_QUOTA_MB: downloads/ + processed/ together
+DEFAULT_RECONCILE_HOURS = 24        # DISK_RECONCILE_HOURS: how often the tracked sizes are checked against a real scan
+
+DOWNLOAD = 'download'
+SIDECAR = 'sidecar'
+PROCESSED = 'processed'
+
+# --- Schema ---
+# Every file the pipeline writes is registered with its size, so disk usage is
+# one indexed SUM instead of a directory walk.
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS files (
+        path TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        insta_id TEXT,
+        size INTEGER NOT NULL,
+        created_at REAL NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS files_created_idx ON files (created_at)",
+    "CREATE INDEX IF NOT EXISTS files_kind_idx ON files (kind)",
+    """CREATE TABLE IF NOT EXISTS lifecycle_meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    )""",
+)
+
+_READY = set()
+
+def _db(env=None):
+    path = state_db_path(env)
+    if path not in _READY:
+        with transaction(path) as conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+        _READY.add(path)
+    return path
+
+def _enabled(env, key):
+    return str(env.get(key, 'true')).strip().lower() in ('1', 'true', 'yes', 'on')
+
+def sidecar_path(download_path):
+    """The downloader's .json metadata file next to a raw download."""
+    return os.path.splitext(download_path)[0] + ".json"
+
+# --- Accounting ---
+
+def register(path, kind, insta_id, env):
+    """Records a file written by the pipeline (no-op if it doesn't exist)."""
+    if not path or not os.path.exists(path):
+        return
+    stat = os.stat(path)
+    with transaction(_db(env)) as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO files (path, kind, insta_id, size, created_at) VALUES (?, ?, ?, ?, ?)",
+            (os.path.abspath(path), kind, str(insta_id) if insta_id else None, stat.st_size, stat.st_mtime),
+        )
+
+def delete(path, env):
+    """Deletes a file and its accounting row. Returns the bytes freed."""
+    if not path:
+        return 0
+    key = os.path.abspath(path)
+    rows = query(_db(env), "SELECT size FROM files WHERE path = ?", (key,))
+    freed = rows[0]['size'] if rows else 0
+    try:
+        freed = os.path.getsize(path)
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        log_message("WARN", f"Could not delete {path}: {e}")
+        return 0
+    with transaction(_db(env)) as conn:
+        conn.execute("DELETE FROM files WHERE path = ?", (key,))
+    return freed
+
+def usage(env, kind=None):
+    """Tracked bytes on disk (optionally for one kind of file)."""
+    if kind:
+        rows = query(_db(env), "SELECT COALESCE(SUM(size), 0) AS total FROM files WHERE kind = ?", (kind,))
+    else:
+        rows = query(_db(env), "SELECT COALESCE(SUM(size), 0) AS total FROM files")
+    return rows[0]['total']
+
+def reconcile(env, force=False):
+    """
+    Rare full scan (every DISK_RECONCILE_HOURS): registers files the tracker
+    doesn't know about and forgets rows whose files are gone.
+    """
+    hours = float(env.get('DISK_RECONCILE_HOURS') or DEFAULT_RECONCILE_HOURS)
+    rows = query(_db(env), "SELECT value FROM lifecycle_meta WHERE key = 'reconciled_at'")
+    if not force and rows and time.time() - float(rows[0]['value']) < hours * 3600:
+        return
+
+    known = {row['path'] for row in query(_db(env), "SELECT path FROM files")}
+    found = set()
+    for directory, kind in ((env['DOWNLOAD_DIR'], DOWNLOAD), (env['PROCESS_DIR'], PROCESSED)):
+        if not os.path.isdir(directory):
+            continue
+        for entry in os.scandir(directory):
+            if not entry.is_file():
+                continue
+            path = os.path.abspath(entry.path)
+            found.add(path)
+            if path not in known:
+                register(path, SIDECAR if entry.name.endswith('.json') else kind, None, env)
+
+    missing = known - found
+    with transaction(_db(env)) as conn:
+        conn.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in missing])
+        conn.execute(
+            "INSERT OR REPLACE INTO lifecycle_meta (key, value) VALUES ('reconciled_at', ?)", (str(time.time()),)
+        )
+    log_message("INFO", f"Disk accounting reconciled: {len(found - known)} untracked files added, {len(missing)} stale rows dropped.")
+
+# --- Retention Policies ---
+
+def on_downloaded(insta_id, download_path, env):
+    register(download_path, DOWNLOAD, insta_id, env)
+    register(sidecar_path(download_path), SIDECAR, insta_id, env)
+
+def on_processed(insta_id, download_path, processed_path, env):
+    """Tracks the processed file and, unless DELETE_RAW_AFTER_PROCESS=false, removes the raw download."""
+    register(processed_path, PROCESSED, insta_id, env)
+    if _enabled(env, 'DELETE_RAW_AFTER_PROCESS'):
+        delete(download_path, env)
+        delete(sidecar_path(download_path), env)
+
+def on_duplicate(insta_id, download_path, env):
+    """A near-duplicate will never be encoded, so its raw download can go right away."""
+    delete(download_path, env)
+    delete(sidecar_path(download_path), env)
+
+def on_uploaded(insta_id, processed_path, env):
+    """Removes the processed file once it is on YouTube (unless DELETE_PROCESSED_AFTER_UPLOAD=false)."""
+    if _enabled(env, 'DELETE_PROCESSED_AFTER_UPLOAD'):
+        delete(processed_path, env)
+
+def enforce_quota(env):
+    """Deletes oldest files first until tracked usage is under DISK_QUOTA_MB. Returns the bytes freed."""
+    reconcile(env)
+    quota = float(env.get('DISK_QUOTA_MB') or DEFAULT_QUOTA_MB) * 1024 * 1024
+    total = usage(env)
+    if total <= quota:
+        return 0
+
+    freed = 0
+    evicted_jobs = set()
+    for row in query(_db(env), "SELECT path, kind, insta_id, size FROM files ORDER BY created_at"):
+        if total - freed <= quota:
+            break
+        freed += delete(row['path'], env)
+        if row['insta_id'] and row['kind'] != SIDECAR:
+            evicted_jobs.add(row['insta_id'])
+
+    # A job whose file was evicted before it was uploaded can't continue
+    for insta_id in evicted_jobs:
+        job = jobs.get_job(insta_id, env)
+        if job and job['state'] not in (jobs.UPLOADED, jobs.DUPLICATE, jobs.FAILED):
+            jobs.mark_evicted(insta_id, env)
+
+    log_message("WARN", f"Disk quota exceeded: freed {freed / 1048576:.1f} MB (oldest first), {len(evicted_jobs)} reels affected.")
+    return freed
+
+def disk_report(env):
+    """Tracked usage per kind, in bytes (for status displays)."""
+    rows = query(_db(env), "SELECT kind, COALESCE(SUM(size), 0) AS total, COUNT(*) AS n FROM files GROUP BY kind")
+    return {row['kind']: {"bytes": row['total'], "files": row['n']} for row in rows}
@@ -1,191 +1,170 @@
-import schedule
-import time
-from datetime import datetime, timedelta
-import os
-import json
+import asyncio
+import functools
+from datetime import datetime
 
 # Import all modules
-from utils import load_env, init_dirs, log_message, load_uploaded, save_uploaded
-from downloader import download_new_reels
-from editor import process_video
-from ai_metadata import generate_metadata_with_ai
-from uploader import upload_video
+from utils import load_env, init_dirs, log_message, current_log_path
+from channels import load_channels, DEFAULT_CHANNEL
+from scheduler import AsyncScheduler, CPU, UPLOAD
+from pipeline import get_pipeline_stats
+import jobs
+import quota
+import planner
+import metrics
+from repair import repair_state
 
 # --- Global State and Environment ---
 ENV = load_env()
-init_dirs()
-UPLOAD_QUEUE = []
-UPLOAD_COUNT_TODAY = 0
-UPLOAD_LOG = load_uploaded()
-AUTOMATION_PAUSED = False
-
-# --- Scheduling Helpers ---
-
-def get_next_available_video():
-    """Finds a processed video that hasn't been uploaded yet."""
-    processed_files = [f for f in os.listdir(ENV['PROCESS_DIR']) if f.endswith('.mp4')]
-    
-    for filename in processed_files:
-        insta_id = filename.split('_')[1].split('.')[0] # e.g. processed_2345678.mp4 -> 2345678
-        if insta_id not in UPLOAD_LOG:
-            # Reconstruct the original metadata from the download directory (if necessary)
-            # Or assume metadata is generated before upload.
-            
-            # For simplicity, we assume the original .json file (from downloader) is available
-            # We'll use the editor's output path here.
-            video_path = os.path.join(ENV['PROCESS_DIR'], filename)
-            
-            # Placeholder for actual metadata retrieval/generation
-            # In a clean run, metadata should be generated *before* adding to the queue.
-            # Here we'll generate on the fly if needed.
-            
-            # To be more robust, we should store metadata with the processed file.
-            log_message("INFO", f"Found new processed video for upload: {filename}")
-            
-            # Placeholder content for AI generation based on file name if no metadata is linked
-            simulated_content = f"Fact about ID {insta_id}" 
-            
-            # --- AI Metadata Generation ---
-            try:
-                metadata = generate_metadata_with_ai(simulated_content, ENV)
-                return video_path, metadata, insta_id
-            except Exception as e:
-                log_message("ERROR", f"AI metadata generation failed: {e}")
-                continue
-    return None, None, None
-
-def calculate_scheduled_time(time_str):
-    """Calculates the next available time slot (now or in the future) in RFC 3339 format."""
-    now = datetime.now()
-    hour, minute = map(int, time_str.split(':'))
-    
-    # Target time for today
-    target_time = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
-    
-    # If the target time is in the past, schedule for a few minutes from now
-    if target_time <= now + timedelta(minutes=5):
-        # Schedule it for 2 minutes from now to ensure a clean immediate upload
-        scheduled = now + timedelta(minutes=2)
-        log_message("WARN", f"Scheduled time {time_str} is in the past. Uploading immediately at {scheduled.strftime('%H:%M')}")
-    else:
-        scheduled = target_time
-    
-    # Convert to RFC 3339 format (required by YouTube API)
-    return scheduled.isoformat("T") + "Z", scheduled.strftime("%I:%M %p")
-
-
-# --- Main Automation Cycle ---
-
-def download_and_process():
-    """Step 1: Download new videos and process them."""
-    log_message("INFO", "--- Starting DAILY DOWNLOAD/PROCESSING ---")
-    
-    # 1. Download
-    downloaded_files = download_new_reels(ENV)
-    
-    # 2. Process
-    for download_path, metadata in downloaded_files:
-        processed_path = process_video(download_path, ENV)
-        if processed_path:
-            # Add to the global queue for the uploader
-            UPLOAD_QUEUE.append({
-                "video_path": processed_path,
-                "insta_id": metadata['insta_id'],
-                # We should run AI generation here to link to processed file
-                "metadata": generate_metadata_with_ai(metadata['caption'], ENV) 
-            })
-            log_message("INFO", f"Video {metadata['insta_id']} added to upload queue.")
-        else:
-            log_message("ERROR", f"Failed to process {download_path}. Skipping.")
-
-
-def trigger_upload_cycle(scheduled_time_str):
-    """Step 2: Upload one video at the specified time slot."""
-    global UPLOAD_COUNT_TODAY, UPLOAD_LOG, UPLOAD_QUEUE, AUTOMATION_PAUSED
-    
-    if AUTOMATION_PAUSED:
-        log_message("WARN", "Automation is paused. Skipping upload.")
-        return
-        
-    log_message("INFO", f"--- Starting UPLOAD CYCLE for {scheduled_time_str} ---")
-
-    # Check if we've already hit the limit
-    if UPLOAD_COUNT_TODAY >= int(ENV['MAX_DAILY']):
-        log_message("WARN", "Max daily uploads reached. Skipping.")
-        return
-
-    video_path, metadata, insta_id = get_next_available_video()
-    
-    if video_path and metadata:
-        # Calculate the actual scheduled time
-        scheduled_utc, readable_time = calculate_scheduled_time(scheduled_time_str)
-        
-        # --- YouTube Upload ---
-        yt_url = upload_video(video_path, metadata, scheduled_utc, ENV)
-
-        if yt_url:
-            # 3. Update log and cleanup
-            UPLOAD_LOG[insta_id] = {
-                "filename": os.path.basename(video_path),
-                "timestamp": datetime.now().isoformat(),
-                "youtube_url": yt_url,
-                "scheduled_for": readable_time
-            }
-            save_uploaded(UPLOAD_LOG)
-            UPLOAD_COUNT_TODAY += 1
-            log_message("SUCCESS", f"Upload {UPLOAD_COUNT_TODAY}/3 succeeded. URL: {yt_url}")
-            # send_telegram_notification(f"✅ Upload success at {readable_time}! Count: {UPLOAD_COUNT_TODAY}/3")
-            # Optional: os.remove(video_path) to clean up processed files
-
-        else:
-            log_message("ERROR", "Upload failed. Logging attempt.")
-            # send_telegram_notification(f"❌ Upload failed for {insta_id} at {scheduled_time_str}")
-            
-    else:
-        log_message("WARN", "No new unique video found in /processed/ folder to upload.")
-        # send_telegram_notification("⚠️ Upload skipped: No unique videos available.")
-
-
-def reset_daily_count():
-    """Resets the upload count at midnight."""
-    global UPLOAD_COUNT_TODAY
-    UPLOAD_COUNT_TODAY = 0
-    log_message("INFO", "Daily upload count reset to 0.")
+init_dirs(ENV)
+# One entry per YouTube channel (channels.json, or the .env alone as 'default');
+# counters, pause flags and upload cycles live on each Channel
+CHANNELS = load_channels(ENV)
 
 
-# --- Scheduling Setup ---
+# --- Telegram Bot Controller ---
+
+class BotController:
+    """Shares pause flags, counters and manual triggers with the Telegram bot (same event loop).
+
+    Every command takes an optional channel name; without one it applies to all channels.
+    """
+
+    def __init__(self, scheduler, channels):
+        self.scheduler = scheduler
+        self.channels = channels
+
+    def _select(self, name=None):
+        return [channel for channel in self.channels if name in (None, channel.name)]
+
+    def pause(self, name=None):
+        for channel in self._select(name):
+            channel.paused = True
+            channel.log("WARN", "Automation paused from Telegram.")
+
+    def resume(self, name=None):
+        for channel in self._select(name):
+            channel.paused = False
+            channel.log("INFO", "Automation resumed from Telegram.")
+
+    def is_paused(self, name=None):
+        return all(channel.paused for channel in self._select(name))
 
-def setup_scheduler():
-    """Sets up the daily schedule."""
-    # Reset count every day at 00:01
-    schedule.every().day.at("00:01").do(reset_daily_count)
-    
-    # Daily download and processing run (e.g., at 1 AM)
-    schedule.every().day.at("01:00").do(download_and_process)
+    def upload_now(self, name=None):
+        now = datetime.now().strftime("%H:%M")
+        for channel in self._select(name):
+            self.scheduler.run_now(
+                functools.partial(channel.upload, now), job_name(channel, "manual-upload"),
+                executor=UPLOAD, tenant=channel.name,
+            )
 
-    # Scheduled uploads
-    schedule.every().day.at("06:00").do(lambda: trigger_upload_cycle("06:00"))
-    schedule.every().day.at("12:00").do(lambda: trigger_upload_cycle("12:00"))
-    schedule.every().day.at("17:00").do(lambda: trigger_upload_cycle("17:00"))
-    
-    log_message("INFO", "Automation scheduler initialized.")
+    def status_text(self, name=None):
+        lines = [channel.status_line() for channel in self._select(name)] or [f"Unknown channel: {name}"]
+        lines += metrics.summary_lines()
+        lines += [f"Next: {job} at {when.strftime('%a %H:%M')}" for job, when in self.scheduler.next_runs()[:3]]
+        return '\n'.join(lines)
+
+    def log_path(self):
+        return current_log_path(ENV)
+
+
+# --- Scheduling Setup ---
+
+def job_name(channel, job):
+    """Scheduler job name; the single-channel setup keeps the old names (and their catch-up history)."""
+    return job if channel.name == DEFAULT_CHANNEL else f"{channel.name}:{job}"
+
+def setup_scheduler(scheduler, channels):
+    """Sets up the daily schedule of every channel."""
+    for channel in channels:
+        channel.scheduler = scheduler
+
+        # Daily download and processing run (DOWNLOAD_TIME, e.g. 1 AM); runs of all
+        # channels share the CPU executor (CHANNEL_PIPELINES) and take turns
+        scheduler.every_day_at(channel.download_time, channel.download_and_process, name=job_name(channel, "download-and-process"), executor=CPU, tenant=channel.name)
+
+        # UPLOAD_MODE=plan: one off-peak batch uploads the next days' slots ahead of time (publishAt)
+        if planner.enabled(channel.env):
+            scheduler.every_day_at(planner.plan_time(channel.env), functools.partial(planner.run_planner, channel), name=job_name(channel, "plan-uploads"), executor=UPLOAD, tenant=channel.name)
+            continue
+
+        # Scheduled uploads (own executor, never blocked by download/processing)
+        for slot in channel.upload_slots:
+            scheduler.every_day_at(slot, functools.partial(channel.upload, slot), name=job_name(channel, f"upload-{slot}"), executor=UPLOAD, tenant=channel.name)
+
+    log_message("INFO", f"Automation scheduler initialized for {len(channels)} channel(s).")
+
+
+# --- Metrics ---
+
+def register_gauges(channels):
+    """Live values read at scrape time (counters and timings are recorded where the work happens)."""
+    metrics.register_gauge(
+        'uploads_today', 'Uploads so far today per channel.',
+        lambda: [({"channel": channel.name}, channel.upload_count_today) for channel in channels],
+    )
+    metrics.register_gauge(
+        'jobs', 'Reels per job state and channel.',
+        lambda: [
+            ({"channel": channel.name, "state": state}, count)
+            for channel in channels for state, count in jobs.state_counts(channel.env).items()
+        ],
+    )
+    metrics.register_gauge(
+        'quota_units_used', 'YouTube API units used in the current quota day (per channel\'s project).',
+        lambda: [({"channel": channel.name}, quota.used_today(channel.env)) for channel in channels],
+    )
+    metrics.register_gauge(
+        'pipeline_queue_depth', 'Reels waiting between pipeline stages.',
+        lambda: [
+            ({"channel": channel.name, "queue": queue_name}, depth)
+            for channel in channels
+            for queue_name, depth in get_pipeline_stats(channel.name).get('queue_depths', {}).items()
+        ],
+    )
 
 
 # --- Main Loop ---
 
+async def run_automation():
+    """Runs the scheduler and the Telegram bot on one event loop."""
+    # Verify (and repair) on-disk state left by the previous run before any job touches it
+    for channel in CHANNELS:
+        try:
+            repair_state(channel.env)
+        except Exception as e:
+            # A store the check can't handle shouldn't keep the scheduler from starting
+            channel.log("ERROR", f"State check failed: {e}")
+
+    scheduler = AsyncScheduler(ENV)
+    setup_scheduler(scheduler, CHANNELS)
+    register_gauges(CHANNELS)
+    metrics_server = metrics.start_server(ENV)
+
+    bot = None
+    if ENV.get('TELEGRAM_BOT_TOKEN'):
+        from telegram_bot import start_bot, stop_bot, send_daily_status
+        try:
+            bot = await start_bot(BotController(scheduler, CHANNELS), ENV['TELEGRAM_BOT_TOKEN'])
+            scheduler.every_day_at("23:00", functools.partial(send_daily_status, bot), name="daily-status", catch_up=False)
+            log_message("INFO", "Telegram bot started.")
+        except Exception as e:
+            log_message("ERROR", f"Telegram bot failed to start: {e}")
+
+    # Run the initial download/process cycle to populate the queues
+    # (jobs left over from a previous run are resumed, not redone)
+    for channel in CHANNELS:
+        scheduler.run_now(channel.download_and_process, job_name(channel, "download-and-process"), executor=CPU, tenant=channel.name)
+
+    try:
+        await scheduler.run()
+    finally:
+        if bot:
+            await stop_bot(bot)
+        if metrics_server:
+            metrics_server.shutdown()
+        scheduler.shutdown()
+
+
 if __name__ == '__main__':
     log_message("INFO", "Starting YouTube Shorts Automation System...")
-    
-    # Initialize scheduler
-    setup_scheduler()
-    
-    # Initialize and run the Telegram bot in a separate thread/process (omitted here for brevity)
-    # bot_thread = threading.Thread(target=run_telegram_bot)
-    # bot_thread.start()
-    
-    # Run the initial download/process cycle to populate the queue
-    download_and_process()
-    
-    while True:
-        schedule.run_pending()
-        time.sleep(1) # Check every second
+    asyncio.run(run_automation())
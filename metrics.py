@@ -0,0 +1,219 @@
+import math
+import time
+import bisect
+import threading
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from utils import log_message
+
+# --- Configuration Defaults (override in .env) ---
+DEFAULT_METRICS_HOST = '127.0.0.1'   # METRICS_HOST
+DEFAULT_METRICS_PORT = 9108          # METRICS_PORT: 0 disables the endpoint
+PREFIX = 'shorts_'
+
+# Seconds; covers a 50ms cache hit up to a 30 minute encode or upload
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+FPS_BUCKETS = (5, 10, 25, 50, 100, 200, 400, 800, 1600)
+SAMPLE_WINDOW = 1024  # Latest raw observations kept per label set, for exact percentiles
+
+# In-process metrics with a Prometheus text endpoint. Everything is recorded in
+# the main process: encode jobs run in child processes, so they are timed by
+# the parent (editor.run_process_job).
+_LOCK = threading.Lock()
+_METRICS = {}
+_GAUGE_CALLBACKS = {}
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Counter:
+    """Monotonic count per label set (e.g. items by stage and outcome)."""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text):
+        self.name, self.help = PREFIX + name, help_text
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with _LOCK:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with _LOCK:
+            return self.values.get(_label_key(labels), 0)
+
+    def total(self, **labels):
+        """Sum over every label set that matches `labels`."""
+        wanted = set(_label_key(labels))
+        with _LOCK:
+            return sum(value for key, value in self.values.items() if wanted <= set(key))
+
+    def expose(self):
+        with _LOCK:
+            return [f"{self.name}{_format_labels(key)} {value:g}" for key, value in sorted(self.values.items())]
+
+
+class Histogram:
+    """Observations in cumulative buckets, with count and sum, per label set."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name, self.help = PREFIX + name, help_text
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}  # key -> [bucket counts..., +Inf count, sum]
+        self.samples = {}  # key -> latest SAMPLE_WINDOW observations
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with _LOCK:
+            entry = self.values.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+            entry[bisect.bisect_left(self.buckets, value)] += 1
+            entry[-1] += value
+            self.samples.setdefault(key, deque(maxlen=SAMPLE_WINDOW)).append(value)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started, **labels)
+
+    def summary(self, **labels):
+        """(count, sum) over every label set that matches `labels`."""
+        wanted = set(_label_key(labels))
+        with _LOCK:
+            entries = [entry for key, entry in self.values.items() if wanted <= set(key)]
+            return sum(sum(entry[:-1]) for entry in entries), sum(entry[-1] for entry in entries)
+
+    def quantiles(self, qs, **labels):
+        """Nearest-rank quantiles (e.g. 0.5, 0.95) of the recent observations matching `labels`; None without data."""
+        wanted = set(_label_key(labels))
+        with _LOCK:
+            values = sorted(v for key, window in self.samples.items() if wanted <= set(key) for v in window)
+        if not values:
+            return [None for _ in qs]
+        return [values[min(len(values), max(1, math.ceil(q * len(values)))) - 1] for q in qs]
+
+    def expose(self):
+        lines = []
+        with _LOCK:
+            for key, entry in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), entry[:-1]):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else f"{bound:g}"
+                    lines.append(f"{self.name}_bucket{_format_labels(key, [('le', le)])} {cumulative}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {entry[-1]:g}")
+        return lines
+
+
+def _register(metric):
+    _METRICS[metric.name] = metric
+    return metric
+
+# --- Metrics ---
+
+STAGE_SECONDS = _register(Histogram('stage_seconds', 'Time spent per item in each stage (fetch, download, dedupe, encode, metadata, upload).'))
+ITEMS = _register(Counter('items_total', 'Items leaving each stage, by outcome (ok, failed, skipped).'))
+RETRIES = _register(Counter('retries_total', 'Retries by stage and reason.'))
+BYTES = _register(Counter('bytes_total', 'Bytes downloaded from Instagram and uploaded to YouTube.'))
+ENCODE_FPS = _register(Histogram('encode_fps', 'Frames per second of finished encode jobs.', FPS_BUCKETS))
+API_CALLS = _register(Counter('api_calls_total', 'External API calls by service and method.'))
+METADATA_CACHE = _register(Counter('metadata_cache_total', 'Metadata cache lookups by result (hit, miss).'))
+
+def register_gauge(name, help_text, callback):
+    """Adds a gauge read at scrape time; `callback` returns a number or a list of (labels_dict, value)."""
+    _GAUGE_CALLBACKS[PREFIX + name] = (help_text, callback)
+
+# --- Exposition ---
+
+def render():
+    """The Prometheus text format (version 0.0.4) of every metric."""
+    lines = []
+    for name, metric in sorted(_METRICS.items()):
+        lines += [f"# HELP {name} {metric.help}", f"# TYPE {name} {metric.kind}"]
+        lines += metric.expose()
+    for name, (help_text, callback) in sorted(_GAUGE_CALLBACKS.items()):
+        try:
+            value = callback()
+        except Exception as e:
+            log_message("WARN", f"Metric {name} failed: {e}")
+            continue
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+        if isinstance(value, list):
+            lines += [f"{name}{_format_labels(_label_key(labels))} {v:g}" for labels, v in value]
+        else:
+            lines.append(f"{name} {value:g}")
+    return '\n'.join(lines) + '\n'
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes would flood the log
+
+def start_server(env):
+    """Serves /metrics on METRICS_HOST:METRICS_PORT from a background thread. Returns the server or None."""
+    port = int(env.get('METRICS_PORT') or DEFAULT_METRICS_PORT)
+    if not port:
+        return None
+    host = env.get('METRICS_HOST') or DEFAULT_METRICS_HOST
+    try:
+        server = ThreadingHTTPServer((host, port), _Handler)
+    except OSError as e:
+        log_message("ERROR", f"Metrics endpoint could not listen on {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    log_message("INFO", f"Metrics available at http://{host}:{port}/metrics")
+    return server
+
+# --- Human-Readable Summary (Telegram /status) ---
+
+def summary_lines():
+    """One line per stage with items, failures and average time since start, plus transfer totals."""
+    lines = []
+    for stage in ('fetch', 'download', 'dedupe', 'encode', 'metadata', 'upload'):
+        ok, failed = ITEMS.total(stage=stage, outcome='ok'), ITEMS.total(stage=stage, outcome='failed')
+        count, seconds = STAGE_SECONDS.summary(stage=stage)
+        if not (ok or failed or count):
+            continue
+        line = f"{stage.capitalize()}: {ok:g} ok, {failed:g} failed"
+        if count:
+            line += f", avg {seconds / count:.1f}s"
+        if stage == 'encode':
+            fps_count, fps_sum = ENCODE_FPS.summary()
+            if fps_count:
+                line += f", {fps_sum / fps_count:.0f} fps"
+        lines.append(line)
+    downloaded, uploaded = BYTES.total(direction='downloaded'), BYTES.total(direction='uploaded')
+    if downloaded or uploaded:
+        lines.append(f"Transferred: {downloaded / 1048576:.0f} MB down, {uploaded / 1048576:.0f} MB up")
+    retries = RETRIES.total()
+    if retries:
+        lines.append(f"Retries: {retries:g}")
+    return lines
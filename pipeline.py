@@ -0,0 +1,296 @@
+import os
+import time
+import queue
+import threading
+from contextlib import contextmanager
+from utils import log_message
+from downloader import iter_new_reels
+from dedupe import check_and_index
+from editor import run_process_job, get_pool_settings
+from ai_metadata import generate_metadata_batch
+import jobs
+import lifecycle
+import metrics
+
+# --- Configuration Defaults (override in .env) ---
+DEFAULT_QUEUE_SIZE = 4              # PIPELINE_QUEUE_SIZE: items buffered between two stages
+DEFAULT_DOWNLOAD_CAP_MB = 2048      # PIPELINE_DOWNLOAD_CAP_MB: raw downloads allowed to wait for encoding
+METADATA_BATCH_SIZE = 20            # Reels per AI metadata batch
+METADATA_BATCH_WAIT = 2.0           # Seconds the metadata stage waits to fill a batch
+
+STAGES = ('fetch', 'dedupe', 'encode', 'metadata')
+_DONE = object()  # End-of-stream marker passed down the queues
+
+# Live counters of the current (or last) run of each channel, see get_pipeline_stats()
+PIPELINE_STATS = {}
+_ACTIVE_QUEUES = {}
+_STATS_LOCK = threading.Lock()
+
+
+def _run_key(env):
+    return env.get('CHANNEL_NAME') or 'default'
+
+def _reset_stats(env, queues):
+    with _STATS_LOCK:
+        # Re-inserted so the most recently started run is last
+        PIPELINE_STATS.pop(_run_key(env), None)
+        _ACTIVE_QUEUES[_run_key(env)] = queues
+        PIPELINE_STATS[_run_key(env)] = {
+            "started_at": time.time(),
+            "finished_at": None,
+            "stages": {stage: {"in": 0, "out": 0, "failed": 0, "skipped": 0, "busy_seconds": 0.0} for stage in STAGES},
+            "download_bytes_waiting": 0,
+        }
+
+# Pipeline counters that are also exported as metrics.ITEMS outcomes
+_OUTCOMES = {"out": "ok", "failed": "failed", "skipped": "skipped"}
+
+def _count(env, stage, key, amount=1):
+    with _STATS_LOCK:
+        PIPELINE_STATS[_run_key(env)]["stages"][stage][key] += amount
+    if key in _OUTCOMES:
+        metrics.ITEMS.inc(amount, stage=stage, outcome=_OUTCOMES[key], channel=_run_key(env))
+
+@contextmanager
+def _busy(env, stage):
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        elapsed = time.monotonic() - started
+        _count(env, stage, "busy_seconds", elapsed)
+        metrics.STAGE_SECONDS.observe(elapsed, stage=stage, channel=_run_key(env))
+
+def get_pipeline_stats(channel=None):
+    """
+    Returns a snapshot of per-stage counters, throughput (items/min) and queue
+    depths of a channel's current or last run (default: the latest run started).
+    """
+    with _STATS_LOCK:
+        if not PIPELINE_STATS:
+            return {}
+        key = channel or list(PIPELINE_STATS)[-1]
+        run = PIPELINE_STATS.get(key)
+        if run is None:
+            return {}
+        elapsed = (run["finished_at"] or time.time()) - run["started_at"]
+        stages = {}
+        for stage, counters in run["stages"].items():
+            stages[stage] = dict(counters, per_minute=counters["out"] * 60 / elapsed if elapsed else 0.0)
+        return {
+            "channel": key,
+            "running": run["finished_at"] is None,
+            "elapsed_seconds": elapsed,
+            "stages": stages,
+            "queue_depths": {name: q.qsize() for name, q in _ACTIVE_QUEUES.get(key, {}).items()},
+            "download_bytes_waiting": run["download_bytes_waiting"],
+        }
+
+
+class _DiskBudget:
+    """Bytes of raw downloads waiting to be encoded; the fetch stage blocks while over the cap."""
+
+    def __init__(self, cap_bytes, env):
+        self.cap_bytes = cap_bytes
+        self.env = env
+        self.used = 0
+        self.condition = threading.Condition()
+
+    def _publish(self):
+        with _STATS_LOCK:
+            PIPELINE_STATS[_run_key(self.env)]["download_bytes_waiting"] = self.used
+
+    def wait_for_room(self):
+        with self.condition:
+            while self.used >= self.cap_bytes:
+                self.condition.wait(1.0)
+
+    def add(self, path):
+        size = os.path.getsize(path) if path and os.path.exists(path) else 0
+        with self.condition:
+            self.used += size
+            self._publish()
+        return size
+
+    def release(self, size):
+        with self.condition:
+            self.used = max(0, self.used - size)
+            self._publish()
+            self.condition.notify_all()
+
+
+# --- Stages ---
+
+def _fetch_stage(env, client, budget, out_queue):
+    """Feeds leftover 'downloaded' jobs, then new reels as each download finishes."""
+    try:
+        for job in jobs.jobs_in_state(jobs.DOWNLOADED, env):
+            job['_bytes'] = budget.add(job['download_path'])
+            _count(env, 'fetch', 'out')
+            out_queue.put(job)
+
+        reels = iter_new_reels(env, client)
+        while True:
+            # Backpressure: don't start the next download while too much is waiting on disk
+            budget.wait_for_room()
+            with _busy(env, 'fetch'):
+                reel = next(reels, None)
+            if reel is None:
+                break
+            _, metadata = reel
+            job = jobs.get_job(metadata['insta_id'], env)
+            job['_bytes'] = budget.add(job['download_path'])
+            _count(env, 'fetch', 'out')
+            out_queue.put(job)
+    except Exception as e:
+        _count(env, 'fetch', 'failed')
+        log_message("ERROR", f"Fetch stage failed: {e}")
+    finally:
+        out_queue.put(_DONE)
+
+def _dedupe_stage(env, budget, in_queue, out_queue, encode_workers):
+    try:
+        while True:
+            job = in_queue.get()
+            if job is _DONE:
+                break
+            _count(env, 'dedupe', 'in')
+            try:
+                with _busy(env, 'dedupe'):
+                    duplicate_of = check_and_index(job['insta_id'], job['download_path'], env)
+            except Exception as e:
+                log_message("WARN", f"Duplicate check failed for {job['insta_id']}: {e}. Processing anyway.")
+                duplicate_of = None
+            try:
+                if duplicate_of:
+                    budget.release(job['_bytes'])
+                    jobs.mark_duplicate(job['insta_id'], duplicate_of, env)
+                    lifecycle.on_duplicate(job['insta_id'], job['download_path'], env)
+                    _count(env, 'dedupe', 'skipped')
+                    continue
+                _count(env, 'dedupe', 'out')
+                out_queue.put(job)
+            except Exception as e:
+                # e.g. the state database is full: skip this reel, keep the stage (and the pipeline) running
+                log_message("ERROR", f"Dedupe stage could not record {job['insta_id']}: {e}")
+                _count(env, 'dedupe', 'failed')
+    finally:
+        for _ in range(encode_workers):
+            out_queue.put(_DONE)
+
+def _encode_stage(env, budget, in_queue, out_queue, threads, timeout):
+    try:
+        while True:
+            job = in_queue.get()
+            if job is _DONE:
+                break
+            _count(env, 'encode', 'in')
+            try:
+                with _busy(env, 'encode'):
+                    processed_path = run_process_job(job['download_path'], env, threads, timeout)
+            except Exception as e:
+                log_message("ERROR", f"Encode worker error for {job['download_path']}: {e}")
+                processed_path = None
+            finally:
+                budget.release(job['_bytes'])
+            try:
+                if processed_path:
+                    jobs.mark_processed(job['insta_id'], processed_path, env)
+                    lifecycle.on_processed(job['insta_id'], job['download_path'], processed_path, env)
+                    _count(env, 'encode', 'out')
+                    out_queue.put(job)
+                else:
+                    jobs.mark_failed(job['insta_id'], "processing failed", env)
+                    _count(env, 'encode', 'failed')
+                    log_message("ERROR", f"Failed to process {job['download_path']}. Skipping.")
+            except Exception as e:
+                log_message("ERROR", f"Encode stage could not record the result for {job['insta_id']}: {e}")
+                _count(env, 'encode', 'failed')
+    finally:
+        out_queue.put(_DONE)
+
+def _metadata_stage(env, in_queue, producers):
+    """Collects processed reels into batches and generates their metadata."""
+    remaining = producers
+    try:
+        # Reels processed by an earlier run that never got metadata come first
+        batch = jobs.jobs_in_state(jobs.PROCESSED, env)
+        while remaining or batch:
+            deadline = time.monotonic() + METADATA_BATCH_WAIT
+            while remaining and len(batch) < METADATA_BATCH_SIZE:
+                try:
+                    job = in_queue.get(timeout=max(0.01, deadline - time.monotonic()) if batch else None)
+                except queue.Empty:
+                    break
+                if job is _DONE:
+                    remaining -= 1
+                    continue
+                batch.append(job)
+            if not batch:
+                continue
+
+            _count(env, 'metadata', 'in', len(batch))
+            try:
+                with _busy(env, 'metadata'):
+                    all_metadata = generate_metadata_batch([job['caption'] or '' for job in batch], env)
+                for job, metadata in zip(batch, all_metadata):
+                    jobs.set_metadata(job['insta_id'], metadata, env)
+                    log_message("INFO", f"Video {job['insta_id']} added to upload queue.")
+                _count(env, 'metadata', 'out', len(batch))
+            except Exception as e:
+                log_message("ERROR", f"AI metadata generation failed: {e}")
+                for job in batch:
+                    try:
+                        jobs.mark_failed(job['insta_id'], e, env)
+                    except Exception as mark_error:
+                        log_message("ERROR", f"Could not mark {job['insta_id']} as failed: {mark_error}")
+                _count(env, 'metadata', 'failed', len(batch))
+            batch = []
+    except Exception as e:
+        # e.g. the state database is locked or corrupt. Processed reels keep their
+        # state and get metadata next run; the encoders must not block on a full queue.
+        log_message("ERROR", f"Metadata stage failed: {e}. Draining its queue until the encoders finish.")
+        while remaining:
+            if in_queue.get() is _DONE:
+                remaining -= 1
+
+
+def run_pipeline(env, client=None):
+    """
+    Runs fetch -> dedupe -> encode -> metadata as concurrent stages joined by
+    bounded queues, so encoding starts while later reels are still downloading.
+    Ready reels end up in the job table as 'metadata_ready'. Returns the stats.
+    """
+    queue_size = max(1, int(env.get('PIPELINE_QUEUE_SIZE') or DEFAULT_QUEUE_SIZE))
+    cap_bytes = float(env.get('PIPELINE_DOWNLOAD_CAP_MB') or DEFAULT_DOWNLOAD_CAP_MB) * 1024 * 1024
+    workers, threads, timeout = get_pool_settings(env)
+
+    to_dedupe, to_encode, to_metadata = (queue.Queue(maxsize=queue_size) for _ in range(3))
+    _reset_stats(env, {"dedupe": to_dedupe, "encode": to_encode, "metadata": to_metadata})
+    budget = _DiskBudget(cap_bytes, env)
+
+    stage_threads = [
+        threading.Thread(target=_fetch_stage, args=(env, client, budget, to_dedupe), name='pipeline-fetch'),
+        threading.Thread(target=_dedupe_stage, args=(env, budget, to_dedupe, to_encode, workers), name='pipeline-dedupe'),
+        *(
+            threading.Thread(target=_encode_stage, args=(env, budget, to_encode, to_metadata, threads, timeout), name=f'pipeline-encode-{i}')
+            for i in range(workers)
+        ),
+        threading.Thread(target=_metadata_stage, args=(env, to_metadata, workers), name='pipeline-metadata'),
+    ]
+    log_message("INFO", f"Pipeline started: {workers} encode workers, queue size {queue_size}, download cap {cap_bytes / 1048576:.0f} MB.")
+    for thread in stage_threads:
+        thread.start()
+    for thread in stage_threads:
+        thread.join()
+
+    with _STATS_LOCK:
+        PIPELINE_STATS[_run_key(env)]["finished_at"] = time.time()
+    lifecycle.enforce_quota(env)
+    stats = get_pipeline_stats(_run_key(env))
+    summary = ', '.join(
+        f"{stage} {counters['out']} ok/{counters['failed']} failed ({counters['per_minute']:.1f}/min)"
+        for stage, counters in stats["stages"].items()
+    )
+    log_message("INFO", f"Pipeline finished in {stats['elapsed_seconds']:.0f}s: {summary}.")
+    return stats
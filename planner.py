@@ -0,0 +1,204 @@
+import os
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from storage import state_db_path, transaction, query
+from ledger import record_upload, publishing_counts, publish_times_since
+import jobs
+import lifecycle
+import quota
+
+# --- Configuration Defaults (override in .env or per channel) ---
+DEFAULT_UPLOAD_MODE = 'slots'       # UPLOAD_MODE: slots (upload at each slot) | plan (week planner below)
+DEFAULT_PLAN_DAYS = 7               # PLAN_DAYS: how many days ahead slots are filled
+DEFAULT_PLAN_TIME = '03:00'         # PLAN_UPLOAD_TIME: daily planning + batch upload, in an off-peak window
+DEFAULT_PLAN_WORKERS = 2            # PLAN_UPLOAD_WORKERS: uploads running at once within one batch
+DEFAULT_PLAN_LEAD_MINUTES = 30      # PLAN_LEAD_MINUTES: slots closer than this are not planned (publishAt must be ahead)
+
+# --- Week Planner ---
+# In UPLOAD_MODE=plan, the ready backlog is assigned to the upload slots of the
+# next PLAN_DAYS days (at most MAX_DAILY per day) and uploaded in one batch as
+# private videos with publishAt set to their slot. YouTube publishes them at
+# that time, so the upload itself can run whenever bandwidth is cheap.
+
+PLANNED = 'planned'
+UPLOADED = 'uploaded'
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS upload_plan (
+        insta_id TEXT PRIMARY KEY,
+        publish_at TEXT NOT NULL,
+        state TEXT NOT NULL,
+        youtube_url TEXT,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS upload_plan_publish_idx ON upload_plan (publish_at)",
+)
+
+_READY = set()
+
+def _db(env=None):
+    path = state_db_path(env)
+    if path not in _READY:
+        with transaction(path) as conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+        _READY.add(path)
+    return path
+
+def enabled(env):
+    return (env.get('UPLOAD_MODE') or DEFAULT_UPLOAD_MODE).strip().lower() == 'plan'
+
+def plan_time(env):
+    return (env.get('PLAN_UPLOAD_TIME') or DEFAULT_PLAN_TIME).strip()
+
+def scheduled_per_day(env, since_day):
+    """
+    Videos publishing per day ('YYYY-MM-DD' -> count) from `since_day` on: uploads
+    by their publish date plus planned items. MAX_DAILY applies to this count,
+    for slot uploads as well as planned ones.
+    """
+    counts = publishing_counts(since_day, env)
+    rows = query(
+        _db(env), "SELECT substr(publish_at, 1, 10) AS day, COUNT(*) AS n FROM upload_plan WHERE state = ? GROUP BY day HAVING day >= ?",
+        (PLANNED, since_day.isoformat()),
+    )
+    for row in rows:
+        counts[row['day']] = counts.get(row['day'], 0) + row['n']
+    return counts
+
+def rfc3339_utc(local_time):
+    """A naive local datetime as the RFC 3339 UTC timestamp publishAt expects."""
+    return local_time.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+# --- Planning ---
+
+def _release_missed(channel, lead):
+    """Planned items whose slot is (nearly) here without an upload go back to the queue."""
+    rows = query(
+        _db(channel.env), "SELECT insta_id, publish_at FROM upload_plan WHERE state = ? AND publish_at <= ?",
+        (PLANNED, lead.isoformat()),
+    )
+    for row in rows:
+        job = jobs.get_job(row['insta_id'], channel.env)
+        if job and job['state'] == jobs.PLANNED:
+            jobs.mark_ready(row['insta_id'], channel.env)
+        channel.log("WARN", f"Planned upload {row['insta_id']} missed its {row['publish_at'][:16]} slot. Planning it again.")
+    # Jobs that failed for good free their slot as well
+    failed = [job['insta_id'] for job in jobs.jobs_in_state(jobs.FAILED, channel.env)]
+    with transaction(_db(channel.env)) as conn:
+        conn.executemany("DELETE FROM upload_plan WHERE insta_id = ?", [(row['insta_id'],) for row in rows])
+        conn.executemany("DELETE FROM upload_plan WHERE insta_id = ? AND state = ?", [(insta_id, PLANNED) for insta_id in failed])
+
+def free_slots(channel, days, now=None):
+    """Yields the open slot datetimes of the next `days` days, oldest first, at most MAX_DAILY per day."""
+    now = now or datetime.now()
+    lead = now + timedelta(minutes=float(channel.env.get('PLAN_LEAD_MINUTES') or DEFAULT_PLAN_LEAD_MINUTES))
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    rows = query(_db(channel.env), "SELECT publish_at FROM upload_plan WHERE publish_at >= ?", (midnight.isoformat(),))
+    # Minutes already used by planned, manual and slot uploads
+    taken = {row['publish_at'][:16] for row in rows} | publish_times_since(midnight, channel.env)
+    # Manual and slot uploads publishing on a day take from its MAX_DAILY too
+    per_day = scheduled_per_day(channel.env, now.date())
+
+    for offset in range(days):
+        day = now.date() + timedelta(days=offset)
+        for slot in sorted(channel.upload_slots):
+            hour, minute = map(int, slot.split(':'))
+            at = datetime(day.year, day.month, day.day, hour, minute)
+            if per_day.get(day.isoformat(), 0) >= channel.max_daily:
+                break
+            if at <= lead or at.isoformat()[:16] in taken:
+                continue
+            per_day[day.isoformat()] = per_day.get(day.isoformat(), 0) + 1
+            yield at
+
+def build_plan(channel, days=None, now=None, dry_run=False):
+    """Assigns ready reels (oldest first) to open slots. Returns [(insta_id, publish_at)] of the new assignments."""
+    now = now or datetime.now()
+    days = int(days or channel.env.get('PLAN_DAYS') or DEFAULT_PLAN_DAYS)
+    if not dry_run:
+        _release_missed(channel, now + timedelta(minutes=float(channel.env.get('PLAN_LEAD_MINUTES') or DEFAULT_PLAN_LEAD_MINUTES)))
+
+    assignments = list(zip(
+        (job['insta_id'] for job in jobs.jobs_in_state(jobs.METADATA_READY, channel.env)),
+        free_slots(channel, days, now),
+    ))
+    if dry_run or not assignments:
+        return assignments
+
+    stamp = datetime.now().isoformat()
+    with transaction(_db(channel.env)) as conn:
+        conn.executemany(
+            """INSERT OR REPLACE INTO upload_plan (insta_id, publish_at, state, created_at, updated_at)
+               VALUES (?, ?, ?, ?, ?)""",
+            [(insta_id, at.isoformat(), PLANNED, stamp, stamp) for insta_id, at in assignments],
+        )
+    for insta_id, _ in assignments:
+        jobs.mark_planned(insta_id, channel.env)
+    channel.log("INFO", f"Planned {len(assignments)} uploads for the next {days} days.")
+    return assignments
+
+def planned(env, state=PLANNED):
+    """Plan entries in `state`, in publishing order."""
+    rows = query(_db(env), "SELECT * FROM upload_plan WHERE state = ? ORDER BY publish_at", (state,))
+    return [dict(row) for row in rows]
+
+# --- Batch Upload ---
+
+def _upload_planned(channel, entry):
+    from uploader import upload_video
+
+    job = jobs.get_job(entry['insta_id'], channel.env)
+    if not job or job['state'] != jobs.PLANNED:
+        return False
+    publish_at = datetime.fromisoformat(entry['publish_at'])
+    yt_url = upload_video(job['processed_path'], job['metadata'], rfc3339_utc(publish_at), channel.env)
+    if not yt_url:
+        jobs.mark_failed(job['insta_id'], "planned upload failed", channel.env)
+        return False
+
+    record_upload(job['insta_id'], {
+        "filename": os.path.basename(job['processed_path']),
+        "timestamp": datetime.now().isoformat(),
+        "youtube_url": yt_url,
+        "scheduled_for": publish_at.strftime("%a %d %b %I:%M %p"),
+        "publish_at": publish_at.isoformat(),
+    }, channel.env)
+    jobs.mark_uploaded(job['insta_id'], channel.env)
+    lifecycle.on_uploaded(job['insta_id'], job['processed_path'], channel.env)
+    with transaction(_db(channel.env)) as conn:
+        conn.execute(
+            "UPDATE upload_plan SET state = ?, youtube_url = ?, updated_at = ? WHERE insta_id = ?",
+            (UPLOADED, yt_url, datetime.now().isoformat(), job['insta_id']),
+        )
+    channel.log("SUCCESS", f"Uploaded {job['insta_id']} for {publish_at.strftime('%a %H:%M')}: {yt_url}")
+    return True
+
+def upload_batch(channel):
+    """Uploads every planned item (soonest slot first), PLAN_UPLOAD_WORKERS at a time, while the quota lasts."""
+    entries = planned(channel.env)
+    affordable = quota.remaining(channel.env) // max(1, quota.cost('videos.insert', channel.env))
+    if len(entries) > affordable:
+        # The rest is uploaded by a later run, still ahead of its slot where possible
+        channel.log("WARN", f"YouTube API quota covers {affordable} of {len(entries)} planned uploads today.")
+        entries = entries[:affordable]
+    if not entries:
+        return 0
+
+    workers = max(1, int(channel.env.get('PLAN_UPLOAD_WORKERS') or DEFAULT_PLAN_WORKERS))
+    channel.log("INFO", f"Uploading {len(entries)} planned videos with {workers} workers.")
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'plan-{channel.name}') as pool:
+        uploaded = sum(pool.map(lambda entry: _upload_planned(channel, entry), entries))
+    channel.log("INFO", f"Planned batch finished: {uploaded}/{len(entries)} uploaded.")
+    return uploaded
+
+def run_planner(channel, days=None):
+    """The daily plan job: fill the next days' slots, then upload everything planned."""
+    if channel.paused:
+        channel.log("WARN", "Automation is paused. Skipping planning run.")
+        return 0
+    # Planning takes jobs from the queue manual uploads also take from
+    with channel.lock:
+        build_plan(channel, days)
+    return upload_batch(channel)
@@ -0,0 +1,127 @@
+import os
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from storage import state_db_path, transaction, query
+from utils import log_message
+import metrics
+
+# --- Configuration Defaults (override in .env) ---
+DEFAULT_DAILY_QUOTA = 10000         # YT_DAILY_QUOTA: units per Google Cloud project and day
+DEFAULT_UPLOAD_COST = 1600          # YT_UPLOAD_COST: units charged per videos.insert
+
+# YouTube Data API v3 unit costs of the calls this project makes (YT_UPLOAD_COST overrides videos.insert)
+API_COSTS = {
+    'videos.insert': DEFAULT_UPLOAD_COST,
+    'videos.list': 1,
+    'videos.update': 50,
+    'thumbnails.set': 50,
+}
+
+# The quota resets at midnight Pacific Time
+try:
+    QUOTA_TIMEZONE = ZoneInfo('America/Los_Angeles')
+except ZoneInfoNotFoundError:
+    QUOTA_TIMEZONE = timezone(timedelta(hours=-8))
+
+# --- Schema ---
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS quota_usage (
+        day TEXT NOT NULL,
+        project TEXT NOT NULL,
+        method TEXT NOT NULL,
+        calls INTEGER NOT NULL DEFAULT 0,
+        units INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, project, method)
+    )""",
+)
+
+# Marker row written when the API itself reports the quota as exhausted
+EXHAUSTED = 'quotaExceeded'
+
+_READY = set()
+
+def _db(env=None):
+    # Channels sharing a Google Cloud project share its quota, so the usage lives in
+    # QUOTA_DB (set to the main state.db for every channel, see channels.py)
+    path = (env or {}).get('QUOTA_DB') or state_db_path(env)
+    if path not in _READY:
+        with transaction(path) as conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+        _READY.add(path)
+    return path
+
+def _project(env):
+    """Quota is per Google Cloud project, i.e. per OAuth client (YT_QUOTA_PROJECT to override)."""
+    return (env or {}).get('YT_QUOTA_PROJECT') or os.path.basename((env or {}).get('GOOGLE_CLIENT_SECRETS') or 'default')
+
+def quota_day(now=None):
+    """The current quota day (Pacific Time) as YYYY-MM-DD."""
+    return (now or datetime.now(timezone.utc)).astimezone(QUOTA_TIMEZONE).strftime('%Y-%m-%d')
+
+def seconds_until_reset(now=None):
+    """Seconds until the next quota reset (midnight Pacific Time)."""
+    now = (now or datetime.now(timezone.utc)).astimezone(QUOTA_TIMEZONE)
+    reset = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (reset - now).total_seconds()
+
+# --- Quota API ---
+
+def daily_limit(env):
+    return int((env or {}).get('YT_DAILY_QUOTA') or DEFAULT_DAILY_QUOTA)
+
+def cost(method, env=None):
+    if method == 'videos.insert':
+        return int((env or {}).get('YT_UPLOAD_COST') or DEFAULT_UPLOAD_COST)
+    return API_COSTS.get(method, 1)
+
+def used_today(env=None):
+    """Units spent by this project in the current quota day."""
+    rows = query(
+        _db(env), "SELECT method, units FROM quota_usage WHERE day = ? AND project = ?", (quota_day(), _project(env))
+    )
+    if any(row['method'] == EXHAUSTED for row in rows):
+        return max(daily_limit(env), sum(row['units'] for row in rows))
+    return sum(row['units'] for row in rows)
+
+def remaining(env=None):
+    return max(0, daily_limit(env) - used_today(env))
+
+def can_afford(method, env=None):
+    return remaining(env) >= cost(method, env)
+
+def charge(method, env=None):
+    """Records one API call and its unit cost against today's quota. Returns the units charged."""
+    units = cost(method, env)
+    metrics.API_CALLS.inc(service='youtube', method=method)
+    with transaction(_db(env)) as conn:
+        conn.execute(
+            """INSERT INTO quota_usage (day, project, method, calls, units) VALUES (?, ?, ?, 1, ?)
+               ON CONFLICT(day, project, method) DO UPDATE SET
+                   calls = calls + 1,
+                   units = units + excluded.units""",
+            (quota_day(), _project(env), method, units),
+        )
+    return units
+
+def mark_exhausted(env=None):
+    """The API answered quotaExceeded: treat the rest of the quota day as spent."""
+    with transaction(_db(env)) as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO quota_usage (day, project, method, calls, units) VALUES (?, ?, ?, 0, 0)",
+            (quota_day(), _project(env), EXHAUSTED),
+        )
+    log_message("WARN", f"YouTube API quota exhausted for {_project(env)}. Next reset in {seconds_until_reset() / 3600:.1f}h.")
+
+def usage_report(env=None):
+    """Returns {'day', 'used', 'limit', 'calls': {method: count}} for the current quota day."""
+    rows = query(
+        _db(env), "SELECT method, calls FROM quota_usage WHERE day = ? AND project = ?", (quota_day(), _project(env))
+    )
+    return {
+        "day": quota_day(),
+        "used": used_today(env),
+        "limit": daily_limit(env),
+        "calls": {row['method']: row['calls'] for row in rows if row['method'] != EXHAUSTED},
+    }
@@ -0,0 +1,117 @@
+import os
+from storage import (
+    state_db_path, check_database, load_json, write_json, remove_stale_temp_files,
+    OK, MISSING, RESTORED, QUARANTINED, UNREADABLE,
+)
+from utils import log_message
+import jobs
+import lifecycle
+import segment_cache
+from downloader import DEFAULT_SESSION_PATH, DEFAULT_USER_ID_CACHE_PATH
+from uploader import DEFAULT_TOKEN_PATH, DEFAULT_UPLOAD_SESSIONS_PATH
+
+# --- Startup State Check ---
+# Runs before the scheduler starts: every store of a channel is read and
+# verified (checksums, SQLite quick_check), corrupt files are restored from
+# their backup or rebuilt from the job table, and temp files of interrupted
+# writes are removed. Nothing is reset to empty without a log line.
+
+def _json_stores(env):
+    return {
+        "YouTube token": env.get('YT_TOKEN_PATH') or DEFAULT_TOKEN_PATH,
+        "upload sessions": env.get('UPLOAD_SESSIONS_PATH') or DEFAULT_UPLOAD_SESSIONS_PATH,
+        "Instagram session": env.get('INSTAGRAM_SESSION_PATH', DEFAULT_SESSION_PATH),
+        "user-id cache": env.get('INSTAGRAM_USER_ID_CACHE', DEFAULT_USER_ID_CACHE_PATH),
+    }
+
+def _rebuild_sidecar(sidecar, env):
+    """Writes a corrupt download sidecar again from its job row. Returns True on success."""
+    stem = os.path.splitext(sidecar)[0]
+    directory = os.path.dirname(sidecar) or '.'
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if os.path.splitext(path)[0] != stem or path == sidecar or '.json' in name:
+            continue
+        job = jobs.find_by_download_path(path, env)
+        if job:
+            write_json(sidecar, {
+                "insta_id": job['insta_id'],
+                "source_account": job['source_account'],
+                "caption": job['caption'] or "",
+                "file_path": job['download_path'],
+                "processed": job['state'] != jobs.DOWNLOADED,
+            }, backup=False)
+            return True
+    return False
+
+def _check_sidecars(env, report):
+    download_dir = env['DOWNLOAD_DIR']
+    if not os.path.isdir(download_dir):
+        return
+    for name in sorted(os.listdir(download_dir)):
+        if not name.endswith('.json'):
+            continue
+        sidecar = os.path.join(download_dir, name)
+        _, status = load_json(sidecar)
+        if status == QUARANTINED and _rebuild_sidecar(sidecar, env):
+            log_message("INFO", f"Rebuilt {sidecar} from the job table.")
+            status = RESTORED
+        report[status] = report.get(status, 0) + 1
+
+def _check_segment_cache(env, report):
+    """Drops empty cached segments (renamed before their data reached the disk)."""
+    cache_dir = env.get('SEGMENT_CACHE_DIR', segment_cache.DEFAULT_CACHE_DIR)
+    if not os.path.isdir(cache_dir):
+        return
+    for entry in os.scandir(cache_dir):
+        if entry.is_file() and entry.name.endswith('.mp4') and entry.stat().st_size == 0:
+            os.remove(entry.path)
+            log_message("WARN", f"Removed empty cached segment {entry.path}; it will be rendered again.")
+            report[QUARANTINED] = report.get(QUARANTINED, 0) + 1
+
+def repair_state(env):
+    """
+    Checks every on-disk store of one channel and repairs what it can.
+    Returns {status: count} over the JSON stores and sidecars, plus
+    'temp_files_removed' and 'database_problems'.
+    """
+    report = {}
+
+    databases = {state_db_path(env), env.get('QUOTA_DB') or state_db_path(env)}
+    problems = []
+    for path in sorted(databases):
+        if os.path.exists(path):
+            found = check_database(path)
+            for problem in found:
+                log_message("ERROR", f"Database {path} failed its integrity check: {problem}")
+            problems += found
+    report['database_problems'] = len(problems)
+
+    for label, path in _json_stores(env).items():
+        _, status = load_json(path)
+        if status == QUARANTINED and label == "YouTube token":
+            log_message("ERROR", "The YouTube token could not be recovered; the next upload will ask to sign in again.")
+        report[status] = report.get(status, 0) + 1
+
+    _check_sidecars(env, report)
+    _check_segment_cache(env, report)
+
+    # Temp files of writes that were interrupted by a crash
+    directories = {os.path.dirname(path) or '.' for path in _json_stores(env).values()}
+    directories |= {env['DOWNLOAD_DIR'], env['PROCESS_DIR'], env.get('SEGMENT_CACHE_DIR', segment_cache.DEFAULT_CACHE_DIR)}
+    removed = []
+    for directory in sorted(directories):
+        removed += remove_stale_temp_files(directory)
+    report['temp_files_removed'] = len(removed)
+    if removed:
+        lifecycle.reconcile(env, force=True)
+
+    repaired = report.get(RESTORED, 0) + report.get(QUARANTINED, 0)
+    level = "WARN" if repaired or problems or report.get(UNREADABLE) else "INFO"
+    log_message(
+        level,
+        f"State check: {report.get(OK, 0)} stores ok, {report.get(MISSING, 0)} not created yet, "
+        f"{report.get(RESTORED, 0)} restored, {report.get(QUARANTINED, 0)} moved aside, {report.get(UNREADABLE, 0)} unreadable, "
+        f"{len(removed)} temp files removed, {len(problems)} database problems.",
+    )
+    return report
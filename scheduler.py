@@ -0,0 +1,289 @@
+import asyncio
+import time
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from concurrent.futures import Executor, Future
+from storage import state_db_path, transaction, query
+from utils import log_message
+
+# --- Configuration Defaults (override in .env) ---
+DEFAULT_MISSED_SLOT_POLICY = 'run_once'   # MISSED_SLOT_POLICY: run_once | skip
+DEFAULT_CATCHUP_WINDOW_HOURS = 6          # CATCHUP_WINDOW_HOURS: older missed slots are skipped
+DEFAULT_CHANNEL_PIPELINES = 1             # CHANNEL_PIPELINES: download/process runs (one per channel) at a time
+DEFAULT_UPLOAD_WORKERS = 1                # UPLOAD_WORKERS: uploads (any channel) at a time
+
+# Executors: long CPU/network work and uploads get separate pools, so a long
+# download/encode run can never hold up an upload slot.
+CPU = 'cpu'
+UPLOAD = 'upload'
+
+# --- Schema (last run per job, for catch-up after a restart) ---
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS scheduler_runs (
+        name TEXT PRIMARY KEY,
+        last_run REAL NOT NULL
+    )""",
+)
+
+_READY = set()
+
+def _db(env=None):
+    path = state_db_path(env)
+    if path not in _READY:
+        with transaction(path) as conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+        _READY.add(path)
+    return path
+
+def _parse_time(time_str):
+    hour, minute = map(int, time_str.split(':'))
+    return hour, minute
+
+def next_occurrence(time_str, after):
+    """The first datetime at HH:MM strictly after `after` (local time)."""
+    hour, minute = _parse_time(time_str)
+    candidate = after.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    return candidate if candidate > after else candidate + timedelta(days=1)
+
+def previous_occurrence(time_str, before):
+    """The last datetime at HH:MM at or before `before` (local time)."""
+    hour, minute = _parse_time(time_str)
+    candidate = before.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    return candidate if candidate <= before else candidate - timedelta(days=1)
+
+
+class FairExecutor(Executor):
+    """
+    Thread pool shared by several tenants (channels) that serves them
+    round-robin: each free worker takes the next job of the tenant after the
+    one served last, so a channel with many queued jobs can't starve the rest
+    and no channel is always first when their slots fire together.
+    """
+
+    def __init__(self, max_workers, thread_name_prefix):
+        self.max_workers = max(1, int(max_workers))
+        self.thread_name_prefix = thread_name_prefix
+        self.lanes = {}       # tenant -> deque of (future, fn, args, kwargs)
+        self.order = []       # tenants in first-seen order; the lanes are kept so the rotation persists
+        self.position = 0
+        self.threads = []
+        self.condition = threading.Condition()
+        self.closed = False
+
+    def submit(self, fn, *args, **kwargs):
+        return self.submit_for(None, fn, *args, **kwargs)
+
+    def submit_for(self, tenant, fn, *args, **kwargs):
+        future = Future()
+        with self.condition:
+            if self.closed:
+                raise RuntimeError('cannot schedule new jobs after shutdown')
+            if tenant not in self.lanes:
+                self.lanes[tenant] = deque()
+                self.order.append(tenant)
+            self.lanes[tenant].append((future, fn, args, kwargs))
+            if len(self.threads) < self.max_workers:
+                thread = threading.Thread(
+                    target=self._worker, name=f"{self.thread_name_prefix}-{len(self.threads)}", daemon=True
+                )
+                self.threads.append(thread)
+                thread.start()
+            self.condition.notify()
+        return future
+
+    def _next_item(self):
+        """Pops the next job round-robin over the tenants (condition held)."""
+        for offset in range(len(self.order)):
+            index = (self.position + offset) % len(self.order)
+            lane = self.lanes[self.order[index]]
+            if lane:
+                self.position = index + 1
+                return lane.popleft()
+        return None
+
+    def pending(self):
+        with self.condition:
+            return {tenant: len(lane) for tenant, lane in self.lanes.items() if lane}
+
+    def _worker(self):
+        while True:
+            with self.condition:
+                item = self._next_item()
+                while item is None:
+                    if self.closed:
+                        return
+                    self.condition.wait()
+                    item = self._next_item()
+            future, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        with self.condition:
+            self.closed = True
+            if cancel_futures:
+                for lane in self.lanes.values():
+                    while lane:
+                        lane.popleft()[0].cancel()
+            self.condition.notify_all()
+        if wait:
+            for thread in self.threads:
+                thread.join()
+
+
+class AsyncScheduler:
+    """
+    Event-driven daily scheduler: sleeps until the next deadline instead of
+    polling, and runs each job in its executor so the event loop (and the
+    Telegram bot on it) stays responsive. Coroutine functions run on the loop.
+    Jobs carry a `tenant` (channel name); each executor serves tenants fairly.
+    """
+
+    def __init__(self, env):
+        self.env = env
+        self.jobs = []
+        self.once = []
+        self.running = set()
+        self.executors = {
+            CPU: FairExecutor(env.get('CHANNEL_PIPELINES') or DEFAULT_CHANNEL_PIPELINES, 'sched-cpu'),
+            UPLOAD: FairExecutor(env.get('UPLOAD_WORKERS') or DEFAULT_UPLOAD_WORKERS, 'sched-upload'),
+        }
+        self._loop = None
+        self._wakeup = None
+        self._tasks = set()
+        self._lock = threading.Lock()
+
+    # --- Registration ---
+
+    def every_day_at(self, time_str, func, name=None, executor=CPU, catch_up=True, tenant=None):
+        _parse_time(time_str)  # validate early
+        self.jobs.append({
+            "name": name or f"{func.__name__}@{time_str}",
+            "time": time_str,
+            "func": func,
+            "executor": executor,
+            "catch_up": catch_up,
+            "tenant": tenant,
+            "next_run": next_occurrence(time_str, datetime.now()),
+        })
+        self._wake()
+
+    def run_now(self, func, name, executor=CPU, tenant=None):
+        """Runs a job as soon as possible (thread-safe, callable from any thread)."""
+        self.call_later(0, func, name, executor, tenant)
+
+    def call_later(self, delay_seconds, func, name, executor=CPU, tenant=None):
+        """Schedules a one-off job `delay_seconds` from now (thread-safe)."""
+        with self._lock:
+            self.once.append({
+                "name": name, "func": func, "executor": executor, "tenant": tenant,
+                "next_run": datetime.now() + timedelta(seconds=delay_seconds),
+            })
+        self._wake()
+
+    def _wake(self):
+        if self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    # --- Execution ---
+
+    def _record_run(self, name):
+        with transaction(_db(self.env)) as conn:
+            conn.execute("INSERT OR REPLACE INTO scheduler_runs (name, last_run) VALUES (?, ?)", (name, time.time()))
+
+    def _last_run(self, name):
+        rows = query(_db(self.env), "SELECT last_run FROM scheduler_runs WHERE name = ?", (name,))
+        return datetime.fromtimestamp(rows[0]['last_run']) if rows else None
+
+    async def _execute(self, job):
+        name = job['name']
+        if name in self.running:
+            log_message("WARN", f"Job {name} is still running. Skipping this run.")
+            return
+        self.running.add(name)
+        started = time.monotonic()
+        try:
+            if asyncio.iscoroutinefunction(job['func']):
+                await job['func']()
+            else:
+                await asyncio.wrap_future(self.executors[job['executor']].submit_for(job['tenant'], job['func']))
+            if 'time' in job:
+                self._record_run(name)
+        except Exception as e:
+            log_message("ERROR", f"Scheduled job {name} failed: {e}")
+        finally:
+            self.running.discard(name)
+            log_message("INFO", f"Job {name} finished in {time.monotonic() - started:.1f}s.")
+
+    def _spawn(self, job):
+        task = self._loop.create_task(self._execute(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _catch_up(self):
+        """Runs (once) the daily slots that were missed while the process was down."""
+        policy = (self.env.get('MISSED_SLOT_POLICY') or DEFAULT_MISSED_SLOT_POLICY).strip().lower()
+        window = timedelta(hours=float(self.env.get('CATCHUP_WINDOW_HOURS') or DEFAULT_CATCHUP_WINDOW_HOURS))
+        now = datetime.now()
+        for job in self.jobs:
+            if not job['catch_up']:
+                continue
+            missed = previous_occurrence(job['time'], now)
+            last_run = self._last_run(job['name'])
+            if last_run and last_run >= missed:
+                continue
+            if last_run is None and now - missed > window:
+                continue
+            if policy == 'run_once' and now - missed <= window:
+                log_message("WARN", f"Missed slot {job['name']} ({missed.strftime('%Y-%m-%d %H:%M')}). Catching up now.")
+                self._spawn(job)
+            else:
+                log_message("WARN", f"Missed slot {job['name']} ({missed.strftime('%Y-%m-%d %H:%M')}). Skipped by policy.")
+
+    async def run(self):
+        """Runs forever: sleeps until the next deadline, then starts every due job."""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._catch_up()
+        log_message("INFO", f"Async scheduler running with {len(self.jobs)} daily jobs.")
+
+        while True:
+            # Cleared before looking at the jobs, so a job added meanwhile still wakes us
+            self._wakeup.clear()
+            now = datetime.now()
+            for job in self.jobs:
+                if job['next_run'] <= now:
+                    job['next_run'] = next_occurrence(job['time'], now)
+                    self._spawn(job)
+            with self._lock:
+                due = [job for job in self.once if job['next_run'] <= now]
+                self.once = [job for job in self.once if job['next_run'] > now]
+                deadlines = [job['next_run'] for job in self.jobs + self.once]
+            for job in due:
+                self._spawn(job)
+
+            sleep_for = max(0.0, (min(deadlines) - datetime.now()).total_seconds()) if deadlines else 3600
+            try:
+                # Wall-clock jumps (suspend, DST) are caught by capping the sleep
+                await asyncio.wait_for(self._wakeup.wait(), timeout=min(sleep_for, 300))
+            except asyncio.TimeoutError:
+                pass
+
+    def next_runs(self):
+        """(name, next_run) for every scheduled job, soonest first."""
+        with self._lock:
+            entries = [(job['name'], job['next_run']) for job in self.jobs + self.once]
+        return sorted(entries, key=lambda entry: entry[1])
+
+    def shutdown(self):
+        for executor in self.executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,88 @@
+import os
+import json
+import hashlib
+import threading
+from utils import log_message
+
+# Pre-scaled, pre-encoded intro/outro segments live here, one file per cache key
+DEFAULT_CACHE_DIR = os.path.join('cache', 'segments')
+DEFAULT_MAX_MB = 512
+
+_DIGEST_MEMO = {}
+_LOCK = threading.Lock()
+
+def file_digest(path):
+    """Returns the sha256 of a file, memoized on (path, size, mtime) so unchanged files are hashed once."""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    digest = _DIGEST_MEMO.get(memo_key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        _DIGEST_MEMO[memo_key] = digest
+    return digest
+
+def segment_key(source_path, size, encode_params):
+    """Content-addressed key: source file hash + target resolution + codec parameters."""
+    payload = json.dumps(
+        {"source": file_digest(source_path), "size": list(size), "params": encode_params},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+def get_segment(source_path, size, encode_params, render, env):
+    """
+    Returns the path of a cached segment for `source_path`, rendering it on a miss.
+
+    `render(dest_path)` must write the normalized segment to `dest_path`.
+    """
+    cache_dir = env.get('SEGMENT_CACHE_DIR', DEFAULT_CACHE_DIR)
+    os.makedirs(cache_dir, exist_ok=True)
+    key = segment_key(source_path, size, encode_params)
+    cached_path = os.path.join(cache_dir, f"{key}.mp4")
+
+    if os.path.exists(cached_path):
+        # Touch so eviction treats it as recently used
+        os.utime(cached_path, None)
+        return cached_path
+
+    log_message("INFO", f"Segment cache miss for {os.path.basename(source_path)} at {size[0]}x{size[1]}. Rendering.")
+    # Render to a per-process temp name and rename, so parallel workers never read a partial file
+    tmp_path = os.path.join(cache_dir, f"{key}.{os.getpid()}.{threading.get_ident()}.tmp.mp4")
+    try:
+        render(tmp_path)
+        os.replace(tmp_path, cached_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    evict(env, keep=cached_path)
+    return cached_path
+
+def evict(env, keep=None):
+    """Deletes least recently used segments until the cache fits in SEGMENT_CACHE_MAX_MB."""
+    cache_dir = env.get('SEGMENT_CACHE_DIR', DEFAULT_CACHE_DIR)
+    max_bytes = float(env.get('SEGMENT_CACHE_MAX_MB') or DEFAULT_MAX_MB) * 1024 * 1024
+
+    with _LOCK:
+        entries = []
+        for entry in os.scandir(cache_dir):
+            if entry.is_file() and entry.name.endswith('.mp4') and '.tmp.' not in entry.name:
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            if keep and os.path.abspath(path) == os.path.abspath(keep):
+                continue
+            try:
+                os.remove(path)
+                total -= size
+                log_message("INFO", f"Evicted cached segment {os.path.basename(path)}.")
+            except FileNotFoundError:
+                total -= size
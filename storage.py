@@ -0,0 +1,247 @@
+import os
+import time
+import json
+import atexit
+import shutil
+import hashlib
+import sqlite3
+import threading
+from contextlib import contextmanager
+from utils import log_message
+
+# --- Configuration Constants ---
+DEFAULT_STATE_DB = 'state.db'
+FSYNC_BATCH_SIZE = 32          # Deferred fsyncs are flushed together once this many are pending...
+FSYNC_BATCH_SECONDS = 5.0      # ...or the oldest has waited this long (and at exit)
+STALE_TEMP_SECONDS = 60        # Temp files older than this at startup belong to interrupted writes
+
+_CONNECTIONS = {}
+_REGISTRY_LOCK = threading.Lock()
+
+def state_db_path(env=None):
+    """Returns the SQLite state database path (STATE_DB in .env, default state.db)."""
+    return (env or {}).get('STATE_DB') or DEFAULT_STATE_DB
+
+def get_connection(path):
+    """
+    Returns (connection, lock) for the SQLite database at `path`.
+
+    One connection is shared per process and path; callers must hold the lock
+    while using it. The database runs in WAL mode with full fsync on commit.
+    """
+    key = (os.getpid(), os.path.abspath(path))
+    with _REGISTRY_LOCK:
+        if key not in _CONNECTIONS:
+            # Drop connections inherited from a parent process (fork)
+            for stale in [k for k in _CONNECTIONS if k[0] != key[0]]:
+                del _CONNECTIONS[stale]
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=FULL')
+            _CONNECTIONS[key] = (conn, threading.RLock())
+        return _CONNECTIONS[key]
+
+@contextmanager
+def transaction(path):
+    """Runs the enclosed statements in one atomic write transaction and yields the connection."""
+    conn, lock = get_connection(path)
+    with lock:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+def query(path, sql, params=()):
+    """Runs a read-only query and returns all rows."""
+    conn, lock = get_connection(path)
+    with lock:
+        return conn.execute(sql, params).fetchall()
+
+def check_database(path):
+    """Runs SQLite's quick_check; returns the list of problems (empty when the database is sound)."""
+    rows = query(path, 'PRAGMA quick_check')
+    return [row[0] for row in rows if row[0] != 'ok']
+
+# --- Atomic JSON Files ---
+# Small state files (OAuth token, upload sessions, caches, download sidecars) are
+# written to a temp file in the same directory, then renamed over the old one, so
+# a crash leaves either the old or the new version, never a truncated one. Each
+# file stores a SHA-256 of its payload; the previous good version is kept as
+# <path>.bak. Files written before this format (plain JSON) are still read.
+
+CHECKSUM_KEY = 'sha256'
+DATA_KEY = 'data'
+
+# Results of reading a store, see load_json()
+OK = 'ok'
+MISSING = 'missing'
+RESTORED = 'restored'          # Corrupt; the .bak copy was put back
+QUARANTINED = 'quarantined'    # Corrupt without a usable backup; moved aside as <path>.corrupt-<time>
+UNREADABLE = 'unreadable'      # Couldn't be read (or moved aside); left where it is
+
+_PENDING_SYNC = {}             # path -> time its fsync was deferred
+_SYNC_LOCK = threading.Lock()
+_WRITE_LOCKS = {}
+
+
+class CorruptStateError(ValueError):
+    """A state file that can't be parsed or fails its checksum."""
+
+
+def _digest(data):
+    canonical = json.dumps(data, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def _decode(raw):
+    try:
+        document = json.loads(raw)
+    except ValueError as e:
+        raise CorruptStateError(f"not valid JSON ({e})") from e
+    if isinstance(document, dict) and set(document) == {CHECKSUM_KEY, DATA_KEY}:
+        if _digest(document[DATA_KEY]) != document[CHECKSUM_KEY]:
+            raise CorruptStateError("checksum mismatch")
+        return document[DATA_KEY]
+    return document  # Plain JSON from before checksums (or written by another tool)
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return _decode(f.read())
+
+def _fsync_path(path):
+    """fsyncs a file, or a directory (so a rename in it is durable)."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass  # e.g. directories on Windows
+    finally:
+        os.close(fd)
+
+def _write_lock(path):
+    with _SYNC_LOCK:
+        return _WRITE_LOCKS.setdefault(os.path.abspath(path), threading.Lock())
+
+def write_json(path, data, durable=True, backup=True):
+    """
+    Atomically replaces `path` with `data` (checksummed). With durable=False the
+    fsyncs are batched (flush_pending) instead of paid on every write; with
+    backup=True the replaced version is kept as <path>.bak first.
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    payload = json.dumps({CHECKSUM_KEY: _digest(data), DATA_KEY: data}).encode('utf-8')
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with _write_lock(path):
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(payload)
+                if durable:
+                    f.flush()
+                    os.fsync(f.fileno())
+            if backup and os.path.exists(path):
+                _keep_backup(path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    if durable:
+        _fsync_path(directory)
+    else:
+        _defer_sync(path)
+
+def _keep_backup(path):
+    """Keeps the current version as <path>.bak, unless it is corrupt (the old backup is better then)."""
+    try:
+        _read(path)
+    except (OSError, CorruptStateError):
+        return
+    backup_path = path + '.bak'
+    tmp_backup = f"{backup_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        # A hard link costs no copy; the rename makes the new backup appear atomically
+        os.link(path, tmp_backup)
+    except OSError:
+        shutil.copy2(path, tmp_backup)
+    os.replace(tmp_backup, backup_path)
+
+def _defer_sync(path):
+    now = time.monotonic()
+    with _SYNC_LOCK:
+        _PENDING_SYNC.setdefault(path, now)
+        due = len(_PENDING_SYNC) >= FSYNC_BATCH_SIZE or now - min(_PENDING_SYNC.values()) >= FSYNC_BATCH_SECONDS
+    if due:
+        flush_pending()
+
+def flush_pending():
+    """fsyncs every file written with durable=False, then each of their directories once."""
+    with _SYNC_LOCK:
+        paths = list(_PENDING_SYNC)
+        _PENDING_SYNC.clear()
+    for path in paths:
+        _fsync_path(path)
+    for directory in {os.path.dirname(path) or '.' for path in paths}:
+        _fsync_path(directory)
+
+atexit.register(flush_pending)
+
+def load_json(path, default=None):
+    """
+    Reads a store written by write_json and returns (data, status). A corrupt
+    file is repaired from its .bak copy when there is a valid one, otherwise it
+    is moved aside (never silently overwritten) and `default` is returned. A
+    file that can't be read at all is left in place (status UNREADABLE).
+    """
+    try:
+        return _read(path), OK
+    except FileNotFoundError:
+        return default, MISSING
+    except CorruptStateError as e:
+        error = e
+    except OSError as e:
+        # Permissions, a directory in its place, I/O errors: not corruption, so leave the file alone
+        log_message("ERROR", f"Could not read {path} ({e}). Leaving it as it is.")
+        return default, UNREADABLE
+
+    try:
+        data = _read(path + '.bak')
+    except (OSError, CorruptStateError):
+        quarantined = f"{path}.corrupt-{time.strftime('%Y%m%d-%H%M%S')}"
+        try:
+            os.replace(path, quarantined)
+        except OSError as e:
+            log_message("ERROR", f"{path} is corrupt ({error}) and has no usable backup, and moving it aside failed ({e}).")
+            return default, UNREADABLE
+        log_message("ERROR", f"{path} is corrupt ({error}) and has no usable backup. Moved it to {quarantined}.")
+        return default, QUARANTINED
+    write_json(path, data, backup=False)
+    log_message("WARN", f"{path} was corrupt ({error}). Restored the previous version from {path}.bak.")
+    return data, RESTORED
+
+def read_json(path, default=None):
+    """The data of a store (see load_json), or `default` when it's missing or unrecoverable."""
+    return load_json(path, default)[0]
+
+def remove_stale_temp_files(directory, max_age=STALE_TEMP_SECONDS):
+    """Deletes temp files left by interrupted writes (write_json, segment cache renders). Returns their paths."""
+    removed = []
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return removed
+    cutoff = time.time() - max_age
+    for entry in entries:
+        is_temp = entry.name.endswith('.tmp') or '.tmp.' in entry.name
+        if is_temp and entry.is_file() and entry.stat().st_mtime < cutoff:
+            os.remove(entry.path)
+            removed.append(entry.path)
+    return removed
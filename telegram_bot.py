@@ -8,43 +8,100 @@ import os
 BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
 
-def run_bot(background=False):
-    application = Application.builder().token(BOT_TOKEN).build()
+# The automation passes a controller (see main.BotController) with pause(),
+# resume(), is_paused(), status_text(), upload_now() and log_path(). Without
+# one (standalone run_bot) the commands only reply. /upload, /status, /pause
+# and /resume take an optional channel name (e.g. "/pause facts").
+
+def build_application(token=None, controller=None):
+    application = Application.builder().token(token or BOT_TOKEN).build()
+    application.bot_data['controller'] = controller
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("upload", manual_upload))
     application.add_handler(CommandHandler("status", status))
     application.add_handler(CommandHandler("pause", pause))
     application.add_handler(CommandHandler("resume", resume))
     application.add_handler(CommandHandler("logs", send_logs))
+    return application
+
+def run_bot(background=False):
+    application = build_application()
     if background:
         thread = threading.Thread(target=application.run_polling)
         thread.start()
     else:
         application.run_polling()
 
+async def start_bot(controller, token=None):
+    """Starts polling on the running event loop, sharing state with the scheduler through `controller`."""
+    application = build_application(token, controller)
+    await application.initialize()
+    await application.start()
+    await application.updater.start_polling()
+    return application
+
+async def stop_bot(application):
+    await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+
+def _controller(context):
+    return context.application.bot_data.get('controller')
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("Welcome to Fact Shorts Bot! Use /upload, /status, /pause, /resume, /logs.")
 
 async def manual_upload(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    # TODO: Trigger upload manually
+    controller = _controller(context)
+    if controller:
+        controller.upload_now(*context.args[:1])
     await update.message.reply_text("Manual upload started.")
 
+def _standalone_status():
+    """Status read straight from the ledger and job table (standalone run_bot, no automation in this process)."""
+    from datetime import datetime
+    from dotenv import dotenv_values
+    import jobs
+    from planner import scheduled_per_day
+
+    env = dotenv_values(".env")
+    today = datetime.now().date()
+    counts = jobs.state_counts(env)
+    return '\n'.join([
+        f"Uploads today: {scheduled_per_day(env, today).get(today.isoformat(), 0)}/{env.get('MAX_DAILY', '?')}",
+        f"Ready to upload: {counts.get(jobs.METADATA_READY, 0)}",
+        f"Waiting to encode: {counts.get(jobs.DOWNLOADED, 0)}",
+        f"Failed: {counts.get(jobs.FAILED, 0)}",
+    ])
+
 async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    # TODO: Show today's upload stats
-    await update.message.reply_text("Uploads today: ?/3")
+    controller = _controller(context)
+    await update.message.reply_text(controller.status_text(*context.args[:1]) if controller else _standalone_status())
 
 async def pause(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    # TODO: Set pause flag
+    controller = _controller(context)
+    if controller:
+        controller.pause(*context.args[:1])
     await update.message.reply_text("Automation paused.")
 
 async def resume(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    # TODO: Unset pause flag
+    controller = _controller(context)
+    if controller:
+        controller.resume(*context.args[:1])
     await update.message.reply_text("Automation resumed.")
 
 async def send_logs(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    # TODO: Send log file
+    controller = _controller(context)
+    log_path = controller.log_path() if controller else None
+    if not log_path or not os.path.exists(log_path):
+        await update.message.reply_text("No log file for today yet.")
+        return
+    with open(log_path, 'rb') as f:
+        await update.message.reply_document(document=f, filename=os.path.basename(log_path))
     await update.message.reply_text("Log file sent.")
 
-def send_daily_status():
-    # TODO: Send daily status via Telegram
-    pass
+async def send_daily_status(application):
+    """Sends the controller's status summary to TELEGRAM_CHAT_ID."""
+    controller = application.bot_data.get('controller')
+    if controller and CHAT_ID:
+        await application.bot.send_message(chat_id=CHAT_ID, text=controller.status_text())
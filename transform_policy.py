@@ -0,0 +1,75 @@
+# --- Transform Policy ---
+# Picks the cheapest edit that still makes the reel unique (the centered ~95%
+# crop). Set TRANSFORM_POLICY=full to always re-encode everything as before.
+#
+#   remux       no re-encode: both streams are copied and the crop is written into
+#               the H.264 headers (SPS frame cropping), which every decoder applies
+#   copy_audio  only the video is re-encoded (crop filter); AAC audio is copied
+#   full        decode and re-encode everything (intro/outro, odd sources)
+
+REMUX = 'remux'
+COPY_AUDIO = 'copy_audio'
+FULL = 'full'
+
+DEFAULT_POLICY = 'auto'               # TRANSFORM_POLICY: auto | full
+DEFAULT_SHORTS_MAX_SECONDS = 180      # SHORTS_MAX_SECONDS: longest clip YouTube treats as a Short
+DEFAULT_SHORTS_MAX_ASPECT = 1.0       # Width/height; Shorts are vertical or square
+REMUX_VIDEO_CODECS = ('h264',)
+REMUX_PIXEL_FORMATS = ('yuv420p', 'yuvj420p')
+COPY_AUDIO_CODECS = ('aac',)
+
+
+def meets_shorts_constraints(info, env):
+    """True if the clip is already vertical/square and short enough for Shorts."""
+    max_seconds = float(env.get('SHORTS_MAX_SECONDS') or DEFAULT_SHORTS_MAX_SECONDS)
+    return info['width'] / info['height'] <= DEFAULT_SHORTS_MAX_ASPECT and info['duration'] <= max_seconds
+
+def sps_crop(info, crop_box):
+    """
+    The crop_left/right/top/bottom values (in pixels, relative to the coded
+    frame) that make the H.264 decoder show `crop_box`, or None when the crop
+    can't be expressed in the headers. 4:2:0 frame cropping works in steps of
+    two pixels, so the box is rounded to even numbers (at most 1px off).
+    """
+    width, height = info['width'], info['height']
+    if width % 2 or height % 2:
+        return None
+    x, y, crop_width, crop_height = crop_box
+    left, top = x - x % 2, y - y % 2
+    right = width - left - (crop_width - crop_width % 2)
+    bottom = height - top - (crop_height - crop_height % 2)
+    # Frames are coded in whole 16x16 macroblocks (progressive only, see
+    # choose_transform); the encoder's own crop of that padding is replaced, so
+    # it is added back. ffprobe's coded_width can't be used: without decoding a
+    # frame it equals width (a 1080 wide reel is coded 1088 wide).
+    right += -width % 16
+    bottom += -height % 16
+    if min(left, top, right, bottom) < 0 or (left | top | right | bottom) % 2:
+        return None
+    return {"crop_left": left, "crop_right": right, "crop_top": top, "crop_bottom": bottom}
+
+def choose_transform(info, crop_box, env, has_bumpers, engine):
+    """Returns (transform, reason) for one source clip, given its editor.probe_video() info."""
+    policy = (env.get('TRANSFORM_POLICY') or DEFAULT_POLICY).strip().lower()
+    if policy == FULL:
+        return FULL, "TRANSFORM_POLICY=full"
+    if has_bumpers:
+        # Intro/outro need a re-encoded main clip (the segment cache still keeps them cheap)
+        return FULL, "intro/outro"
+
+    audio_ok = not info['has_audio'] or info.get('audio_codec') in COPY_AUDIO_CODECS
+    video_ok = (
+        info.get('video_codec') in REMUX_VIDEO_CODECS
+        and info.get('pix_fmt') in REMUX_PIXEL_FORMATS
+        and info.get('field_order') in (None, 'progressive')
+        and not info.get('rotation')
+    )
+    if not meets_shorts_constraints(info, env):
+        video_ok = False
+    if video_ok and sps_crop(info, crop_box) is None:
+        video_ok = False
+    if video_ok and audio_ok:
+        return REMUX, f"{info['video_codec']}/{info['pix_fmt']} {info['width']}x{info['height']}, {info['duration']:.0f}s"
+    if engine == 'ffmpeg' and audio_ok and info['has_audio']:
+        return COPY_AUDIO, f"video {info.get('video_codec')}/{info.get('pix_fmt')} needs re-encoding, {info['audio_codec']} audio kept"
+    return FULL, f"video {info.get('video_codec')}/{info.get('pix_fmt')}, audio {info.get('audio_codec')}"
@@ -1,28 +1,54 @@
 import os
 import json
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
-from google.oauth2.credentials import Credentials
+import time
+import random
+import threading
+from datetime import datetime, timedelta
 from utils import log_message
+from storage import read_json, write_json
+import quota
+import metrics
 
 # The SCOPES required for YouTube Data API v3 upload
 SCOPES = ['https://www.googleapis.com/auth/youtube.upload']
 API_SERVICE_NAME = 'youtube'
 API_VERSION = 'v3'
 
-def get_authenticated_service(env):
-    """Authenticates (using modified fixed-port loopback flow) and returns the YouTube API service."""
+# --- Upload Defaults (override in .env) ---
+DEFAULT_BACKEND = 'api'                             # YOUTUBE_BACKEND: api | fake (local upload endpoint, see fake_backends.py)
+DEFAULT_TOKEN_PATH = 'token.json'                   # YT_TOKEN_PATH
+DEFAULT_UPLOAD_SESSIONS_PATH = os.path.join('cache', 'upload_sessions.json')  # UPLOAD_SESSIONS_PATH
+DEFAULT_CHUNK_MB = 8                                # UPLOAD_CHUNK_MB (rounded to a multiple of 256 KiB)
+DEFAULT_CHUNK_RETRIES = 5                           # UPLOAD_CHUNK_RETRIES
+DEFAULT_RATE_LIMIT_BACKOFF = 30                     # UPLOAD_RATE_LIMIT_BACKOFF: first wait (seconds) after a rate-limit answer
+DEFAULT_RATE_LIMIT_RETRIES = 4                      # UPLOAD_RATE_LIMIT_RETRIES
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)         # Refresh tokens this long before they expire
+RETRIABLE_STATUS_CODES = (500, 502, 503, 504)
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded', 'uploadRateLimitExceeded')
+QUOTA_REASONS = ('quotaExceeded', 'dailyLimitExceeded')
+CHUNK_ALIGNMENT = 256 * 1024
+
+# Credentials are shared by every thread; the discovery client (httplib2) is not
+# thread-safe, so each thread builds its own once and keeps it.
+_CREDENTIALS = {}
+_CREDENTIALS_LOCK = threading.RLock()
+_THREAD_LOCAL = threading.local()
+_SESSIONS_LOCK = threading.Lock()
+
+# --- Authentication and Service Holder ---
+
+def _load_credentials(env, token_path):
+    """Authenticates (using modified fixed-port loopback flow) and returns valid credentials."""
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from google.oauth2.credentials import Credentials
+
     credentials = None
-    token_path = 'token.json'
     
-    # 1. Check for existing token file
+    # 1. Check for existing token file (a corrupt one is restored from token.json.bak)
     if os.path.exists(token_path):
-        log_message("INFO", "Loading credentials from token.json.")
+        log_message("INFO", f"Loading credentials from {token_path}.")
         try:
-            with open(token_path, 'r') as token:
-                creds_data = json.load(token)
+            creds_data = read_json(token_path)
             credentials = Credentials.from_authorized_user_info(creds_data, SCOPES)
         except Exception as e:
             log_message("WARN", f"Error loading existing token. Forcing re-auth. {e}")
@@ -32,7 +58,7 @@ def get_authenticated_service(env):
     if not credentials or not credentials.valid:
         if credentials and credentials.expired and credentials.refresh_token:
             log_message("INFO", "Token expired. Attempting refresh.")
-            credentials.refresh(Request())
+            _refresh_credentials(credentials, token_path)
         else:
             # Reverting to the Fixed Port Loopback with manual browser opening.
             log_message("WARN", "Running FIXED-PORT loopback authentication (Manual Browser Open).")
@@ -49,15 +75,189 @@ def get_authenticated_service(env):
             )
             
             # Save the credentials for the next run
-            with open(token_path, 'w') as token:
-                token.write(credentials.to_json())
-            log_message("SUCCESS", "Authentication successful! token.json saved.")
+            write_json(token_path, json.loads(credentials.to_json()))
+            log_message("SUCCESS", f"Authentication successful! {token_path} saved.")
+
+    return credentials
+
+def _refresh_credentials(credentials, token_path):
+    """Refreshes the access token and persists it so the next run starts with a fresh one."""
+    from google.auth.transport.requests import Request
+
+    credentials.refresh(Request())
+    # Atomic: a crash mid-write must not cost the refresh token
+    write_json(token_path, json.loads(credentials.to_json()))
+
+def get_credentials(env):
+    """
+    Returns the long-lived credentials for this channel, loading them once per
+    process and refreshing them ahead of expiry (TOKEN_REFRESH_MARGIN).
+    """
+    token_path = env.get('YT_TOKEN_PATH') or DEFAULT_TOKEN_PATH
+    with _CREDENTIALS_LOCK:
+        credentials = _CREDENTIALS.get(token_path)
+        if credentials is None:
+            credentials = _load_credentials(env, token_path)
+            _CREDENTIALS[token_path] = credentials
+        # Credentials.expiry is a naive UTC datetime
+        expires_soon = credentials.expiry and credentials.expiry - datetime.utcnow() < TOKEN_REFRESH_MARGIN
+        if credentials.refresh_token and (expires_soon or not credentials.valid):
+            log_message("INFO", "Access token expires soon. Refreshing ahead of time.")
+            _refresh_credentials(credentials, token_path)
+        return credentials
+
+def get_authenticated_service(env):
+    """Returns this thread's YouTube API service, built once and reused across uploads."""
+    endpoint = env.get('YOUTUBE_API_ENDPOINT')  # e.g. a local stand-in for testing
+    if (env.get('YOUTUBE_BACKEND') or DEFAULT_BACKEND).strip().lower() == 'fake':
+        from fake_backends import FakeYouTubeService
+        return FakeYouTubeService(endpoint)
+
+    from googleapiclient.discovery import build
+
+    credentials = get_credentials(env)
+    services = getattr(_THREAD_LOCAL, 'services', None)
+    if services is None:
+        services = _THREAD_LOCAL.services = {}
+
+    key = (id(credentials), endpoint)
+    if key not in services:
+        client_options = {"api_endpoint": endpoint} if endpoint else None
+        services[key] = build(
+            API_SERVICE_NAME, API_VERSION, credentials=credentials,
+            client_options=client_options, cache_discovery=False,
+        )
+    return services[key]
 
-    return build(API_SERVICE_NAME, API_VERSION, credentials=credentials)
 
+# --- Resumable Upload Sessions ---
+# The upload URI of an unfinished upload is persisted, so a later attempt (even
+# after a restart) continues from the last byte the server committed.
+
+def _sessions_path(env):
+    return env.get('UPLOAD_SESSIONS_PATH') or DEFAULT_UPLOAD_SESSIONS_PATH
+
+def _load_sessions(env):
+    return read_json(_sessions_path(env), {})
+
+def _update_session(env, video_path, resumable_uri):
+    """Stores (or with resumable_uri=None, forgets) the upload session for a file."""
+    with _SESSIONS_LOCK:
+        sessions = _load_sessions(env)
+        key = os.path.abspath(video_path)
+        if resumable_uri:
+            sessions[key] = {"uri": resumable_uri, "updated_at": datetime.now().isoformat()}
+        elif key in sessions:
+            del sessions[key]
+        else:
+            return
+        write_json(_sessions_path(env), sessions)
+
+def _chunk_size(env):
+    chunk = int(float(env.get('UPLOAD_CHUNK_MB') or DEFAULT_CHUNK_MB) * 1024 * 1024)
+    return max(CHUNK_ALIGNMENT, chunk - chunk % CHUNK_ALIGNMENT)
+
+def _log_progress(video_path):
+    """Default progress callback: logs every 25%."""
+    state = {"next": 25}
+    def callback(sent, total):
+        percent = int(sent * 100 / total) if total else 100
+        if percent >= state["next"]:
+            log_message("INFO", f"Upload progress for {os.path.basename(video_path)}: {percent}% ({sent}/{total} bytes)")
+            state["next"] = (percent // 25 + 1) * 25
+    return callback
+
+def _error_reason(e):
+    """The first error reason of an API error (e.g. 'quotaExceeded'), or None."""
+    try:
+        return json.loads(e.content)['error']['errors'][0]['reason']
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None
+
+def _run_resumable_upload(request, video_path, env, progress_callback):
+    """Sends the file chunk by chunk, retrying transient failures from the last committed byte."""
+    from googleapiclient.errors import HttpError
+
+    max_retries = int(env.get('UPLOAD_CHUNK_RETRIES') or DEFAULT_CHUNK_RETRIES)
+    rate_limit_retries = int(env.get('UPLOAD_RATE_LIMIT_RETRIES') or DEFAULT_RATE_LIMIT_RETRIES)
+    rate_limit_backoff = float(env.get('UPLOAD_RATE_LIMIT_BACKOFF') or DEFAULT_RATE_LIMIT_BACKOFF)
+    total = os.path.getsize(video_path)
+    retries = rate_limited = 0
+    response = None
+    # Bytes the server had committed at the last progress report: 0 for a fresh
+    # upload. A resumed one learns its offset inside the first next_chunk(), so
+    # its first report only sets the starting point.
+    sent = None if request._in_error_state else request.resumable_progress
+    while response is None:
+        try:
+            # num_retries covers socket-level errors on a single chunk request
+            status, response = request.next_chunk(num_retries=2)
+            if request.resumable_uri:
+                _update_session(env, video_path, request.resumable_uri)
+            if status:
+                if sent is not None:
+                    metrics.BYTES.inc(max(0, status.resumable_progress - sent), direction='uploaded')
+                sent = status.resumable_progress
+                progress_callback(status.resumable_progress, total)
+            retries = 0
+        except HttpError as e:
+            reason = _error_reason(e)
+            if reason in QUOTA_REASONS:
+                quota.mark_exhausted(env)
+                raise
+            if (e.resp.status == 429 or reason in RATE_LIMIT_REASONS) and rate_limited < rate_limit_retries:
+                # Rate limits clear up in minutes, not seconds: longer, jittered waits
+                delay = rate_limit_backoff * (2 ** rate_limited) * random.uniform(0.5, 1.5)
+                rate_limited += 1
+                metrics.RETRIES.inc(stage='upload', reason='rate_limited')
+                log_message("WARN", f"Upload rate-limited ({reason or e.resp.status}). Retry {rate_limited}/{rate_limit_retries} in {delay:.0f}s.")
+                time.sleep(delay)
+                continue
+            if e.resp.status in (404, 410) and retries < max_retries:
+                # The stored upload session expired; start over with a new one
+                log_message("WARN", f"Upload session for {os.path.basename(video_path)} expired. Restarting upload.")
+                _update_session(env, video_path, None)
+                request.resumable_uri = None
+                request.resumable_progress = sent = 0
+                request._in_error_state = False
+                quota.charge('videos.insert', env)
+                metrics.RETRIES.inc(stage='upload', reason='session_expired')
+                retries += 1
+                continue
+            if e.resp.status not in RETRIABLE_STATUS_CODES or retries >= max_retries:
+                raise
+            # googleapiclient marks the request as errored and asks the server for
+            # the committed range on the next call, so the upload resumes from there
+            retries += 1
+            metrics.RETRIES.inc(stage='upload', reason='server_error')
+            delay = min(60, 2 ** retries) * random.uniform(0.5, 1.5)
+            log_message("WARN", f"Upload chunk failed ({e.resp.status}). Retry {retries}/{max_retries} in {delay:.1f}s.")
+            time.sleep(delay)
+
+    # The last chunk, which is answered with the response instead of a progress report
+    metrics.BYTES.inc(max(0, total - (sent or 0)), direction='uploaded')
+    progress_callback(total, total)
+    _update_session(env, video_path, None)
+    return response
+
+
+def upload_video(video_path, metadata, scheduled_time, env, progress_callback=None):
+    """Uploads a video to YouTube and returns the video URL (None on failure or when out of quota)."""
+    with metrics.STAGE_SECONDS.time(stage='upload'):
+        video_url = _upload_video(video_path, metadata, scheduled_time, env, progress_callback)
+    metrics.ITEMS.inc(stage='upload', outcome='ok' if video_url else 'failed')
+    return video_url
+
+def _upload_video(video_path, metadata, scheduled_time, env, progress_callback):
+    from googleapiclient.http import MediaFileUpload
+
+    saved = _load_sessions(env).get(os.path.abspath(video_path))
+    # Continuing a started upload needs no new insert call; a new one does
+    if not saved and not quota.can_afford('videos.insert', env):
+        report = quota.usage_report(env)
+        log_message("WARN", f"Not enough YouTube API quota for an upload ({report['used']}/{report['limit']} units used today).")
+        return None
 
-def upload_video(video_path, metadata, scheduled_time, env):
-    """Uploads a video to YouTube and returns the video URL."""
     log_message("INFO", "Authenticating YouTube service...")
     youtube = get_authenticated_service(env)
     
@@ -79,16 +279,27 @@ def upload_video(video_path, metadata, scheduled_time, env):
         }
     }
 
-    # Upload the video file
+    # Upload the video file (resumable, in UPLOAD_CHUNK_MB chunks)
     try:
-        media_file = MediaFileUpload(video_path)
+        media_file = MediaFileUpload(video_path, chunksize=_chunk_size(env), resumable=True)
         log_message("INFO", f"Starting upload for: {os.path.basename(video_path)}")
         
-        response = youtube.videos().insert(
+        request = youtube.videos().insert(
             part=','.join(body.keys()),
             body=body,
             media_body=media_file
-        ).execute()
+        )
+
+        if saved:
+            # No public API for this: point the request at the existing session and
+            # flag it so the first next_chunk() asks the server how much it already has.
+            log_message("INFO", f"Resuming previous upload session for {os.path.basename(video_path)}.")
+            request.resumable_uri = saved['uri']
+            request._in_error_state = True
+        else:
+            quota.charge('videos.insert', env)
+
+        response = _run_resumable_upload(request, video_path, env, progress_callback or _log_progress(video_path))
 
         video_id = response.get('id')
         video_url = f"https://youtu.be/{video_id}"
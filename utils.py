@@ -1,13 +1,19 @@
 import os
 import json
+import time
+import queue
+import atexit
 import logging
+import threading
 from datetime import datetime
 from dotenv import dotenv_values
-from telegram import Bot
 
 # --- Configuration Constants ---
 LOG_DIR = 'logs'
 UPLOAD_TRACKER = 'uploaded.json'
+DEFAULT_LOG_MAX_MB = 50       # LOG_MAX_MB: a day's log rolls over to <day>.1.log, <day>.2.log, ...
+LOG_BATCH_SECONDS = 0.2       # How long the log writer collects lines before one write
+LOG_BATCH_MAX_LINES = 1000
 
 # --- Environment and Directory Setup ---
 
@@ -33,29 +39,157 @@ def init_dirs(env):
     os.makedirs(env['LOG_DIR'], exist_ok=True)
     print("Directories initialized: downloads/, processed/, logs/")
 
-# --- Data Storage (uploaded.json) ---
+# --- Data Storage (upload ledger) ---
+# uploaded.json is migrated once into the SQLite ledger (see ledger.py);
+# these two helpers are kept as thin shims over it.
 
 def load_uploaded():
-    """Loads the upload tracking data from uploaded.json."""
-    if not os.path.exists(UPLOAD_TRACKER):
-        return {}
-    try:
-        with open(UPLOAD_TRACKER, 'r') as f:
-            return json.load(f)
-    except (json.JSONDecodeError, IOError) as e:
-        print(f"WARN: Could not read {UPLOAD_TRACKER}. Initializing new tracker. Error: {e}")
-        return {}
+    """Loads the upload tracking data from the ledger as a dict."""
+    import ledger
+    return ledger.all_uploads()
 
 def save_uploaded(data):
-    """Saves the upload tracking data to uploaded.json."""
+    """Saves the upload tracking data to the ledger (upserts every entry in one transaction)."""
+    import ledger
     try:
-        with open(UPLOAD_TRACKER, 'w') as f:
-            json.dump(data, f, indent=4)
-    except IOError as e:
-        print(f"ERROR: Failed to save data to {UPLOAD_TRACKER}. Error: {e}")
+        ledger.record_uploads(data)
+    except Exception as e:
+        print(f"ERROR: Failed to save data to the upload ledger. Error: {e}")
 
 # --- Logging and Notifications ---
 
+# Lines are queued and written by one background thread per process, which
+# batches them, keeps the log files open and rotates them by day and size.
+_LOG_SETTINGS = None
+_LOG_QUEUE = None
+_LOG_WRITER = None
+_LOG_PID = None
+_LOG_LOCK = threading.Lock()
+
+def _log_settings(env):
+    """Returns the logging settings, reading .env only once when no env is passed."""
+    global _LOG_SETTINGS
+    if not env:
+        if _LOG_SETTINGS is None:
+            # Load env if not provided (for standalone testing or early calls)
+            _LOG_SETTINGS = _log_settings(dotenv_values(".env") or {'LOG_DIR': LOG_DIR})
+        return _LOG_SETTINGS
+    return {
+        "dir": env.get('LOG_DIR') or LOG_DIR,
+        "max_bytes": int(float(env.get('LOG_MAX_MB') or DEFAULT_LOG_MAX_MB) * 1024 * 1024),
+        "json": str(env.get('LOG_FORMAT', 'text')).strip().lower() == 'json',
+    }
+
+def _ensure_log_writer():
+    """Starts the writer thread (again, after a fork) and returns the log queue."""
+    global _LOG_QUEUE, _LOG_WRITER, _LOG_PID
+    if _LOG_PID != os.getpid() or _LOG_WRITER is None:
+        with _LOG_LOCK:
+            if _LOG_PID != os.getpid() or _LOG_WRITER is None:
+                _LOG_QUEUE = queue.Queue()
+                _LOG_WRITER = threading.Thread(target=_log_writer_loop, args=(_LOG_QUEUE,), name='log-writer', daemon=True)
+                _LOG_WRITER.start()
+                _LOG_PID = os.getpid()
+    return _LOG_QUEUE
+
+class _LogFile:
+    """An open daily log file that rolls over by day and by size."""
+
+    def __init__(self, log_dir, extension, max_bytes):
+        self.log_dir = log_dir
+        self.extension = extension
+        self.max_bytes = max_bytes
+        self.day = None
+        self.part = 0
+        self.handle = None
+
+    def _path(self):
+        suffix = f".{self.part}" if self.part else ""
+        return os.path.join(self.log_dir, f"{self.day}{suffix}{self.extension}")
+
+    def latest_path(self, day):
+        """The newest existing part of `day`'s log (the one being written), or its first part."""
+        self.day, self.part = day, 0
+        while os.path.exists(os.path.join(self.log_dir, f"{day}.{self.part + 1}{self.extension}")):
+            self.part += 1
+        return self._path()
+
+    def _open(self):
+        if self.handle:
+            self.handle.close()
+        os.makedirs(self.log_dir, exist_ok=True)
+        # Skip parts that are already full (e.g. after a restart)
+        while os.path.exists(self._path()) and os.path.getsize(self._path()) >= self.max_bytes:
+            self.part += 1
+        self.handle = open(self._path(), 'a', encoding='utf-8')
+
+    def write(self, day, text):
+        if day != self.day:
+            self.day, self.part = day, 0
+            self._open()
+        elif self.handle.tell() >= self.max_bytes:
+            self.part += 1
+            self._open()
+        self.handle.write(text)
+        self.handle.flush()
+
+    def close(self):
+        if self.handle:
+            self.handle.close()
+            self.handle = None
+
+def _log_file(settings):
+    return _LogFile(settings['dir'], '.jsonl' if settings['json'] else '.log', settings['max_bytes'])
+
+def current_log_path(env=None):
+    """Path of today's log file as the writer names it (LOG_FORMAT extension, latest size part)."""
+    return _log_file(_log_settings(env)).latest_path(datetime.now().strftime("%Y-%m-%d"))
+
+def _log_writer_loop(log_queue):
+    """Background writer: collects queued records for LOG_BATCH_SECONDS and writes them in one go."""
+    files = {}
+    running = True
+    while running:
+        batch = [log_queue.get()]
+        deadline = time.monotonic() + LOG_BATCH_SECONDS
+        while batch[-1] is not None and len(batch) < LOG_BATCH_MAX_LINES:
+            try:
+                batch.append(log_queue.get(timeout=max(0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        if batch[-1] is None:
+            running = False
+            batch.pop()
+
+        grouped = {}
+        for settings, day, line in batch:
+            key = (settings['dir'], settings['json'])
+            if key not in files:
+                files[key] = _log_file(settings)
+            grouped.setdefault(key, []).append((day, line))
+        for key, lines in grouped.items():
+            try:
+                for day in sorted({day for day, _ in lines}):
+                    files[key].write(day, ''.join(line + '\n' for d, line in lines if d == day))
+            except IOError as e:
+                print(f"ERROR: Failed to write to log file. {e}")
+
+    for log_file in files.values():
+        log_file.close()
+
+def flush_logs(timeout=5):
+    """Writes out every queued log line and stops the writer (it restarts on the next log_message)."""
+    global _LOG_WRITER
+    with _LOG_LOCK:
+        writer, log_queue = _LOG_WRITER, _LOG_QUEUE
+        if writer is None or _LOG_PID != os.getpid():
+            return
+        _LOG_WRITER = None
+    log_queue.put(None)
+    writer.join(timeout)
+
+atexit.register(flush_logs)
+
 def log_message(level, message, env=None):
     """
     Generates a log message to the console and a daily log file.
@@ -63,27 +197,22 @@ def log_message(level, message, env=None):
     Args:
         level (str): Log level (e.g., 'INFO', 'WARN', 'ERROR', 'SUCCESS').
         message (str): The log message content.
-        env (dict, optional): The environment variables for LOG_DIR.
+        env (dict, optional): The environment variables for LOG_DIR
+            (plus LOG_MAX_MB and LOG_FORMAT=text|json).
     """
-    if not env:
-        # Load env if not provided (for standalone testing or early calls)
-        env = dotenv_values(".env")
-        env['LOG_DIR'] = env.get('LOG_DIR', LOG_DIR)
-        
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    settings = _log_settings(env)
+    now = datetime.now()
+    timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
     log_line = f"[{timestamp}] [{level.upper()}] {message}"
     
     print(log_line) # Print to console
     
-    # Write to daily log file
-    log_filename = datetime.now().strftime("%Y-%m-%d") + ".log"
-    log_path = os.path.join(env['LOG_DIR'], log_filename)
-    
-    try:
-        with open(log_path, 'a') as f:
-            f.write(log_line + '\n')
-    except IOError as e:
-        print(f"ERROR: Failed to write to log file. {e}")
+    # Queue for the daily log file (written by the background writer)
+    if settings['json']:
+        file_line = json.dumps({"ts": now.isoformat(), "level": level.upper(), "pid": os.getpid(), "message": str(message)})
+    else:
+        file_line = log_line
+    _ensure_log_writer().put((settings, now.strftime("%Y-%m-%d"), file_line))
 
 def send_telegram_notification(message, env):
     """Sends a notification message via the Telegram bot."""
@@ -92,6 +221,7 @@ def send_telegram_notification(message, env):
         return
 
     try:
+        from telegram import Bot
         bot = Bot(token=env['TELEGRAM_BOT_TOKEN'])
         bot.send_message(chat_id=env['TELEGRAM_CHAT_ID'], text=message)
         log_message("INFO", "Telegram notification sent.")
@@ -120,7 +250,7 @@ if __name__ == '__main__':
         }
     }
     save_uploaded(test_data)
-    log_message("INFO", "Test data saved to uploaded.json.", ENV)
+    log_message("INFO", "Test data saved to the upload ledger.", ENV)
     
     loaded_data = load_uploaded()
     log_message("INFO", f"Test data loaded. Keys: {list(loaded_data.keys())}", ENV)
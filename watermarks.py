@@ -0,0 +1,43 @@
+from datetime import datetime
+from storage import state_db_path, transaction, query
+
+# --- Schema ---
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS watermarks (
+        account TEXT PRIMARY KEY,
+        last_pk INTEGER NOT NULL,
+        last_taken_at REAL NOT NULL,
+        updated_at TEXT NOT NULL
+    )""",
+)
+
+_READY = set()
+
+def _db(env=None):
+    path = state_db_path(env)
+    if path not in _READY:
+        with transaction(path) as conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+        _READY.add(path)
+    return path
+
+# --- Watermark API ---
+
+def get_watermark(account, env=None):
+    """Returns {'last_pk', 'last_taken_at'} for a source account, or None on its first fetch."""
+    rows = query(_db(env), "SELECT last_pk, last_taken_at FROM watermarks WHERE account = ?", (account.lower(),))
+    return dict(rows[0]) if rows else None
+
+def set_watermark(account, last_pk, last_taken_at, env=None):
+    """Stores the high-water mark for an account. It never moves backwards."""
+    with transaction(_db(env)) as conn:
+        conn.execute(
+            """INSERT INTO watermarks (account, last_pk, last_taken_at, updated_at) VALUES (?, ?, ?, ?)
+               ON CONFLICT(account) DO UPDATE SET
+                   last_pk = MAX(last_pk, excluded.last_pk),
+                   last_taken_at = MAX(last_taken_at, excluded.last_taken_at),
+                   updated_at = excluded.updated_at""",
+            (account.lower(), int(last_pk), float(last_taken_at), datetime.now().isoformat()),
+        )